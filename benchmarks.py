@@ -0,0 +1,191 @@
+'''
+ Withers -- Discord bot to parse PC build lists
+ Benchmarks for the scraping pipeline - not needed to run the bot.
+
+ Usage:
+    python ./benchmarks.py blocking <site> <list url>
+        Loads the list twice in a fresh browser, without and with the site's block profile, and reports the requests and bytes saved.
+        <site> is a site module name, e.g. pcpp, geizhals, tweakers, bapcgg, meupc, hinta, pcpt
+    python ./benchmarks.py parser <site> <list url> <saved page> [runs]
+        Parses a saved list page (e.g. from "save page as" or page_source) the old way and with each available region parser,
+        reporting time and peak memory, and checks that every region comes out identical. The url is only used to work out the list's regions.
+    python ./benchmarks.py parse <site> <list url> <saved page> [runs]
+        Times building the soup and the site's parse() separately on a saved list page, and prints the parts it found.
+        Anything generateSoup would normally read with a script (custom part links, quantities) is left at its default.
+    python ./benchmarks.py money [parts] [runs]
+        Times reading, multiplying and totalling a list's worth of prices the old way (re.findall and float per part) and with the money module.
+'''
+
+import asyncio
+import importlib
+import re
+import sys
+import time
+import tracemalloc
+
+from skeleton import *
+import skeleton.money as money
+
+async def loadAndMeasure(module, driver, link):
+    '''
+    Loads a list with the site's own generateSoup and measures it
+    Inputs:
+        - module: site module
+        - driver: selenium webdriver object
+        - link: list url
+    Returns: (seconds, requests, bytes)
+    '''
+    #make sure the second load can't be served from the first one's cache
+    await soul.runBlocking(driver.execute_cdp_cmd, "Network.setCacheDisabled", {"cacheDisabled": True})
+    start = time.perf_counter()
+    await module.List(link).generateSoup(driver)
+    seconds = time.perf_counter() - start
+    requests, bytes = await soul.measurePage(driver)
+    return (seconds, requests, bytes)
+
+async def benchBlocking(site, link):
+    '''
+    Compares a list load with and without the site's block profile
+    Inputs:
+        - site: site module name
+        - link: list url
+    Returns: N/A, prints the results
+    '''
+    module = importlib.import_module("skeleton." + site)
+    driver = await module.startWebDriver()
+    try:
+        await soul.applyBlockProfile(driver, None)
+        full = await loadAndMeasure(module, driver, link)
+        await soul.getPage(driver, "about:blank")
+        await soul.applyBlockProfile(driver, module.blockProfile)
+        blocked = await loadAndMeasure(module, driver, link)
+    finally:
+        await soul.quitDriver(driver)
+
+    print("%-10s %10s %10s %12s" % ("", "seconds", "requests", "bytes"))
+    print("%-10s %10.2f %10d %12d" % ("full", full[0], full[1], full[2]))
+    print("%-10s %10.2f %10d %12d" % ("blocked", blocked[0], blocked[1], blocked[2]))
+    print("%-10s %10.2f %10d %12d" % ("saved", full[0] - blocked[0], full[1] - blocked[1], full[2] - blocked[2]))
+
+def regionHtml(soup, regions):
+    '''
+    Serializes every element matching the regions, for comparing parser output
+    Inputs:
+        - soup: BeautifulSoup object
+        - regions: list of region selectors
+    Returns: list of html strings
+    '''
+    return [str(tag) for region in regions for tag in soup.select(region)]
+
+async def benchParser(site, link, path, runs="20"):
+    '''
+    Compares whole-page html.parser soups against targeted region parsing on a saved page
+    Inputs:
+        - site: site module name
+        - link: list url
+        - path: saved page html file
+        - runs: number of timed parses per parser
+    Returns: N/A, prints the results
+    '''
+    module = importlib.import_module("skeleton." + site)
+    regions = module.List(link).regions
+    with open(path, encoding="utf-8") as file:
+        html = file.read()
+
+    #the old way - every module used to parse the whole page like this
+    variants = [("full html.parser", None, "html.parser", False), ("regions html.parser", regions, "html.parser", False)]
+    if soul.HTML_PARSER == "lxml":
+        variants.append(("regions lxml", regions, "lxml", False))
+    if soul.LexborHTMLParser is not None:
+        variants.append(("regions " + soul.HTML_PARSER + "+selectolax", regions, soul.HTML_PARSER, True))
+
+    expected = regionHtml(soul.parseRegions(html, None, "html.parser", False), regions)
+    print("%-32s %12s %12s %10s" % ("", "ms/parse", "peak KiB", "identical"))
+    for name, variantRegions, parser, selectolax in variants:
+        start = time.perf_counter()
+        for i in range(int(runs)):
+            soul.parseRegions(html, variantRegions, parser, selectolax)
+        milliseconds = (time.perf_counter() - start) * 1000 / int(runs)
+        tracemalloc.start()
+        soup = soul.parseRegions(html, variantRegions, parser, selectolax)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%-32s %12.2f %12d %10s" % (name, milliseconds, peak / 1024, regionHtml(soup, regions) == expected))
+
+async def benchParse(site, link, path, runs="20"):
+    '''
+    Times soup building and list parsing separately on a saved page
+    Inputs:
+        - site: site module name
+        - link: list url
+        - path: saved page html file
+        - runs: number of timed runs of each stage
+    Returns: N/A, prints the results
+    '''
+    module = importlib.import_module("skeleton." + site)
+    buildList = module.List(link)
+    with open(path, encoding="utf-8") as file:
+        html = file.read()
+
+    start = time.perf_counter()
+    for i in range(int(runs)):
+        buildList.soup = soul.parseRegions(html, buildList.regions)
+    soupMilliseconds = (time.perf_counter() - start) * 1000 / int(runs)
+
+    start = time.perf_counter()
+    for i in range(int(runs)):
+        result = await buildList.parse()
+    parseMilliseconds = (time.perf_counter() - start) * 1000 / int(runs)
+
+    print("%-10s %12s" % ("", "ms/run"))
+    print("%-10s %12.2f" % ("soup", soupMilliseconds))
+    print("%-10s %12.2f" % ("parse", parseMilliseconds))
+    print()
+    print("valid: " + str(result.valid) + ", " + str(len(result.parts)) + " part(s), totals: " + ", ".join(result.totals))
+    for part in result.parts:
+        print("  " + str(part.quantity) + "x " + part.category + " - " + part.name + " - " + str(part.unitPrice))
+
+#prices as the sites show them, in each site's locale
+MONEY_SAMPLES = [("$1,234.56", "en"), ("€ 1.234,56", "de"), ("1 234 kr", "en"), ("R$ 999.90", "en"), ("₹12,345", "en"), ("€ 89,99", "nl"), ("£74.99", "en")]
+
+def oldTotal(prices, quantities):
+    '''
+    Totals prices the way the site modules used to, for comparison - per-part regex and float maths, which breaks on thousands separators
+    '''
+    total = 0.00
+    for price, quantity in zip(prices, quantities):
+        unitPrice = re.findall("\\d+\\.\\d+", price.replace(",", "."))
+        if len(unitPrice) > 0:
+            total += quantity * float(unitPrice[0])
+    return "%.2f" % total
+
+async def benchMoney(parts="40", runs="2000"):
+    '''
+    Compares the old per-part price handling against money.parseAll and money.total
+    Inputs:
+        - parts: number of prices per list
+        - runs: number of lists to total
+    Returns: N/A, prints the results
+    '''
+    for text, locale in MONEY_SAMPLES:
+        prices = [text] * int(parts)
+        quantities = [(i % 3) + 1 for i in range(int(parts))]
+
+        start = time.perf_counter()
+        for i in range(int(runs)):
+            old = oldTotal(prices, quantities)
+        oldMicroseconds = (time.perf_counter() - start) * 1000000 / int(runs)
+
+        start = time.perf_counter()
+        for i in range(int(runs)):
+            new = money.total(money.parseAll(prices, locale), quantities)
+        newMicroseconds = (time.perf_counter() - start) * 1000000 / int(runs)
+
+        print("%-14s %10.1f us %10.1f us   old %-12s money %s" % (text, oldMicroseconds, newMicroseconds, old, ", ".join(str(price) for price in new)))
+
+if __name__ == '__main__':
+    benchmarks = {"blocking": benchBlocking, "parser": benchParser, "parse": benchParse, "money": benchMoney}
+    if (len(sys.argv) < 2) or (sys.argv[1] not in benchmarks.keys()):
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(benchmarks[sys.argv[1]](*sys.argv[2:]))
@@ -1,8 +1,15 @@
 import skeleton.soul as soul 
+import skeleton.links as links
+import skeleton.sites as sites
 import skeleton.pcpp as pcpp
 import skeleton.pcpt as pcpt
 import skeleton.geizhals as geizhals
 import skeleton.tweakers as tweakers
 import skeleton.bapcgg as bapcgg
 import skeleton.meupc as meupc
-import skeleton.hinta as hinta
\ No newline at end of file
+import skeleton.hinta as hinta
+import skeleton.workers as workers
+import skeleton.store as store
+import skeleton.cache as cache
+import skeleton.jobs as jobs
+import skeleton.shards as shards
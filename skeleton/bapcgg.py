@@ -9,53 +9,72 @@ from selenium_stealth import stealth
 #import undetected_chromedriver as uc
 from random import choice
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import datetime
 import re
 import asyncio
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+import skeleton.translations as translations
+
+#link formats - see sites.Site
+#komponentkoll.se is the swedish site, with its own domain
+LINK_PATTERNS = [("list", r"(?:buildapc\.gg/(?:(?P<country>[a-z]{2})/)?build|komponentkoll\.se/(?:bygg|build))/(?P<id>[A-Za-z0-9]{5})")]
+
+#readiness conditions - see soul.Ready
+#the build title only shows up once the part list has rendered, and never does for invalid builds
+LIST_READY = [soul.SelectorPresent("div.title-wrap h1")]
+#language of each regional site's categories, by the country code in the link - the rest are in english
+LANGUAGES = {"se": "sv", "dk": "da", "no": "no", "de": "de"}
+#number format of each regional site's prices, a key into money.LOCALES - the rest write english numbers
+LOCALES = {"se": "sv", "dk": "da", "no": "no", "de": "de"}
+#product links are revealed by script after each part's picture is clicked
+#this clicks all of them at once, waits until every part has a link or the page stops changing, and returns each part's product href (or null) in page order
+PRODUCTS_SCRIPT = """
+    var done = arguments[arguments.length - 1];
+    var deadline = performance.now() + arguments[0];
+    var rows = Array.prototype.slice.call(document.querySelectorAll('div.product-summary'));
+    var lastMutation = performance.now();
+    var observer = new MutationObserver(function() { lastMutation = performance.now(); });
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    rows.forEach(function(row) {
+        var picture = row.querySelector('picture');
+        if (picture !== null) { try { picture.click(); } catch (e) {} }
+    });
+    function productLink(row) {
+        var links = row.querySelectorAll('a');
+        for (var i = 0; i < links.length; i++) {
+            var href = links[i].getAttribute('href');
+            if ((href !== null) && (href.indexOf('produkt') >= 0)) { return href; }
+        }
+        return null;
+    }
+    function poll() {
+        var hrefs = rows.map(productLink);
+        var complete = hrefs.every(function(href) { return href !== null; });
+        //not every part has a product page, so a quiet page counts as done too
+        var quiet = (performance.now() - lastMutation) >= 300;
+        if (complete || quiet || (performance.now() >= deadline)) { observer.disconnect(); done(hrefs); } else { setTimeout(poll, 50); }
+    }
+    poll();
+"""
 
 class Msg(soul.BuildListMsg):
 
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
 
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds all BAPCGG build links in the message and adds them to the list of links
+        Finds all BAPCGG build list links in the message and adds them to the list of links
         Inputs: 
-            - driver: Selenium webdriver object
-            - text: the message or message segment to look for a link in - defaults to self.msgText
+            - scraper: scraper for this site - unused, as these links don't need a page load to resolve
         Returns: N/A
         '''
-        if text is None:
-            #replace swedish links here for easier parsing - we'll set them back when we add
-            text = self.msgText.replace("komponentkoll.se/", "buildapc.gg/se/").replace("/bygg/", "/build/")
-
-        # find substring of list link if it exists
-        try:
-            start = text.index("buildapc.gg/")
-        except Exception:
-            return
-        
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + 26):
-            try:
-                link += text[i] 
-            except Exception:
-                pass
-
-        if (" " not in link) and ("/build/" in link): #check for this as this site name is prone to being mentioned outside of a link
-            self.links.append(link.replace("buildapc.gg/se/", "komponentkoll.se/").replace("buildapc.gg/build/", "buildapc.gg/us/build/"))
+        for link in await self.scanLinks("bapcgg"):
+            self.links.append(link.url)
 
-        text = text.replace(link[8:], "")
-        await self.findLinks(driver, text) #recurse on the remaining links in the message
-        return
-    
     async def generateLists(self):
         '''
         Loops over every link found in the message and creates a new list object for it, returning them all
@@ -73,8 +92,14 @@ class List(soul.BuildList):
         super().__init__(link)
         if "komponentkoll.se" in link:
             self.siteSource = "KomponentKoll"
+            self.language = "sv"
+            self.locale = "sv"
         else:
             self.siteSource = "buildapc.gg"
+            self.language = LANGUAGES.get(link[20:22])
+            self.locale = LOCALES.get(link[20:22], "en")
+        self.productLinks = [] #product hrefs by part row, filled in by generateSoup
+        self.regions = ["div.title-wrap", "div.product-summary", "div.total"]
     
     async def generateSoup(self, driver):
         '''
@@ -85,60 +110,42 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
-        #wait a second for translation if needed
-        #only us and uk lists will default to english
-        if ("us" not in self.link) and ("uk" not in self.link):
-            await asyncio.sleep(1)
+        await soul.getPage(driver, self.link)
+        await soul.waitReady(driver, LIST_READY)
         
-        #open all parts to make product pages visible
-        #elements = driver.find_elements(By.CLASS_NAME, 'summary')
-        elements = driver.find_elements(By.TAG_NAME, 'picture')
-        for element in elements:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView();", element)
-                element.click()
-                await asyncio.sleep(0.25)
-            except Exception:
-                pass
-        await asyncio.sleep(2) #need to wait for the link load function to complete, otherwise we feed "Loading..." into soup
-
+        #open all parts to make product pages visible, and collect their links in the same round trip
+        try:
+            self.productLinks = await soul.runAsyncScript(driver, PRODUCTS_SCRIPT, 3, 3000)
+        except Exception as e:
+            print("Couldn't load buildapc.gg product links: " + str(e))
 
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+        self.soup = await soul.makeSoup(driver, self.regions)
 
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from BAPCGG build list into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the build title, part rows and total out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
-        #get title and country first
-        #title only exists in a valid list
-        try:
-            title = self.soup.find("div", class_="title-wrap").find("h1").get_text().strip()
-        except Exception:
-            return await self.badListEmbed(sender, message)
-        
         country = self.link[20:22]
         if country == "uk":
             country = "gb"
         #swedish links follow a different format
         if "komponentkoll.se/" in self.link:
             country = "se"
+        result = soul.ListResult(self.siteSource, self.link, country=country)
+
+        #title only exists in a valid list
+        try:
+            result.title = self.soup.find("div", class_="title-wrap").find("h1").get_text().strip()
+        except Exception:
+            result.valid = False
+            return result
 
         #get all part rows
         partRows = self.soup.find_all("div", class_="product-summary")
 
-        #structure output
-        #initialize giant string of output
-        componentList = ""
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
-
-        for partRow in partRows:
+        for rowIndex, partRow in enumerate(partRows):
             #get basic info about part
             partInfo = partRow.find("div", class_="info")
             partName = partInfo.find("h4").get_text().strip()
@@ -146,90 +153,62 @@ class List(soul.BuildList):
             if partName[-2] == 'x':
                 #we need to copy this string using an empty join because otherwise we slice by reference and soup wigs out for unknown reasons
                 partName = ''.join(partName[:-2])
-            partType = partInfo.find("h5").get_text().strip()
-
-            rowLinks = partRow.find_all("a")
-            partLink = ""
-            for linkTag in rowLinks:
-                if "produkt" in linkTag['href']:
-                    #country is annoyingly included in the link href
-                    if "komponentkoll.se" not in self.link:
-                        partLink = self.link[:(self.link.find("/build/")) - 3] + linkTag['href']
-                    else:
-                        partLink = self.link[:(self.link.find("/build/"))] + linkTag['href']
-            if len(partLink) > 1:
-                partName = "[" + partName + "](" + partLink + ")"
-
-            partCount = 1
+            partType = await translations.translate(partInfo.find("h5").get_text(), self.language)
+            part = soul.Part(partType, partName)
+
+            #product links were collected by generateSoup, in the same order as the rows
+            if (rowIndex < len(self.productLinks)) and (self.productLinks[rowIndex] is not None):
+                #country is annoyingly included in the link href
+                if "komponentkoll.se" not in self.link:
+                    part.url = self.link[:(self.link.find("/build/")) - 3] + self.productLinks[rowIndex]
+                else:
+                    part.url = self.link[:(self.link.find("/build/"))] + self.productLinks[rowIndex]
+
             try:
-                partCount = int(partRow.find("span", class_="count").get_text().replace("x", "").replace("\u200b","").strip())
-                if partCount > 1:
-                    partName = ("**("+ str(partCount) + "x)** " + partName)
+                part.quantity = int(partRow.find("span", class_="count").get_text().replace("x", "").replace("\u200b","").strip())
             except Exception:
                 pass
 
             try:
-                partPrice = partRow.find("div", class_="price").get_text().strip()
-
-                #translating from swedish screws up formatting - undo what it does
-                partPrice = partPrice.replace("SEK", "kr").replace(",","")
-
-                #move kr to front and set up float so we can do regex
-                if "kr" in partPrice:
-                    partPrice = ("kr " + partPrice.replace(" ", "").replace("kr", ".00"))
-
-                if partCount > 1:
-                    unitPrice = re.findall("\d+\.\d+", partPrice)
-                    totalPrice = partCount * (float(unitPrice[0]))
-                    partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-                
-                partPrice = ("``" + partPrice + "``")
+                #scandinavian prices can come as either "SEK" or "kr" - normalize to kr
+                part.unitPrice = partRow.find("div", class_="price").get_text().strip().replace("SEK", "kr")
             except Exception:
-                partPrice = "``N/A``"
-
-            #check to make sure we're not over the character limit
-            #do length check here
-            #length 4000 leaves room for the total in the 4096 character limit - Geizhals has minimal footer
-            if (not tooLong) and (len(componentList) > 4000):
-                tooLong = True
-            #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-            if tooLong:
-                overCount += 1
-                continue
-
-            #add the part to the string
-            componentList = componentList + "**" + partType + "**" + " - " + partPrice + " - " + partName + "\n"
+                pass
 
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
+            result.parts.append(part)
+        money.normalizeParts(result.parts, self.locale)
 
         #get total - there's no guaranteed position for this so we have to loop through
         totals = self.soup.find_all("div", class_="total")
-        total = "N/A"
+        total = None
         for row in totals:
             try:
                 total = row.find("span", class_="price").get_text().strip()
             except Exception:
                 pass
+        if total is not None:
+            result.totals.append(money.normalize(total.replace("SEK", "kr"), self.locale))
 
-        #format it to match other prices
-        total = total.replace("SEK", "kr").replace(",","")
-        if "kr" in total:
-            total = total.replace(" ", "").replace("kr", ".00")
-            total = "kr " + total
-            
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource + " :flag_" + country + ":\n" + self.link + "\n" + title + "\n"), description=("Sent by " + sender + "\n\n" + componentList), color=0x38aefc)
-        try:
-            embed.add_field(name="Total:", value=("``"+total+"``"), inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >96 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+        return result
+
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed BAPCGG build list into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return await self.badListEmbed(sender, message)
+
+        total = "N/A"
+        if len(result.totals) > 0:
+            total = result.totals[0]
+
+        title = self.siteSource + " :flag_" + result.country + ":\n" + self.link + "\n" + result.title + "\n"
+        return await soul.renderEmbed(title, 0x38aefc, sender, result.parts, [("Total:", "``" + total + "``")])
 
     async def badListEmbed(self, sender, message):
         '''
@@ -249,12 +228,26 @@ class List(soul.BuildList):
             
 
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code)
+    '''
+    country = groups["country"]
+    if (country == "se") or text.startswith("komponentkoll"):
+        return ("https://komponentkoll.se/build/" + groups["id"], "se")
+    #links without a country are the american site
+    if country is None:
+        country = "us"
+    return ("https://buildapc.gg/" + country + "/build/" + groups["id"], country)
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -262,19 +255,33 @@ async def startWebDriver():
     options = await soul.setDefaultDriverOptions(webdriver.ChromeOptions())
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     options.add_argument("--user-agent="+choice(useragents))
-    #for BAPCGG, we need to enable automatic translation from either swedish, danish or norwegian
-    #for some reason, translating this site breaks formatting horribly when we're faced with parts of quantity > 1 -- needs further investigation
-    
-    prefs = {
-        "translate_whitelists": {"da":"en", "sv":"en", "no":"en"},
-        "translate":{"enabled":"true"}
-    }
-    options.add_experimental_option("prefs", prefs)
-    
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    await soul.runBlocking(stealth, driver,
+        languages=["en-US", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
+
+    return driver
+
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
         languages=["en-US", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -283,4 +290,11 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+#keep images - we click each part's picture to reveal its product link, and a blocked picture has no size to click
+blockProfile = soul.BlockProfile(resourceTypes=["font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "buildapc.gg", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("bapcgg", Msg, LINK_PATTERNS, canonicalLink, ["buildapc.gg", "komponentkoll.se"], driverPool, cacheTtl=10 * 60))
@@ -0,0 +1,400 @@
+'''
+Withers Bot Cache
+Keeps recently parsed lists in memory, so a list that's posted again - quoted by helpers, or reposted by the asker - is embedded without loading the page
+Entries are keyed by canonical list url (see sites.Site) and hold the parsed ListResult rather than the soup, which is all buildTable needs.
+Links that have to be resolved into list links first (PCPartPicker completed builds and saved lists, Tweakers price breakdowns) get a second, longer-lived cache of their own,
+since what they point to almost never changes. Both are used through CachedScraper, so the site modules don't need to know about either.
+Lists and links that aren't cached yet but are already being loaded for another message are waited on rather than loaded twice, see SingleFlight.
+'''
+import os
+import time
+import asyncio
+from collections import OrderedDict
+import skeleton.soul as soul
+import skeleton.sites as sites
+
+#global defaults for the result cache - can be overridden from .env, see loadCacheSettings()
+CACHE_SETTINGS = {
+    "size": 256, #most lists kept at once - the least recently used is dropped first
+    "ttl": 5 * 60, #seconds a list is reused for, for sites without their own ttl (see sites.Site)
+    "resolveSize": 4096, #most resolved links kept at once
+    "resolveTtl": 7 * 24 * 60 * 60, #seconds a resolved link is reused for - completed builds and saved lists keep pointing at the same list
+    "negativeTtl": 10 * 60, #seconds a link that couldn't be resolved (private, deleted or malformed) is remembered for before we try it again
+}
+
+class Unresolvable(soul.NotAList):
+    '''
+    Raised by CachedScraper.resolve() for links that don't lead to a list - including ones that didn't the last time we tried, see ResolutionCache
+    A soul.NotAList itself, so it keeps its meaning when the scraper hub sends it on to a shard group.
+    '''
+    pass
+
+class ResultCache:
+    '''
+    Size-bounded LRU cache of parsed lists that also expires entries after a per-site TTL
+    Values:
+        - maxSize: most entries kept at once
+        - entries: OrderedDict of canonical url to (expiry time, site name, ListResult.toDict() output), least recently used first
+        - stats: per-site counts as {site: {"hits", "misses", "expired", "evicted"}} - see getStats()
+        - snapshots: store.SnapshotStore every stored list is also saved to, or None to keep them in memory only
+    Results are stored as plain dicts and rebuilt on every hit, so nothing that renders a cached list can change the copy we keep.
+    '''
+    #what entries are saved as in the snapshot store
+    kind = "list"
+
+    def __init__(self, maxSize=None, snapshots=None):
+        '''
+        Inputs:
+            - maxSize: most entries kept at once - defaults to CACHE_SETTINGS["size"]
+            - snapshots: store.SnapshotStore to save lists to, or None - see restore()
+        '''
+        self.maxSize = CACHE_SETTINGS["size"] if maxSize is None else maxSize
+        self.entries = OrderedDict()
+        self.stats = {}
+        self.snapshots = snapshots
+
+    async def getTtl(self, site):
+        '''
+        Returns how many seconds a site's lists are reused for
+        Inputs:
+            - site: site module name, e.g. "pcpp"
+        '''
+        override = CACHE_SETTINGS.get("ttl." + site)
+        if override is not None:
+            return override
+        if (site in sites.SITES.keys()) and (sites.SITES[site].cacheTtl is not None):
+            return sites.SITES[site].cacheTtl
+        return CACHE_SETTINGS["ttl"]
+
+    async def count(self, site, key):
+        '''
+        Adds one to a site's counter
+        Inputs:
+            - site: site module name
+            - key: "hits", "misses", "expired" or "evicted"
+        '''
+        stats = self.stats.setdefault(site, {"hits": 0, "misses": 0, "expired": 0, "evicted": 0})
+        stats[key] += 1
+
+    async def get(self, site, link):
+        '''
+        Looks up a list by its canonical url
+        Inputs:
+            - site: site module name, for the counters
+            - link: canonical list url
+        Returns: ListResult object, or None if we don't have a live entry for it
+        '''
+        entry = self.entries.get(link)
+        if entry is None:
+            await self.count(site, "misses")
+            return None
+        expires, entrySite, data = entry
+        if expires <= time.monotonic():
+            del self.entries[link]
+            await self.count(site, "expired")
+            await self.count(site, "misses")
+            return None
+        self.entries.move_to_end(link)
+        await self.count(site, "hits")
+        return await self.decode(data)
+
+    async def decode(self, data):
+        '''
+        Turns a stored entry back into what get() returns
+        '''
+        return soul.ListResult.fromDict(data)
+
+    async def put(self, site, link, result):
+        '''
+        Stores a parsed list, and saves it to the snapshot store if there is one
+        Inputs:
+            - site: site module name
+            - link: canonical list url
+            - result: ListResult object - invalid lists aren't stored, so a list that's made public is picked up on the next post
+        Returns: N/A
+        '''
+        if (result is None) or (not result.valid) or (self.maxSize <= 0):
+            return
+        ttl = await self.getTtl(site)
+        if ttl <= 0:
+            return
+        await self.save(site, link, result.toDict(), ttl)
+
+    async def save(self, site, link, data, ttl):
+        '''
+        Adds an entry and saves it to the snapshot store if there is one
+        Inputs: as for insert()
+        '''
+        await self.insert(site, link, data, ttl)
+        if self.snapshots is not None:
+            await self.snapshots.save(self.kind, site, link, data, ttl)
+
+    async def insert(self, site, link, data, ttl):
+        '''
+        Adds an entry as the most recently used, dropping the least recently used entries if we're over size
+        Inputs:
+            - site: site module name
+            - link: canonical list url
+            - data: ListResult.toDict() output, or whatever a subclass stores
+            - ttl: seconds until the entry expires
+        '''
+        self.entries[link] = (time.monotonic() + ttl, site, data)
+        self.entries.move_to_end(link)
+        while len(self.entries) > self.maxSize:
+            oldLink, (expires, oldSite, oldData) = self.entries.popitem(last=False)
+            await self.count(oldSite, "evicted")
+
+    async def fill(self, site, buildList):
+        '''
+        Fills in a list's result from the cache if we have it
+        Inputs:
+            - site: site module name
+            - buildList: BuildList child object
+        Returns: True if the list's result was filled in and it doesn't need loading, False otherwise
+        '''
+        result = await self.get(site, await buildList.getLink())
+        if result is None:
+            return False
+        buildList.result = result
+        return True
+
+    async def store(self, site, buildList):
+        '''
+        Stores a list's result once the scraper has loaded it
+        Inputs:
+            - site: site module name
+            - buildList: BuildList child object
+        Returns: N/A
+        '''
+        await self.put(site, await buildList.getLink(), await buildList.getResult())
+
+    async def restore(self):
+        '''
+        Loads the entries saved in the snapshot store that haven't expired yet - call once at startup
+        Inputs: N/A
+        Returns: number of entries loaded
+        Each entry keeps whatever was left of the ttl it was saved with, and the most recently saved entries count as the most recently used.
+        '''
+        if (self.snapshots is None) or (self.maxSize <= 0):
+            return 0
+        saved = await self.snapshots.load(self.kind, self.maxSize)
+        for link, site, remaining, data in saved:
+            await self.insert(site, link, data, remaining)
+        return len(saved)
+
+    async def getStats(self):
+        '''
+        Returns per-site counts plus each site's hit rate, as {site: {"hits", "misses", "expired", "evicted", "hitRate"}}
+        '''
+        summary = {}
+        for site in self.stats.keys():
+            stats = self.stats[site]
+            lookups = stats["hits"] + stats["misses"]
+            summary[site] = dict(stats, hitRate=(stats["hits"] / lookups) if lookups > 0 else 0.0)
+        return summary
+
+class ResolutionCache(ResultCache):
+    '''
+    Long-lived cache of what resolvable links (see links.Link kinds) point to, keyed by the canonical link we were given
+    Entries are {"link": canonical list url} - or {"link": None} for links that couldn't be resolved, which are kept for much less time
+    so a list that's made public again is picked up soon after. Counters and eviction work as in ResultCache.
+    '''
+    kind = "resolve"
+
+    def __init__(self, maxSize=None, snapshots=None):
+        '''
+        Inputs:
+            - maxSize: most entries kept at once - defaults to CACHE_SETTINGS["resolveSize"]
+            - snapshots: store.SnapshotStore to save resolved links to, or None
+        '''
+        super().__init__(CACHE_SETTINGS["resolveSize"] if maxSize is None else maxSize, snapshots)
+
+    async def decode(self, data):
+        '''
+        Resolution entries are returned as they're stored
+        '''
+        return data
+
+    async def resolve(self, scraper, site, resolver, link, *args, flights=None):
+        '''
+        Resolves a link into the canonical link of the list it leads to, only loading the page if we haven't recently
+        Inputs:
+            - scraper: the site's uncached scraper
+            - site: site module name
+            - resolver: module-level resolver function, see soul.LocalScraper.resolve() - its first argument must be the canonical link
+            - link: canonical link to resolve
+            - args: any further arguments for the resolver
+            - flights: SingleFlight shared by every message, so the same link is only resolved once at a time - None to not share
+        Returns: canonical list url - raises Unresolvable if the link doesn't lead to a list
+        '''
+        entry = await self.get(site, link)
+        if entry is None:
+            if flights is None:
+                entry = await self.load(scraper, site, resolver, link, *args)
+            else:
+                entry = await flights.run(site, ("resolve", link), lambda: self.load(scraper, site, resolver, link, *args))
+        if entry["link"] is None:
+            raise Unresolvable("No list found behind " + link)
+        return entry["link"]
+
+    async def load(self, scraper, site, resolver, link, *args):
+        '''
+        Runs the resolver and caches what it found - see resolve()
+        Returns: the new entry
+        '''
+        try:
+            found = sites.scan(await scraper.resolve(resolver, link, *args))
+        except soul.NotAList:
+            #the page loaded, but there's no list behind it - private, deleted or malformed
+            found = []
+        #anything else (timeouts, crashed browsers, dead workers) says nothing about the link, so it's raised without being remembered
+        if (len(found) > 0) and (found[0].kind == "list"):
+            entry = {"link": found[0].url}
+            await self.save(site, link, entry, CACHE_SETTINGS["resolveTtl"])
+        else:
+            entry = {"link": None}
+            await self.save(site, link, entry, CACHE_SETTINGS["negativeTtl"])
+        return entry
+
+class SingleFlight:
+    '''
+    Coalesces concurrent loads of the same thing - while a list or link is being loaded, everyone else who asks for it waits for that load instead of starting their own
+    Values:
+        - flights: dict of key to the asyncio.Task of the load in progress
+        - stats: per-site counts as {site: {"loads", "saved"}} - loads actually run, and loads avoided by waiting on one already running
+    '''
+    def __init__(self):
+        self.flights = {}
+        self.stats = {}
+
+    async def count(self, site, key):
+        '''
+        Adds one to a site's counter
+        Inputs:
+            - site: site module name
+            - key: "loads" or "saved"
+        '''
+        stats = self.stats.setdefault(site, {"loads": 0, "saved": 0})
+        stats[key] += 1
+
+    async def run(self, site, key, load):
+        '''
+        Runs a load unless the same one is already running, in which case it waits for that one
+        Inputs:
+            - site: site module name, for the counters
+            - key: what's being loaded, e.g. ("list", canonical url)
+            - load: async function taking no arguments that does the load
+        Returns: whatever the load returns - if it raises, everyone waiting on it gets the same exception
+        The value is shared by every caller, so loads should return something callers won't change (e.g. ListResult.toDict() output they each rebuild from).
+        '''
+        flight = self.flights.get(key)
+        if flight is None:
+            #the load runs in a task of its own rather than in the caller that started it, so that caller being cancelled can't fail everyone waiting
+            flight = asyncio.create_task(load())
+            self.flights[key] = flight
+            flight.add_done_callback(lambda task: self.landed(key, task))
+            await self.count(site, "loads")
+        else:
+            await self.count(site, "saved")
+        #shield the load, so no caller being cancelled cancels it for the rest
+        return await asyncio.shield(flight)
+
+    def landed(self, key, flight):
+        '''
+        Done callback for a load started by run() - forgets it, so the next caller loads afresh (or finds it in the cache)
+        Not async as it's called straight from the event loop when the load finishes
+        '''
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        #mark any exception as seen, so asyncio doesn't warn about it when nobody was left waiting
+        if not flight.cancelled():
+            flight.exception()
+
+    async def getStats(self):
+        '''
+        Returns per-site counts plus the share of loads each site avoided, as {site: {"loads", "saved", "savedRate"}}
+        '''
+        summary = {}
+        for site in self.stats.keys():
+            stats = self.stats[site]
+            requests = stats["loads"] + stats["saved"]
+            summary[site] = dict(stats, savedRate=(stats["saved"] / requests) if requests > 0 else 0.0)
+        return summary
+
+class CachedScraper:
+    '''
+    Stand-in for a site's scraper that answers from the caches when it can, and passes everything else through
+    Values:
+        - scraper: soul.LocalScraper or workers.RemoteScraper for the site
+        - site: site module name
+        - results: ResultCache of parsed lists
+        - resolutions: ResolutionCache of resolved links
+        - flights: SingleFlight shared by every site's scrapers
+    '''
+    def __init__(self, scraper, site, results, resolutions, flights):
+        self.scraper = scraper
+        self.site = site
+        self.results = results
+        self.resolutions = resolutions
+        self.flights = flights
+
+    async def loadList(self, buildList):
+        '''
+        Fills in a list's result from the cache, or loads it with the scraper and caches it -
+        if another message is already loading the same list, waits for that load instead
+        Inputs:
+            - buildList: BuildList child object
+        Returns: N/A, but the list's result is filled in - its soup is only filled in if this call loaded the page
+        '''
+        if await self.results.fill(self.site, buildList):
+            return
+        data = await self.flights.run(self.site, ("list", await buildList.getLink()), lambda: self.load(buildList))
+        #everyone who waited gets their own copy, so each message renders its own embed from it
+        if buildList.result is None:
+            buildList.result = soul.ListResult.fromDict(data)
+
+    async def load(self, buildList):
+        '''
+        Loads a list with the scraper and caches it - see loadList()
+        Returns: the list's ListResult.toDict() output, to share with anyone waiting on the same list
+        '''
+        await self.scraper.loadList(buildList)
+        await self.results.store(self.site, buildList)
+        return (await buildList.getResult()).toDict()
+
+    async def resolve(self, resolver, link, *args):
+        '''
+        Resolves a link into the canonical link of the list it leads to - see ResolutionCache.resolve()
+        Returns: canonical list url - raises Unresolvable if the link doesn't lead to a list
+        '''
+        return await self.resolutions.resolve(self.scraper, self.site, resolver, link, *args, flights=self.flights)
+
+def loadCacheSettings():
+    '''
+    Reads result cache settings from the environment and updates the global defaults
+    Inputs: None
+    Returns: N/A
+    Recognized variables are CACHE_SIZE (0 disables the cache), CACHE_TTL (in minutes, for sites without their own ttl) and CACHE_TTL_<SITE> (in minutes, e.g. CACHE_TTL_PCPP - 0 disables caching for that site),
+    plus RESOLVE_TTL (in hours) and RESOLVE_NEGATIVE_TTL (in minutes) for resolved links.
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    try:
+        CACHE_SETTINGS["size"] = int(os.getenv("CACHE_SIZE"))
+    except Exception: #unset or malformed - keep the default
+        pass
+    try:
+        CACHE_SETTINGS["ttl"] = int(float(os.getenv("CACHE_TTL")) * 60)
+    except Exception:
+        pass
+    variables = {"RESOLVE_TTL": ("resolveTtl", 60 * 60), "RESOLVE_NEGATIVE_TTL": ("negativeTtl", 60)}
+    for variable in variables.keys():
+        key, scale = variables[variable]
+        try:
+            CACHE_SETTINGS[key] = int(float(os.getenv(variable)) * scale)
+        except Exception:
+            pass
+    for site in sites.SITES.keys():
+        try:
+            CACHE_SETTINGS["ttl." + site] = int(float(os.getenv("CACHE_TTL_" + site.upper())) * 60)
+        except Exception:
+            pass
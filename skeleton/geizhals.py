@@ -9,63 +9,47 @@ from selenium_stealth import stealth
 #import undetected_chromedriver as uc
 from random import choice
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import datetime
 import re
 import asyncio
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+import skeleton.translations as translations
+
+#link formats - see sites.Site
+LINK_PATTERNS = [("list", r"(?P<domain>geizhals\.(?:de|at|eu)|skinflint\.co\.uk|cenowarka\.pl)/wishlists/(?P<id>\d{7})")]
+
+#readiness conditions - see soul.Ready
+#part cards are filled in by script after the document loads
+LIST_READY = [soul.SelectorPresent("div.card")]
+#quantity inputs are lazy loaded as they scroll into view - this scrolls to each in turn and returns their values in page order
+QUANTITIES_SCRIPT = """
+    var quantities = [];
+    document.querySelectorAll('.quantity-input').forEach(function(input) {
+        input.scrollIntoView();
+        var quantity = parseInt(input.value, 10);
+        if (!isNaN(quantity)) { quantities.push(quantity); }
+    });
+    return quantities;
+"""
 
 class Msg(soul.BuildListMsg):
 
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
 
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds all Geizhals network list links in the message and adds them to the list of links
+        Finds all Geizhals network list links in the message and adds them to the list of links
         Inputs: 
-            - driver: Selenium webdriver object
-            - text: the message or message segment to look for a link in - defaults to self.msgText
+            - scraper: scraper for this site - unused, as these links don't need a page load to resolve
         Returns: N/A
         '''
-        if text is None:
-            text = self.msgText
+        for link in await self.scanLinks("geizhals"):
+            self.links.append(link.url)
 
-        # find substring of list link if it exists, by sequentially searching backward through the message for each type
-        linkBodies = ["geizhals.de/wishlists/", "geizhals.at/wishlists/", "geizhals.eu/wishlists/", "cenowarka.pl/wishlists/", "skinflint.co.uk/wishlists/"]
-        linkStartIndex = 4001 #maximum length of discord message 
-        bodyLength = -1
-        #we need to find the links in order, so we check all types, see which one occurs first, and use that
-        for linkBody in linkBodies:
-            try:
-                start = text.index(linkBody)
-                if start < linkStartIndex:
-                    linkStartIndex = start
-                    bodyLength = len(linkBody)
-            except Exception:
-                continue
-        #if we don't find anything, our index is out of bounds and we can break the recursion
-        if linkStartIndex > 4000:
-            return
-
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        #geizhals link suffixes are 7 digit numbers
-        for i in range(linkStartIndex, (linkStartIndex + bodyLength + 7)):
-            try:
-                link += text[i] 
-            except Exception:
-                pass
-        
-        self.links.append(link)
-
-        text = text.replace(link[8:], "")
-        await self.findLinks(driver, text) #recurse on the remaining links in the message
-        return
-    
     async def generateLists(self):
         '''
         Loops over every link found in the message and creates a new list object for it, returning them all
@@ -82,11 +66,19 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "Geizhals"
+        self.language = "de"
+        self.locale = "de"
         if "cenowarka" in link:
             self.siteSource = "Cenowarka"
+            self.language = "pl"
+            self.locale = "pl"
         elif "skinflint" in link:
             self.siteSource = "Skinflint"
+            self.language = None
+            self.locale = "en"
         self.quantities = []
+        #part cards, totals, and the list title - a link to the list itself, which could be anywhere on the page
+        self.regions = ["div.card", "span.wishlist-sum", "a"]
     
     async def generateSoup(self, driver):
         '''
@@ -97,40 +89,28 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
+        await soul.getPage(driver, self.link)
         #clear cookie consent if we get it - if not, ignore the exception
         try:
-            rejectCookieButton = driver.find_element(By.ID, "onetrust-reject-all-handler")
-            rejectCookieButton.click()
+            rejectCookieButton = await soul.findElement(driver, By.ID, "onetrust-reject-all-handler")
+            await soul.click(rejectCookieButton)
         except Exception:
             pass
         #wait for parts to populate
+        if not await soul.waitReady(driver, LIST_READY, timeout=10):
+            print("Couldn't load Geizhals Network wishlist link in time - no data after 10 seconds")
+        #get lazy loaded quantities early, all in one round trip
         try:
-            WebDriverWait(driver, timeout=10, poll_frequency=1).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "card"))
-            )
+            self.quantities = await soul.runScript(driver, QUANTITIES_SCRIPT)
         except Exception as e:
-            print("Couldn't load Geizhals Network wishlist link in time - no data after 10 seconds")
-        #need another wait for translation to work
-        if ("geizhals" in self.link) or ("cenowarka" in self.link):
-            await asyncio.sleep(1)
-        #get lazy loaded quantities early
-        elements = driver.find_elements(By.CLASS_NAME, "quantity-input")
-        for element in elements:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView();", element)
-                self.quantities.append(int(element.get_attribute('value')[0]))
-            except Exception:
-                pass
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+            print("Couldn't read Geizhals quantities: " + str(e))
+        self.soup = await soul.makeSoup(driver, self.regions)
 
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from Geizhals network wishlist link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the part cards and total out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
         #get country from link:
         country = ""
@@ -140,97 +120,65 @@ class List(soul.BuildList):
             country = "gb"
         elif "cenowarka" in self.link:
             country = "pl"
+        result = soul.ListResult(self.siteSource, self.link, country=country)
 
         #title and parts are onvly visible if list is valid and public
         try:
             #get list title
-            title = self.soup.find("a", href=self.link).get_text()
+            result.title = self.soup.find("a", href=self.link).get_text()
 
             #grab list of all part cards
             partCards = self.soup.find_all("div", class_="card")
             
         except Exception:
-            return (await self.badListEmbed(sender, message))
-
-        #structure output
-        #initialize giant string of output
-        componentList = ""
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
-
-        for i in range(len(partCards)):
-            partCard = partCards[i]
+            result.valid = False
+            return result
 
+        #quantities come from generateSoup in page order - copy them so parsing twice gives the same result
+        quantities = list(self.quantities)
+        for partCard in partCards:
             #find part category FIRST so we can loop over individual items within the category after
             #category is 3 fields - we want the SECOND one specifically
-            partCategory = partCard.find("ol", class_="category-breadcrumb").find_all("a")[1].get_text().strip()
-            partCategory = ("**" + partCategory + "**")
+            partCategory = partCard.find("ol", class_="category-breadcrumb").find_all("a")[1].get_text()
+            partCategory = await translations.translate(partCategory, self.language)
 
             #categories can have multiple product entries within them
-            partProducts = partCard.find_all("div", class_="product")
-            for j in range(len(partProducts)):
-                partProduct = partProducts[j]
+            for partProduct in partCard.find_all("div", class_="product"):
                 #every element in these tables is inside a div - get the only link element inside product name. its href is part link, and text is part name
                 partNameField = partProduct.find("div", class_="productname").find("a")
-                partName = partNameField.get_text().strip() 
-                partLink = partNameField["href"].strip()
-                #format into hyperlink
-                partName = ("[" + partName + "](" + partLink + ")")
+                part = soul.Part(partCategory, partNameField.get_text().strip(), url=partNameField["href"].strip())
 
-                #wrap price check in try-catch; if the element doesn't exist (we're oos) it's N/A
+                #wrap price check in try-catch; if the element doesn't exist (we're oos) there's no price
                 try:
                     #get price per unit
                     #price is the text of a link to the offerlist for the part
-                    partPrice = partProduct.find("span", class_="bestprice").find("a").get_text().strip()
-                    partPrice = partPrice.replace(",",".")
-
-                    #get quantity from parallel array - we need to adjust total price if it's more than 1
-                    quantity = self.quantities.pop(0)
-
-                    #if we have multiple or none, adjust part price in the same way as we did for pcpp
-                    if quantity != 1:
-                        unitPrice = re.findall("\d+\.\d+", partPrice)
-                        totalPrice = quantity * (float(unitPrice[0]))
-                        partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-                        partName = ("**("+ str(quantity) + "x)** " + partName)
-
-                    partPrice =  ("``" + partPrice + "``")
-
+                    part.unitPrice = partProduct.find("span", class_="bestprice").find("a").get_text().strip()
+                    #get quantity from parallel array
+                    part.quantity = quantities.pop(0)
                 except Exception:
-                    partPrice = "``N/A``"
+                    pass
 
-                #check to make sure we're not over the character limit
-                #do length check here
-                #length 4000 leaves room for the total in the 4096 character limit - Geizhals has minimal footer
-                if (not tooLong) and (len(componentList) > 4000):
-                    tooLong = True
-                #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-                if tooLong:
-                    overCount += 1
-                    continue
-
-                #add the part to the string
-                componentList = componentList + partCategory + " - " + partPrice + " - " + partName + "\n"
-        
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
+                result.parts.append(part)
         
+        money.normalizeParts(result.parts, self.locale)
         #grab total - it's the second of two fields
-        total = self.soup.find_all("span", class_="wishlist-sum")[1].get_text().strip().replace(",",".") #tweak format for consistency
+        result.totals.append(money.normalize(self.soup.find_all("span", class_="wishlist-sum")[1].get_text(), self.locale))
+        return result
 
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource + " :flag_" + country + ":\n" + self.link + "\n" + title + "\n"), description=("Sent by " + sender + "\n\n" + componentList), color=0x38aefc)
-        try:
-            embed.add_field(name="Total:", value=("``"+total+"``"), inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >96 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed Geizhals network wishlist into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender, message))
+
+        title = self.siteSource + " :flag_" + result.country + ":\n" + self.link + "\n" + result.title + "\n"
+        return await soul.renderEmbed(title, 0x38aefc, sender, result.parts, [("Total:", "``" + result.totals[0] + "``")])
     
     async def badListEmbed(self, sender, message):
         '''
@@ -253,12 +201,20 @@ class List(soul.BuildList):
 
             
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, None) - the country comes from the domain when the list is parsed
+    '''
+    return ("https://" + groups["domain"] + "/wishlists/" + groups["id"], None)
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -266,18 +222,11 @@ async def startWebDriver():
     options = await soul.setDefaultDriverOptions(webdriver.ChromeOptions())
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     options.add_argument("--user-agent="+choice(useragents))
-    #for geizhals, we need to enable automatic translation from either german or polish
-    prefs = {
-        "translate_whitelists": {"de":"en", "pl":"en"},
-        "translate":{"enabled":"true"}
-    }
-    options.add_experimental_option("prefs", prefs)
-
     #driver = uc.Chrome(options=options, version_main=134)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    await soul.runBlocking(stealth, driver,
         languages=["en-UK", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -286,4 +235,33 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+    return driver
+
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
+        languages=["en-UK", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
+
+#images, fonts and trackers are never read - stylesheets stay so quantity inputs still lazy load on scroll
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "Geizhals", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("geizhals", Msg, LINK_PATTERNS, canonicalLink, ["geizhals.", "skinflint.co.uk", "cenowarka.pl"], driverPool, concurrency=2, rate=20, cacheTtl=10 * 60))
@@ -8,51 +8,36 @@ from selenium import webdriver
 from selenium_stealth import stealth
 from random import choice
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import datetime
 import re
 import asyncio
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+import skeleton.translations as translations
+
+#link formats - see sites.Site
+LINK_PATTERNS = [("list", r"hinta\.fi/ostoskori/(?P<id>[A-Za-z0-9]{9})")]
+
+#readiness conditions - see soul.Ready
+LIST_READY = [soul.SelectorPresent("ol.hv-cprl")]
 
 class Msg(soul.BuildListMsg):
 
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
 
 
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds all Hinta.fi list links in the message and adds them to the list of links
+        Finds all Hinta.fi list links in the message and adds them to the list of links
         Inputs: 
-            - driver: Selenium webdriver object
-            - text: the message or message segment to look for a link in - defaults to self.msgText
+            - scraper: scraper for this site - unused, as these links don't need a page load to resolve
         Returns: N/A
         '''
-        if text is None:
-            #replace swedish links here for easier parsing - we'll set them back when we add
-            text = self.msgText
-
-        # find substring of list link if it exists
-        try:
-            start = text.index("hinta.fi/ostoskori/")
-        except Exception:
-            return
-        
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + 28):
-            try:
-                link += text[i] 
-            except Exception:
-                pass
-
-        self.links.append(link)
-        text = text.replace(link[8:], "")
-        await self.findLinks(driver, text) #recurse on the remaining links in the message
-        return
+        for link in await self.scanLinks("hinta"):
+            self.links.append(link.url)
 
     async def generateLists(self):
         '''
@@ -70,6 +55,22 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "Hinta.fi"
+        self.language = "fi"
+        self.regions = ["ol.hv-cprl"]
+
+    async def fetchSoup(self):
+        '''
+        Tries to read the list over plain HTTP - hinta renders shopping lists server side
+        Returns: True if the soup is usable as is, False if we need generateSoup
+        '''
+        soup = await soul.fetchSoup(self.link, self.regions)
+        if soup is None:
+            return False
+        table = soup.find('ol', class_="hv-cprl")
+        if (table is None) or (table.find('li', class_="hv-cprli") is None):
+            return False
+        self.soup = soup
+        return True
 
     async def generateSoup(self, driver):
         '''
@@ -80,91 +81,65 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
-        #wait for translation - always from fi
-        await asyncio.sleep(1)
+        await soul.getPage(driver, self.link)
+        await soul.waitReady(driver, LIST_READY, timeout=5)
         #finally, feed the whole page into beautifulsoup
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+        self.soup = await soul.makeSoup(driver, self.regions)
 
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from Hinta.fi wish list link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the shopping list rows out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
+        result = soul.ListResult(self.siteSource, self.link, country="fi")
         #make sure list is real
         try:
             #grab the parts list table
             table = self.soup.find('ol', class_="hv-cprl")
             rows = table.find_all('li', class_="hv-cprli")
         except Exception:
-            return (await self.badListEmbed(sender, message))
-        
-        #structure output
-        #initialize giant string of output
-        componentList = ""
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
-        #hinta doesn't count a total so we have to do it ourselves
-        total = 0.00
+            result.valid = False
+            return result
 
         for row in rows:
             #grab part info
-            partType = "**" + row.find("div", class_="hv-prl_group").get_text().strip() + "**"
+            partType = await translations.translate(row.find("div", class_="hv-prl_group").get_text(), self.language)
             partName = row.find("h3", class_="hv-prl_name").get_text().strip()
             #only some parts have extra relevant details, like capacity or form factor
             try:
                 partName = partName + " " + row.find("div", class_="hv-prl_features").get_text().strip()
             except Exception:
                 pass
-            partLink = "https://hinta.fi/" + row.find("a", class_="hv-prli-c1")['href']
-            #format it
-            partName = ("[" + partName + "](" + partLink + ")")
-
-            #grab quantity and handle
-            quantity = int(row.find("input", class_="hv-cart-quantity-in")["value"])
-            partPrice = row.find("a", class_="hv-prli-c3-price").get_text().strip().replace(",", "")
-            unitPrice = re.findall("\d+\.\d+", partPrice)
-            totalPrice = quantity * (float(unitPrice[0]))
-            total += totalPrice
-
-            if quantity > 1:
-                partName = ("**("+ str(quantity) + "x)** " + partName)
-                partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-            partPrice = "``" + partPrice + "``"
-
-            #check to make sure we're not over the character limit
-            #do length check here
-            #length 4000 leaves room for the total in the 4096 character limit - Hinta has minimal footer
-            if (not tooLong) and (len(componentList) > 4000):
-                tooLong = True
-            #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-            if tooLong:
-                overCount += 1
-                continue
-
-            #add the part to the string
-            componentList = componentList + partType + " - " + partPrice + " - " + partName + "\n"
-        
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
-
-         # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource + " :flag_fi" + ":\n" + self.link + "\n"), description=("Sent by " + sender + "\n\n" + componentList), color=0x4fff98)
-        try:
-            embed.add_field(name="Total:", value=("``€%.2f``" % total), inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >96 should be to skip rendering the footer and send the embed anyway
-        except Exception as e:
-            print(e)
-            pass
-        
-        return(embed)
+            part = soul.Part(partType, partName, url=("https://hinta.fi/" + row.find("a", class_="hv-prli-c1")['href']), currency="EUR")
+
+            #grab quantity and price
+            part.quantity = int(row.find("input", class_="hv-cart-quantity-in")["value"])
+            part.unitPrice = row.find("a", class_="hv-prli-c3-price").get_text().strip()
+
+            result.parts.append(part)
+
+        #hinta doesn't count a total so we have to do it ourselves
+        prices = money.parseAll([part.unitPrice for part in result.parts], self.locale, "EUR")
+        result.totals = [total.format() for total in money.total(prices, [part.quantity for part in result.parts])]
+        if len(result.totals) < 1:
+            result.totals.append("€0.00")
+        money.normalizeParts(result.parts, self.locale)
+        return result
+
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed Hinta.fi shopping list into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender, message))
+
+        return await soul.renderEmbed(self.siteSource + " :flag_fi:\n" + self.link + "\n", 0x4fff98, sender, result.parts, [("Total:", "``" + result.totals[0] + "``")])
     
     async def badListEmbed(self, sender, message):
         '''
@@ -182,12 +157,20 @@ class List(soul.BuildList):
         await message.channel.send(embed=embed)
         raise ValueError("Bad or private Hinta.fi list detected")
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code)
+    '''
+    return ("https://hinta.fi/ostoskori/" + groups["id"], "fi")
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -195,19 +178,11 @@ async def startWebDriver():
     options = await soul.setDefaultDriverOptions(webdriver.ChromeOptions())
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     options.add_argument("--user-agent="+choice(useragents))
-    #for BAPCGG, we need to enable automatic translation from either swedish, danish or norwegian
-    #for some reason, translating this site breaks formatting horribly when we're faced with parts of quantity > 1 -- needs further investigation
-    
-    prefs = {
-        "translate_whitelists": {"fi":"en"},
-        "translate":{"enabled":"true"}
-    }
-    options.add_experimental_option("prefs", prefs)
-    
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    await soul.runBlocking(stealth, driver,
         languages=["en-US", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -216,4 +191,33 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+    return driver
+
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
+        languages=["en-US", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
+
+#images, fonts and trackers are never read
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "Hinta.fi", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("hinta", Msg, LINK_PATTERNS, canonicalLink, ["hinta.fi"], driverPool, flags=["http"]))
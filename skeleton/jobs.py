@@ -0,0 +1,251 @@
+'''
+Withers Bot Jobs
+Central queue between reading messages and scraping lists, so a flood of links can never start more work than the host can take
+Messages with links become jobs, which a fixed number of runners take in priority order. When the queue is full, or a job has waited so long
+its answer would be useless, the job is shed - the message gets a "busy" reaction instead of a reply, and nothing is loaded for it.
+'''
+import os
+import time
+import asyncio
+from collections import deque
+
+#global defaults for the job queue - can be overridden from .env, see loadJobSettings()
+JOB_SETTINGS = {
+    "depth": 100, #most jobs waiting at once
+    "runners": 8, #jobs handled at once
+    "staleAfter": 2 * 60, #seconds a job may wait before it's dropped instead of run
+    "priorityChannels": [], #channel ids whose messages go ahead of everyone else's, e.g. buildhelp channels
+    "busyEmoji": "⏳", #reaction added to messages we had to skip
+    "listsPerMessage": 4, #lists of one message loaded at once, per site - the sites themselves are handled at once too
+}
+
+#priority classes - lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+class Job:
+    '''
+    A unit of work waiting in the queue - usually every list in one message
+    Values:
+        - priority: PRIORITY_HIGH or PRIORITY_NORMAL
+        - work: async function taking no arguments that does the job
+        - shed: async function taking no arguments, called instead of work if the job is dropped - e.g. to react to the message
+        - enqueued: time.monotonic() the job was queued
+    '''
+    __slots__ = ("priority", "work", "shed", "enqueued")
+
+    def __init__(self, priority, work, shed):
+        self.priority = priority
+        self.work = work
+        self.shed = shed
+        self.enqueued = None
+
+class JobQueue:
+    '''
+    Bounded priority queue of jobs, with a fixed number of runners taking from it
+    Values:
+        - depth: most jobs waiting at once
+        - runnerCount: jobs handled at once
+        - staleAfter: seconds a job may wait before it's dropped
+        - queues: dict of priority to deque of waiting jobs, oldest first
+        - ready: asyncio.Condition the runners wait on
+        - runners: runner tasks, once started
+        - stats: counts and timings, see getStats() - time spent waiting in the queue and time spent working are kept apart
+    When a job arrives at a full queue, it replaces the newest waiting job of a lower priority if there is one, otherwise it's shed itself.
+    '''
+    def __init__(self, depth=None, runners=None, staleAfter=None):
+        '''
+        Inputs: as in Values - each defaults to JOB_SETTINGS
+        '''
+        self.depth = JOB_SETTINGS["depth"] if depth is None else depth
+        self.runnerCount = JOB_SETTINGS["runners"] if runners is None else runners
+        self.staleAfter = JOB_SETTINGS["staleAfter"] if staleAfter is None else staleAfter
+        self.queues = {PRIORITY_HIGH: deque(), PRIORITY_NORMAL: deque()}
+        self.ready = None
+        self.runners = []
+        self.stats = {"queued": 0, "done": 0, "failed": 0, "full": 0, "stale": 0, "waitTotal": 0.0, "waitMax": 0.0, "workTotal": 0.0, "workMax": 0.0}
+
+    async def start(self):
+        '''
+        Starts the runners - safe to call more than once, e.g. from on_ready
+        '''
+        if self.ready is None:
+            self.ready = asyncio.Condition()
+        if len(self.runners) == 0:
+            self.runners = [asyncio.create_task(self.run()) for index in range(max(1, self.runnerCount))]
+
+    async def getDepth(self):
+        '''
+        Returns the number of jobs waiting
+        '''
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def submit(self, job):
+        '''
+        Queues a job, making room for it or shedding it if the queue is full
+        Inputs:
+            - job: Job object
+        Returns: True if the job was queued, False if it was shed
+        '''
+        await self.start()
+        if await self.getDepth() >= self.depth:
+            #make room by dropping the newest job of the lowest priority below this one, since it's the least likely to be missed
+            victim = None
+            for priority in sorted(self.queues.keys(), reverse=True):
+                if (priority > job.priority) and (len(self.queues[priority]) > 0):
+                    victim = self.queues[priority].pop()
+                    break
+            if victim is None:
+                victim = job
+            self.stats["full"] += 1
+            await self.drop(victim)
+            if victim is job:
+                return False
+        job.enqueued = time.monotonic()
+        self.queues[job.priority].append(job)
+        self.stats["queued"] += 1
+        async with self.ready:
+            self.ready.notify()
+        return True
+
+    async def drop(self, job):
+        '''
+        Sheds a job without running it
+        '''
+        try:
+            await job.shed()
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() > 0:
+                raise
+        except Exception as error:
+            print(error)
+
+    async def take(self):
+        '''
+        Waits for the next job, highest priority and oldest first
+        '''
+        async with self.ready:
+            while await self.getDepth() == 0:
+                await self.ready.wait()
+            for priority in sorted(self.queues.keys()):
+                if len(self.queues[priority]) > 0:
+                    return self.queues[priority].popleft()
+
+    async def run(self):
+        '''
+        Runner loop - takes jobs and runs them, dropping any that waited too long
+        '''
+        while True:
+            job = await self.take()
+            started = time.monotonic()
+            wait = started - job.enqueued
+            self.stats["waitTotal"] += wait
+            self.stats["waitMax"] = max(self.stats["waitMax"], wait)
+            if wait > self.staleAfter:
+                self.stats["stale"] += 1
+                await self.drop(job)
+                continue
+            try:
+                await job.work()
+                self.stats["done"] += 1
+            except asyncio.CancelledError:
+                #the runner itself being stopped - otherwise only something the job waited on was cancelled, which mustn't take the runner down too
+                if asyncio.current_task().cancelling() > 0:
+                    raise
+                self.stats["failed"] += 1
+                print("Job cancelled before it finished")
+            except Exception as error:
+                self.stats["failed"] += 1
+                print(error)
+            work = time.monotonic() - started
+            self.stats["workTotal"] += work
+            self.stats["workMax"] = max(self.stats["workMax"], work)
+
+    async def getStats(self):
+        '''
+        Returns queue counts and timings, as {"depth", "queued", "done", "failed", "full", "stale", "waitAverage", "waitMax", "workAverage", "workMax"} - times in seconds
+        "full" counts jobs shed because the queue was full, "stale" ones dropped because they waited longer than staleAfter
+        '''
+        stats = self.stats
+        taken = stats["done"] + stats["failed"] + stats["stale"]
+        ran = stats["done"] + stats["failed"]
+        return {
+            "depth": await self.getDepth(), "queued": stats["queued"], "done": stats["done"], "failed": stats["failed"], "full": stats["full"], "stale": stats["stale"],
+            "waitAverage": (stats["waitTotal"] / taken) if taken > 0 else 0.0, "waitMax": stats["waitMax"],
+            "workAverage": (stats["workTotal"] / ran) if ran > 0 else 0.0, "workMax": stats["workMax"],
+        }
+
+async def fanOut(items, job, limit):
+    '''
+    Runs a job for every item at once, at most limit at a time, and hands back the results in the items' order
+    Inputs:
+        - items: list of anything
+        - job: async function taking one item
+        - limit: most jobs running at once - they're started in the items' order
+    Returns: async generator of (item, result, error) - error is the exception the job raised, or None if it succeeded
+    Each result is yielded as soon as it and everything before it are done, so the caller can reply in order without waiting for the slowest job.
+    A job that gets cancelled from elsewhere only fails its own item - its error is then an asyncio.CancelledError.
+    '''
+    slots = asyncio.Semaphore(max(1, limit))
+    async def run(item):
+        async with slots:
+            return await job(item)
+    tasks = [asyncio.create_task(run(item)) for item in items]
+    try:
+        for item, task in zip(items, tasks):
+            #wait() only raises if the caller is cancelled, not if the job was
+            await asyncio.wait([task])
+            if task.cancelled():
+                yield (item, None, asyncio.CancelledError("Cancelled before it finished"))
+            elif task.exception() is not None:
+                yield (item, None, task.exception())
+            else:
+                yield (item, task.result(), None)
+    finally:
+        #the caller gave up part way through - don't leave the rest running for nobody
+        for task in tasks:
+            task.cancel()
+
+async def getPriority(message):
+    '''
+    Picks the priority class for a message
+    Inputs:
+        - message: discord message object
+    Returns: PRIORITY_HIGH for messages in JOB_SETTINGS["priorityChannels"], PRIORITY_NORMAL otherwise
+    '''
+    if message.channel.id in JOB_SETTINGS["priorityChannels"]:
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
+
+async def reactBusy(message):
+    '''
+    Lets the sender know we skipped their message because we're too busy
+    Inputs:
+        - message: discord message object
+    '''
+    try:
+        await message.add_reaction(JOB_SETTINGS["busyEmoji"])
+    except Exception: #no permission to react - nothing else we can do
+        pass
+
+def loadJobSettings():
+    '''
+    Reads job queue settings from the environment and updates the global defaults
+    Inputs: None
+    Returns: N/A
+    Recognized variables are JOB_QUEUE_DEPTH, JOB_RUNNERS, JOB_STALE_AFTER (in seconds), LISTS_PER_MESSAGE, PRIORITY_CHANNELS (comma separated channel ids) and BUSY_EMOJI.
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    variables = {"JOB_QUEUE_DEPTH": "depth", "JOB_RUNNERS": "runners", "JOB_STALE_AFTER": "staleAfter", "LISTS_PER_MESSAGE": "listsPerMessage"}
+    for variable in variables.keys():
+        try:
+            JOB_SETTINGS[variables[variable]] = int(os.getenv(variable))
+        except Exception: #unset or malformed - keep the default
+            pass
+    try:
+        JOB_SETTINGS["priorityChannels"] = [int(channel) for channel in os.getenv("PRIORITY_CHANNELS").split(",") if len(channel.strip()) > 0]
+    except Exception:
+        pass
+    emoji = os.getenv("BUSY_EMOJI")
+    if (emoji is not None) and (len(emoji.strip()) > 0):
+        JOB_SETTINGS["busyEmoji"] = emoji.strip()
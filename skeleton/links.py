@@ -0,0 +1,86 @@
+'''
+Withers Bot Links
+Finds every supported part list link in a message in a single pass
+Each site module declares its link formats (see sites.Site) - a Scanner combines all of them into one precompiled regex,
+so a message is only walked once no matter how many sites we support, and every link comes back in its site's canonical form -
+so the same list linked two different ways is only loaded once.
+'''
+import re
+
+#matches the named groups in a site's patterns, so they can be renamed to stay unique in the combined regex
+GROUP_PATTERN = re.compile(r"\(\?P<(\w+)>")
+
+class Link:
+    '''
+    A part list link found in a message
+    Values:
+        - site: site module name, e.g. "pcpp"
+        - kind: "list" for links that can be loaded as they are, otherwise what the site module has to resolve first -
+          "build" and "saved" for PCPartPicker completed builds and saved lists, "breakdown" for Tweakers price breakdowns, "blank" for PCPartPicker list links with no id
+        - url: canonical url
+        - country: two letter country code from the url, or None
+    '''
+    __slots__ = ("site", "kind", "url", "country")
+
+    def __init__(self, site, kind, url, country=None):
+        self.site = site
+        self.kind = kind
+        self.url = url
+        self.country = country
+
+    def __repr__(self):
+        return "Link(" + self.site + ", " + self.kind + ", " + self.url + ")"
+
+class Scanner:
+    '''
+    One combined regex over the link patterns of a set of sites
+    Values:
+        - pattern: compiled regex with one alternative per site and link kind
+        - alternatives: dict of alternative group name to (site, kind, [(group name in pattern, group name the site used)])
+    '''
+    def __init__(self, sites):
+        '''
+        Inputs:
+            - sites: list of sites.Site objects, in the order their links should be tried at the same position
+        '''
+        self.sites = {site.name: site for site in sites}
+        self.alternatives = {}
+        parts = []
+        for site in sites:
+            for kind, pattern in site.patterns:
+                name = site.name + "_" + kind
+                #prefix every group the site named with the alternative's name, so the same group name can be used by every site
+                groups = [(name + "_" + group, group) for group in GROUP_PATTERN.findall(pattern)]
+                pattern = GROUP_PATTERN.sub("(?P<" + name + r"_\1>", pattern)
+                self.alternatives[name] = (site, kind, groups)
+                parts.append("(?P<" + name + ">" + pattern + ")")
+        self.pattern = re.compile("|".join(parts))
+
+    def scan(self, text):
+        '''
+        Finds every link in a message
+        Inputs:
+            - text: message contents
+        Returns: list of Link objects in the order they appear, with repeats of the same canonical link removed
+        '''
+        found = []
+        seen = set()
+        for match in self.pattern.finditer(text):
+            site, kind, groups = self.alternatives[match.lastgroup]
+            url, country = site.canonical(kind, {short: match.group(full) for full, short in groups}, match.group())
+            if url not in seen:
+                seen.add(url)
+                found.append(Link(site.name, kind, url, country))
+        return found
+
+def bySite(found):
+    '''
+    Groups scanned links by site
+    Inputs:
+        - found: list of Link objects from Scanner.scan()
+    Returns: dict of site module name to list of Link objects, in the order each site first appears
+    '''
+    sites = {}
+    for link in found:
+        sites.setdefault(link.site, []).append(link)
+    return sites
@@ -13,41 +13,29 @@ import re
 import asyncio
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+import skeleton.translations as translations
+
+#link formats - see sites.Site
+LINK_PATTERNS = [("list", r"meupc\.net/build/(?P<id>[A-Za-z0-9]{6})")]
+
+#readiness conditions - see soul.Ready
+LIST_READY = [soul.SelectorPresent("table")]
 
 class Msg(soul.BuildListMsg):
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
 
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds all Meupc list links in the message and adds them to the list of links
+        Finds all Meupc list links in the message and adds them to the list of links
         Inputs: 
-            - driver: Selenium webdriver object
+            - scraper: scraper for this site - unused, as these links don't need a page load to resolve
         Returns: N/A
         '''
-        if text is None:
-            text = self.msgText
-
-        # find substring of list link if it exists
-        try:
-            start = text.index("meupc.net/build/")
-        except Exception:
-            return
-
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + 22):
-            try:
-                link += text[i] 
-            except Exception:
-                pass
-        
-        self.links.append(link)
-
-        text = text.replace(link[8:], "")
-        await self.findLinks(driver, text) #recurse on the remaining links in the message
-        return
+        for link in await self.scanLinks("meupc"):
+            self.links.append(link.url)
 
     async def generateLists(self):
         '''
@@ -65,6 +53,27 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "Meupc"
+        self.language = "pt"
+        #parts table, wattage and compatibility warnings
+        self.regions = ["table", "div.consumption", "article.message"]
+
+    async def fetchSoup(self):
+        '''
+        Tries to read the list over plain HTTP - meupc renders build tables server side
+        Returns: True if the soup is usable as is, False if we need generateSoup
+        '''
+        html, finalUrl = await soul.fetchHtml(self.link)
+        if html is None:
+            return False
+        #invalid lists redirect to the empty list - leave self.soup empty for buildTable, as generateSoup does
+        if len(finalUrl) < 30:
+            self.soup = None
+            return True
+        soup = await soul.parseHtml(html, self.regions)
+        if (soup.find('table') is None) or (soup.find("div", class_="consumption") is None):
+            return False
+        self.soup = soup
+        return True
 
     async def generateSoup(self, driver):
         '''
@@ -75,23 +84,21 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
-        #wait for translation - always from pt
-        await asyncio.sleep(1)
+        await soul.getPage(driver, self.link)
         #invalid lists redirect to the empty list - since we're out of scope to error here, we simply leave self.soup empty and then catch an exception in the table parser
-        if len(driver.current_url) < 30 :
+        if len(await soul.getCurrentUrl(driver)) < 30 :
             return
+        await soul.waitReady(driver, LIST_READY, timeout=5)
         #finally, feed the whole page into beautifulsoup
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+        self.soup = await soul.makeSoup(driver, self.regions)
 
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from Meupc build list link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the parts table, totals, wattage and compatibility warnings out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
+        result = soul.ListResult(self.siteSource, self.link, country="br")
         #wrap this logic in try-catch to make sure list is real
         try:
             #grab the parts list table
@@ -105,17 +112,11 @@ class List(soul.BuildList):
             except KeyError:
                 pass
         except Exception:
-            return (await self.badListEmbed(sender, message))
-        
-        #structure output
-        #initialize giant string of output
-        componentList = ""
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
+            result.valid = False
+            return result
 
         for row in rows:
-            partType = row.find("th", class_="table-responsive-title").find("a").get_text().strip()
+            partType = await translations.translate(row.find("th", class_="table-responsive-title").find("a").get_text(), self.language)
             
             #parts of the same type are contained within the same tbody - we can compare the tr tags inside to concatenate parts
             parts = row.find_all("tr")
@@ -124,116 +125,84 @@ class List(soul.BuildList):
             while i < len(parts):
                 #get info for this part
                 partTitleTag = parts[i].find("td", class_="table-responsive-selection").find("a")
-                partName = partTitleTag.get_text().strip()
-                partLink = partTitleTag['href'].strip()
+                part = soul.Part(partType, partTitleTag.get_text().strip(), url=partTitleTag['href'].strip())
                 #prices have two fields if discounted, 1 otherwise
                 #the field will be entirely nonexistent if no price is avaialble
                 try:
                     priceField = parts[i].find("td", class_="table-responsive-price")
                     try:
-                        partPrice = priceField.find("b").get_text().strip().replace(",","")
+                        partPrice = priceField.find("b").get_text().strip()
                     except Exception:
-                        partPrice = priceField.get_text().strip().replace(",","")
+                        partPrice = priceField.get_text().strip()
+                    if partPrice != "":
+                        part.unitPrice = partPrice
                 except Exception:
-                    partPrice = "N/A"
-
-                if partPrice == "":
-                    partPrice = "N/A"
+                    pass
 
                 #check if part is purchased - retailer field only has text if purchased
-                if len(parts[i].find("td", class_="table-responsive-loja").get_text().strip()) > 1:
-                    purchased = True
-                    partPrice = partPrice + " (Purchased)"
-                else:
-                    purchased = False
-                
-                #initialize quantity to the one known value
-                partQuantity = 1
+                part.purchased = (len(parts[i].find("td", class_="table-responsive-loja").get_text().strip()) > 1)
                 
                 #check next part for a match
                 #if the parts have the same name and are both either purchased or not, move i past and don't make a new row
                 #this accounts for both identical and mixed parts of the same type in the build
                 while i < (len(parts) - 1):
                     nextName = parts[i + 1].find("td", class_="table-responsive-selection").find("a").get_text().strip()
-                    if len(parts[i + 1].find("td", class_="table-responsive-loja").get_text().strip()) > 1:
-                        nextPurchased = True
-                    else:
-                        nextPurchased = False
+                    nextPurchased = (len(parts[i + 1].find("td", class_="table-responsive-loja").get_text().strip()) > 1)
 
-                    if (nextName == partName) and (nextPurchased == purchased):
-                        partQuantity += 1
+                    if (nextName == part.name) and (nextPurchased == part.purchased):
+                        part.quantity += 1
                         i += 1    
                     else:
                         break
-                    
-                
-                try:
-                    if partQuantity > 1:
-                        unitPrice = re.findall("\d+\.\d+", partPrice)
-                        totalPrice = partQuantity * (float(unitPrice[0]))
-                        partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-                
-                    partPrice = ("``" + partPrice + "``")
-                except Exception:
-                    partPrice = "``N/A``"
-
-                #format part name now that we no longer need it for comparison
-                partName = "[" + partName + "](" + partLink + ")"
-                partName = ("**("+ str(partQuantity) + "x)** " + partName)
-
-                #check to make sure we're not over the character limit
-                #length 3700 leaves room for the total and compat footer in the 4096 character limit
-                if (not tooLong) and (len(componentList) > 3700):
-                    tooLong = True
-                #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-                if tooLong:
-                    overCount += 1
-                    continue
-
-                #add the part to the string
-                componentList = componentList + "**" + partType + "**" + " - " + partPrice + " - " + partName + "\n"
-                #increment iterator
+
+                result.parts.append(part)
                 i += 1
-        
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
+
+        money.normalizeParts(result.parts, self.locale)
 
         #parse totals
-        total = totals[0].find("b").get_text().strip().replace(",","")
+        total = money.parse(totals[0].find("b").get_text(), self.locale)
+        result.totals.append(total.format())
         #if we have purchased parts, there will be 2 elements here
-        
         if len(totals) > 1:
-            notPurchased = totals[1].find("strong").get_text().strip().replace(",","")
+            notPurchased = money.parse(totals[1].find("strong").get_text(), self.locale)
             #easier to just calculate purchased
-            purchased = "R$ %.2f" % (float(total[3:]) - float(notPurchased[3:]))
-            total = (total + " (" + notPurchased + " Not Yet Purchased, " + purchased + " Purchased)")
+            purchased = total - notPurchased
+            result.totalsNote = "(" + notPurchased.format() + " Not Yet Purchased, " + purchased.format() + " Purchased)"
 
         #get wattage
-        wattage = self.soup.find("div", class_="consumption").find("strong").get_text().strip()
+        result.wattage = self.soup.find("div", class_="consumption").find("strong").get_text().strip()
 
         #get compat info
-        compatNotes = ""
-        compatWarns = self.soup.find_all("article", class_="message")
-        for block in compatWarns:
+        for block in self.soup.find_all("article", class_="message"):
             for warning in block.find_all("li"):
-                compatNotes += "- " + warning.get_text().strip() + "\n"
+                result.compatNotes.append(warning.get_text().strip())
 
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource+ " :flag_br:\n"+self.link), description=("Sent by " + sender + "\n\n" + componentList), color=0xFA8148)
-        try:
-            embed.add_field(name="Total:", value=("``"+total+"``"), inline=False)
-            embed.add_field(name="Estimated Wattage", value=wattage, inline=False)
-            #only bother displaying compatibility notes if something is detected
-            if len(compatNotes) > 0:
-                embed.add_field(name="Compatibility Notes/Warnings", value=compatNotes, inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >396 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+        return result
+
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed Meupc build list into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender, message))
+
+        total = result.totals[0]
+        if result.totalsNote is not None:
+            total = total + " " + result.totalsNote
+
+        #notes that don't fit in the field are counted rather than dropped
+        compatNotes = await soul.renderNotes(result.compatNotes)
+
+        #meupc always shows the quantity, even for single parts
+        #only bother displaying compatibility notes if something is detected
+        fields = [("Total:", "``" + total + "``"), ("Estimated Wattage", result.wattage), ("Compatibility Notes/Warnings", compatNotes)]
+        return await soul.renderEmbed(self.siteSource + " :flag_br:\n" + self.link, 0xFA8148, sender, result.parts, fields, alwaysCount=True)
                 
 
 
@@ -253,12 +222,20 @@ class List(soul.BuildList):
         await message.channel.send(embed=embed)
         raise ValueError("Bad Meupc list detected")
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code)
+    '''
+    return ("https://meupc.net/build/" + groups["id"], "br")
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -266,18 +243,12 @@ async def startWebDriver():
     options = await soul.setDefaultDriverOptions(webdriver.ChromeOptions())
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     options.add_argument("--user-agent="+choice(useragents))
-    #for geizhals, we need to enable automatic translation from either german or polish
-    prefs = {
-        "translate_whitelists": {"pt":"en"},
-        "translate":{"enabled":"true"}
-    }
-    options.add_experimental_option("prefs", prefs)
 
     #driver = uc.Chrome(options=options, version_main=134)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    await soul.runBlocking(stealth, driver,
         languages=["en-US", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -286,4 +257,33 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+    return driver
+
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
+        languages=["en-US", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
+
+#images, fonts and trackers are never read
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "Meupc", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("meupc", Msg, LINK_PATTERNS, canonicalLink, ["meupc.net"], driverPool, flags=["http"]))
@@ -0,0 +1,273 @@
+'''
+Withers Bot Money
+Reads prices as the sites show them into exact Decimal amounts, and formats them back for the embed
+Every site writes prices differently - comma or dot decimals, dots, commas or spaces between thousands, symbols before or after -
+so this is the one place that knows about it, instead of every module doing its own replace(",", ".") and float maths.
+'''
+import re
+from decimal import Decimal, InvalidOperation
+
+class Format:
+    '''
+    How numbers are written in a locale
+    Values:
+        - decimal: decimal separator
+        - thousands: thousands separator, or "" if none is used
+    '''
+    __slots__ = ("decimal", "thousands")
+
+    def __init__(self, decimal, thousands):
+        self.decimal = decimal
+        self.thousands = thousands
+
+#number formats by locale - only needed to settle prices with a single separator, e.g. whether "1.234" is a thousand or one and a bit
+#sites pass the locale their prices are written in, which isn't always their language (meupc and hinta use english numbers)
+LOCALES = {
+    "en": Format(".", ","), #$1,234.56 - pcpartpicker, skinflint, pcpricetracker, buildapc.gg (us, uk), meupc, hinta
+    "de": Format(",", "."), #1.234,56 € - geizhals, buildapc.gg (de)
+    "nl": Format(",", "."), #€ 1.234,56 - tweakers
+    "pl": Format(",", " "), #1 234,56 zł - cenowarka
+    "sv": Format(",", " "), #1 234,56 kr - komponentkoll
+    "da": Format(",", "."), #1.234,56 kr - buildapc.gg (dk)
+    "no": Format(",", " "), #1 234,56 kr - buildapc.gg (no)
+    "fi": Format(",", " "), #1 234,56 €
+    "pt": Format(",", "."), #R$ 1.234,56
+}
+#what the bot shows - dot decimals without thousands separators, so every site's prices look the same in discord
+DISPLAY = Format(".", "")
+
+#currency symbols and codes as they appear next to prices, longest first so "R$" wins over "$"
+#symbols shared by several currencies ("$", "kr") map to the most common one - sites that know better pass their own currency
+SYMBOLS = [
+    ("R$", "BRL"), ("CA$", "CAD"), ("A$", "AUD"), ("NZ$", "NZD"), ("US$", "USD"), ("zł", "PLN"), ("Rs.", "INR"), ("Rs", "INR"),
+    ("USD", "USD"), ("EUR", "EUR"), ("GBP", "GBP"), ("INR", "INR"), ("BRL", "BRL"), ("PLN", "PLN"), ("SEK", "SEK"), ("DKK", "DKK"), ("NOK", "NOK"), ("CHF", "CHF"),
+    ("$", "USD"), ("€", "EUR"), ("£", "GBP"), ("₹", "INR"), ("kr", "SEK"),
+]
+SYMBOL_PATTERN = re.compile("|".join(re.escape(symbol) for symbol, currency in SYMBOLS))
+SYMBOL_CURRENCIES = dict(SYMBOLS)
+
+#a price is whatever comes before the number, the number itself (digits with separators between them), and whatever comes after
+#every line matches exactly once - lines without a number leave the number group empty - so parseAll can match a whole list in one go
+PRICE_PATTERN = re.compile(r"^([^\d\n]*)(\d(?:[\d.,' \u2019\u00a0\u202f]*\d)?)?([^\n]*)$", re.MULTILINE)
+#translation tables by decimal separator - each drops the thousands separators and turns the decimal separator into a dot
+#spaces and apostrophes (swiss prices, e.g. CHF 1'234.50) only ever group thousands
+SPACES = " '\u2019\u00a0\u202f"
+DECIMAL_TABLES = {None: str.maketrans("", "", ",." + SPACES), ",": str.maketrans(",", ".", "." + SPACES), ".": str.maketrans("", "", "," + SPACES)}
+
+class Money:
+    '''
+    An exact amount of money, remembering how the site wrote it so it can be shown the same way
+    Values:
+        - amount: Decimal
+        - currency: ISO currency code, or None if we couldn't tell
+        - before: text shown before the number, e.g. "€ " or "R$ "
+        - after: text shown after the number, e.g. " kr"
+        - places: number of decimal places to show
+    '''
+    __slots__ = ("amount", "currency", "before", "after", "places")
+
+    def __init__(self, amount, currency=None, before="", after="", places=2):
+        self.amount = amount
+        self.currency = currency
+        self.before = before
+        self.after = after
+        self.places = places
+
+    def like(self, amount, places=None):
+        '''
+        Returns a new Money for amount, shown the same way as this one
+        '''
+        return Money(amount, self.currency, self.before, self.after, self.places if places is None else places)
+
+    def __mul__(self, quantity):
+        return self.like(self.amount * quantity)
+
+    __rmul__ = __mul__
+
+    def __add__(self, other):
+        return self.like(self.amount + other.amount, max(self.places, other.places))
+
+    def __sub__(self, other):
+        return self.like(self.amount - other.amount, max(self.places, other.places))
+
+    def key(self):
+        '''
+        Returns what prices are grouped by when totalling - the currency if we know it, otherwise how it was written
+        '''
+        if self.currency is not None:
+            return self.currency
+        return (self.before.strip(), self.after.strip())
+
+    def format(self, format=DISPLAY):
+        '''
+        Writes the amount the way the site did, with the given number format
+        Inputs:
+            - format: Format object, defaults to DISPLAY
+        Returns: string
+        '''
+        number = "{:,.{}f}".format(self.amount, self.places)
+        number = number.replace(",", "\0").replace(".", format.decimal).replace("\0", format.thousands)
+        return self.before + number + self.after
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return "Money(" + repr(self.amount) + ", " + repr(self.currency) + ", " + repr(str(self)) + ")"
+
+def toDecimal(number, format):
+    '''
+    Reads a number with separators into a Decimal
+    Inputs:
+        - number: digits with any separators between them, e.g. "1.234,56"
+        - format: Format the number is most likely written in
+    Returns: (Decimal, decimal places), or (None, 0) if it isn't a number
+    '''
+    commas = number.count(",")
+    dots = number.count(".")
+    if commas and dots:
+        #both kinds - whichever comes last is the decimal separator
+        decimal = "," if number.rfind(",") > number.rfind(".") else "."
+    elif (commas + dots) == 1:
+        separator = "," if commas else "."
+        if (len(number) - number.find(separator) != 4) or any(space in number for space in SPACES):
+            #thousands are always followed by exactly 3 digits, and never mixed with spaces or apostrophes grouping the rest
+            decimal = separator
+        elif separator == format.decimal:
+            decimal = separator
+        elif separator == format.thousands:
+            decimal = None
+        else:
+            #a locale that doesn't use this separator at all - with 3 digits after it, it's grouping thousands
+            decimal = None
+    else:
+        #no separators, or one that shows up more than once and so can only be grouping thousands
+        decimal = None
+
+    number = number.translate(DECIMAL_TABLES[decimal])
+    try:
+        amount = Decimal(number)
+    except InvalidOperation:
+        return (None, 0)
+    point = number.find(".")
+    return (amount, 0 if point < 0 else len(number) - point - 1)
+
+#currency detected from the text around a number - sites only ever use a handful, so each is only searched for once
+detected = {}
+
+def detectCurrency(before, after):
+    '''
+    Finds the currency a price is in from the text around its number
+    Inputs:
+        - before, after: text before and after the number
+    Returns: ISO currency code, or None
+    '''
+    key = (before, after)
+    if key not in detected.keys():
+        symbol = SYMBOL_PATTERN.search(before) or SYMBOL_PATTERN.search(after)
+        detected[key] = None if symbol is None else SYMBOL_CURRENCIES[symbol.group()]
+    return detected[key]
+
+def fromMatch(match, format, currency):
+    '''
+    Builds a Money object from a PRICE_PATTERN match
+    Returns: Money object, or None if the match has no number
+    '''
+    before, number, after = match.groups()
+    if number is None:
+        return None
+    amount, places = toDecimal(number, format)
+    if amount is None:
+        return None
+    return Money(amount, currency or detectCurrency(before, after), before, after, places)
+
+def parse(text, locale="en", currency=None):
+    '''
+    Reads a price as shown on a site
+    Inputs:
+        - text: price text, e.g. "€ 1.234,56" or "1 234 kr"
+        - locale: key into LOCALES for the site's number format - None for prices the bot has already formatted
+        - currency: ISO currency code if the site knows it better than the symbol does, otherwise None to detect it
+    Returns: Money object, or None if there's no price in the text
+    '''
+    if text is None:
+        return None
+    match = PRICE_PATTERN.match(text.replace("\n", " ").strip())
+    return fromMatch(match, DISPLAY if locale is None else LOCALES[locale], currency)
+
+def parseAll(texts, locale="en", currency=None):
+    '''
+    Reads a whole list of prices at once - same as calling parse() on each, but with one regex pass over the lot
+    Inputs:
+        - texts: list of price strings, or None for parts without a price
+        - locale, currency: as for parse()
+    Returns: list of Money objects (or None), in the same order
+    '''
+    format = DISPLAY if locale is None else LOCALES[locale]
+    joined = "\n".join("" if text is None else text.replace("\n", " ").strip() for text in texts)
+    return [fromMatch(match, format, currency) for match in PRICE_PATTERN.finditer(joined)]
+
+def normalize(text, locale="en", currency=None):
+    '''
+    Rewrites a price as shown on a site into the bot's DISPLAY format, e.g. "€ 1.234,56" becomes "€ 1234.56"
+    Inputs: as for parse()
+    Returns: string - the original text, stripped, if there's no price in it
+    '''
+    price = parse(text, locale, currency)
+    if price is None:
+        return None if text is None else text.strip()
+    return price.format()
+
+def normalizeParts(parts, locale="en"):
+    '''
+    Rewrites the unit price of every part in a list into the DISPLAY format in one go, filling in each part's currency if it's missing
+    Inputs:
+        - parts: list of soul.Part objects, with unitPrice as shown on the site
+        - locale: key into LOCALES for the site's number format
+    Returns: N/A, the parts are updated in place - prices we can't read are left as they are
+    '''
+    for part, price in zip(parts, parseAll([part.unitPrice for part in parts], locale)):
+        if price is None:
+            continue
+        part.unitPrice = price.format()
+        if part.currency is None:
+            part.currency = price.currency
+
+def multiply(text, quantity):
+    '''
+    Multiplies a price the bot has already formatted by a quantity
+    Inputs:
+        - text: price string in the DISPLAY format
+        - quantity: int
+    Returns: string - unchanged if there's no price in it
+    '''
+    price = parse(text, None)
+    if price is None:
+        return text
+    return (price * quantity).format()
+
+def total(prices, quantities=None):
+    '''
+    Adds up a list of prices, keeping each currency separate
+    Inputs:
+        - prices: list of Money objects - None entries (parts without a price) are skipped
+        - quantities: list of ints in the same order, or None if every price is for one
+    Returns: list of Money objects, one per currency, in the order each currency first appears
+    '''
+    if quantities is None:
+        quantities = [1] * len(prices)
+    #add up plain Decimals per currency and only build one Money for each at the end
+    amounts = {}
+    first = {}
+    for price, quantity in zip(prices, quantities):
+        if price is None:
+            continue
+        key = price.key()
+        if key in amounts.keys():
+            amounts[key] += price.amount * quantity
+            if price.places > first[key].places:
+                first[key] = price
+        else:
+            amounts[key] = price.amount * quantity
+            first[key] = price
+    return [first[key].like(amount) for key, amount in amounts.items()]
@@ -14,44 +14,101 @@ import asyncio
 import re
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+
+#link formats - see sites.Site
+#regional sites are prefixed with a two letter country code - the lookbehind stops "www." from being read as one
+COUNTRY_PREFIX = r"(?:(?<![\w.])(?P<country>[a-z]{2})\.)?"
+LINK_PATTERNS = [
+    ("list", COUNTRY_PREFIX + r"pcpartpicker\.com/list/(?P<id>[A-Za-z0-9]{6})"),
+    ("build", COUNTRY_PREFIX + r"pcpartpicker\.com/b/(?P<id>[A-Za-z0-9]{6})"),
+    ("saved", COUNTRY_PREFIX + r"pcpartpicker\.com/user/(?P<user>[^/\s]+)/saved/(?:#view=)?(?P<id>[A-Za-z0-9]{6})"),
+    #a list link with the id missing, e.g. from copying the address bar of an unsaved list
+    ("blank", r"pcpartpicker\.com/list/?(?=\s|$)"),
+]
+
+#readiness conditions - see soul.Ready
+#the parts table is rendered server side, so it's there as soon as the document is
+LIST_READY = [soul.SelectorPresent("table.xs-col-12")]
+#custom part links are only fetched once their view link is clicked, and show "Loading..." in the name cell until then
+#this opens all of them at once, waits for every placeholder to go, and returns [[row index, url], ...] for the rows that have a url
+#row indexes count every tr in the parts table, matching table.find_all('tr') in buildTable
+CUSTOM_PARTS_SCRIPT = """
+    var done = arguments[arguments.length - 1];
+    var deadline = performance.now() + arguments[0];
+    var rows = Array.prototype.slice.call(document.querySelectorAll('table.xs-col-12 tr'));
+    var pending = [];
+    rows.forEach(function(row, index) {
+        var link = row.querySelector('td.td__name a[href*="#view_custom_part"]');
+        if (link === null) { return; }
+        //custom parts without custom urls don't respond to this - they just never get a url
+        try { link.click(); } catch (e) {}
+        pending.push([index, row.querySelector('td.td__name')]);
+    });
+    function poll() {
+        var loading = pending.some(function(p) { return p[1].textContent.indexOf('Loading...') >= 0; });
+        if (loading && (performance.now() < deadline)) { setTimeout(poll, 50); return; }
+        var found = [];
+        pending.forEach(function(p) {
+            //the url ends up on its own line at the end of the name cell
+            var lines = p[1].textContent.trim().split('\n');
+            var url = lines[lines.length - 1].trim();
+            if ((lines.length > 1) && (url.indexOf('https://') >= 0)) { found.push([p[0], url]); }
+        });
+        done(found);
+    }
+    poll();
+"""
+#the edit view of a saved list fills in its shareable part list link once it has loaded
+SAVED_READY = [soul.ScriptTrue("(function() { var e = document.querySelector('input.text-input[type=\"text\"]'); return (e !== null) && (e.value.indexOf('/list/') >= 0); })()", "share link filled in")]
 
 class Msg(soul.BuildListMsg):
     
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
         self.priv = False #indicator to determine whether a list is private
 
-    async def findLinks(self, driver):
+    async def findLinks(self, scraper):
         '''
         Finds PCPartPicker link within the contents of a message
         Inputs: 
-            - driver: selenium webdriver instance
+            - scraper: scraper for PCPP, used to resolve completed builds and saved lists
         Returns array of links as strings
         '''
-        #convert saved part lists and completed builds into regular list links in the message
-        await self.buildsToLists(driver)
-        #strip out all #view= in the message to convert view links into saved lists, and replace newlines with spaces for easier parsing later
-        self.msgText = self.msgText.replace("#view=", "").replace("\n", " ")
-        await self.savedToLists(driver)
-
-        #check for blank list link
-        if ("pcpartpicker.com/list/sF8TwP" in self.msgText):
-            self.msgText = self.msgText.replace("pcpartpicker.com/list/sF8TwP", " ")
-            await self.noPartsEmbed()
+        blank = False
+        noParts = False
+        for link in await self.scanLinks("pcpp"):
+            if link.kind == "blank":
+                blank = True
+                continue
+            #convert saved part lists and completed builds into regular list links, keeping their place in the message
+            if link.kind == "build":
+                #we need the country code in order to get the correct locale for the list link
+                partsLink = await self.resolveLink(scraper, resolveBuild, link.url, ("" if link.country is None else link.country + "."))
+            elif link.kind == "saved":
+                partsLink = await self.resolveLink(scraper, resolveSaved, link.url)
+            else:
+                partsLink = link.url
+            if partsLink is None:
+                continue
 
-        #add list links to table
-        await self.linksToLists(self.msgText)
+            #check for blank list link
+            if partsLink.endswith("pcpartpicker.com/list/sF8TwP"):
+                noParts = True
+            #a build or saved list can resolve to a list that's also linked directly
+            elif partsLink not in self.links:
+                self.links.append(partsLink)
 
         #if we found empty lists or privated saved lists, handle them here
+        if noParts:
+            await self.noPartsEmbed()
         #check for empty link
-        self.msgText = (self.msgText + " ")
-        if ("pcpartpicker.com/list " in self.msgText) or ("pcpartpicker.com/list/ " in self.msgText):
+        if blank:
             await self.blankEmbed()
-            pass
         #check for priv
         if (self.priv):
             await self.privEmbed()
-            pass
 
         return
         
@@ -66,142 +123,25 @@ class Msg(soul.BuildListMsg):
             lists.append(List(link))
         return lists
     
-    async def buildsToLists(self, driver):
+    async def resolveLink(self, scraper, resolver, *args):
         '''
-        Recursively finds all completed build links in the message and replaces them with the corresponding list link
+        Resolves a completed build or saved list link into its part list link
         Inputs:
-            - driver: selenium webdriver instance
-        Returns: N/A, but updates self.msgText with the new link values
+            - scraper: scraper for PCPP
+            - resolver: resolveBuild or resolveSaved
+            - args: passed through to the resolver
+        Returns: canonical part list link as string, or None if the list is private or malformed - sets self.priv in that case
         '''
-        # find substring of build link if it exists
         try:
-            start = self.msgText.index("pcpartpicker.com/b/")
+            found = sites.scan(await scraper.resolve(resolver, *args))
+        #if we can't load the page or we can't find the button, error
         except Exception:
-            return
-        
-        # check for regional PCPP URLs, which are 31 characters long after https:// to USA's 28
-        # regional url prefixes have a . before pcpartpicker, whereas the base american one has a /. we use this to differentiate them
-        country = "" #we need to store the country code in order to get the correct locale for the list link
-        if self.msgText[start - 1] == ".":
-            start -= 3
-            length = 28
-            country = self.msgText[start:(start + 3)]
-        else: 
-            length = 25
-        
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + length):
-            try:
-                link += self.msgText[i] 
-            except Exception:
-                return
-        try:
-            #now we can load the url into webdriver and look for the part list link
-            driver.get(link)
-            #we don't need to do anything special with driver, so just soup it
-            bSoup = BeautifulSoup(driver.page_source,"html.parser")
-            #grab all the a tags with destinations, and search for one of the format "/list/XXXXXX"
-            aTags = bSoup.find_all('a', href=True)
-            for tag in aTags:
-                href = tag['href']
-                if (href.find("/list/") == 0) and (len(href) > 6): #specify length to avoid taking us to an empty /list/
-                    partsLink = ("https://" + country + "pcpartpicker.com" + href)
-        except Exception: #if we can't load the page or we can't find the button, error
+            found = []
+        if (len(found) < 1) or (found[0].kind != "list"):
             self.priv = True
-            partsLink = ""
+            return None
+        return found[0].url
 
-        #now that we have the link, replace it in msgText
-        self.msgText = self.msgText.replace(link, partsLink)
-
-        #recurse in case there are more builds to find
-        await self.buildsToLists(driver)
-        return
-    
-    async def savedToLists(self, driver):
-        '''
-        Recursively finds all saved part list links in the message and replaces them with the corresponding list link
-        Inputs:
-            - driver: selenium webdriver instance
-        Returns: N/A, but updates self.msgText with the new link values
-        '''
-        # find substring of list link if it exists
-        try:
-            start = self.msgText.index("pcpartpicker.com/user/")
-            #make sure we go to a saved link and NOT a user page - assigning this will throw an exception if it fails
-            finish = (self.msgText.index("/saved/") + 13)
-        except Exception:
-            return
-        #check for regional urls
-        if self.msgText[start - 1] == ".":
-            start -= 3
-        #skip checking for malformed links here as this is too difficult considering the variable length of the username field
-        link = ("https://" + self.msgText[start:finish])
-
-        #wrap this in a try-catch because find_element will error if the list is private or malformed - we want to handle that
-        try:
-            #load the page into webdriver - we need to navigate to the edit part list button
-            driver.get(link)
-
-            editButton = driver.find_element(By.XPATH, '//a[contains(@class,"actionBox__options--edit")]')
-            editButton.click()
-            #need this to check for page to fully load before we find the link
-            await asyncio.sleep(4)
-            
-            #make it into a soup and find the link
-            sSoup = BeautifulSoup(driver.page_source,"html.parser")
-            #get all text input fields, and look for the one with the link in its value
-            partsLink = sSoup.find("input", class_="text-input", type="text")['value']
-        except Exception as error:
-            self.priv = True
-            partsLink = ""
-
-        #now that we have the link, replace it in msgText
-        self.msgText = self.msgText.replace(link, partsLink)
-        
-        #recurse in case there are more saved lists to find
-        await self.savedToLists(driver)
-        return
-
-
-    async def linksToLists(self, text):
-        '''
-        Recursively finds all PCPP list links in the message and adds them to the list of links
-        Inputs: 
-            - text: the message or message segment to look for a link in
-        Returns: N/A
-        '''
-        # find substring of list link if it exists
-        try:
-            start = text.index("pcpartpicker.com/list/")
-        except Exception:
-            return
-        
-        # check for regional PCPP URLs, which are 31 characters long after https:// to USA's 28
-        # regional url prefixes have a . before pcpartpicker, whereas the base american one has a /. we use this to differentiate them
-        if text[start - 1] == ".":
-            start -= 3
-            length = 31
-        else: 
-            length = 28
-
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + length):
-            try:
-                #if there's a hole in the link don't try to fill it
-                if text[i] == " ":
-                    return
-                link += text[i] 
-            except Exception:
-                return
-        
-        self.links.append(link)
-        await self.linksToLists(text.replace(link[8:], "")) #recurse on the remaining links in the message
-        return
-    
     async def privEmbed(self):
         '''
         Creates and sends an embedded message in the event that we detect a private or malformed link
@@ -255,6 +195,25 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "PCPartPicker"
+        self.customLinks = {} #custom part urls by parts table row index, filled in by generateSoup
+        #parts table, wattage estimate and compatibility notes
+        self.regions = ["table.xs-col-12", "div.partlist__keyMetric", "div.subTitle__header", "p.note__text"]
+
+    async def fetchSoup(self):
+        '''
+        Tries to read the list over plain HTTP - the parts table is rendered server side, but custom part links only load in a browser
+        Returns: True if the soup is usable as is, False if we need generateSoup
+        '''
+        soup = await soul.fetchSoup(self.link, self.regions)
+        if soup is None:
+            return False
+        #anything short of a full table (a bot check page, an invalid list...) goes to the browser, which handles those cases
+        if (soup.find('table', class_='xs-col-12') is None) or (soup.find('div', class_='partlist__keyMetric') is None):
+            return False
+        if soup.find('a', href=re.compile("#view_custom_part")) is not None:
+            return False
+        self.soup = soup
+        return True
 
     async def generateSoup(self, driver):
         '''
@@ -266,21 +225,17 @@ class List(soul.BuildList):
         '''
         
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
+        await soul.getPage(driver, self.link)
+        await soul.waitReady(driver, LIST_READY)
 
-        #this loop looks for clickable custom part links, scrolls to the correct location, and clicks to open them.
-        #we need to do this because PCPP does not load custom URLs until the button is clicked to view them.
-        elements = driver.find_elements(By.XPATH, '//a[contains(@href,"#view_custom_part")]')
-        for element in elements:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView();", element)
-                element.click()
-            #custom parts without custom URLs are not clickable - this is expected behaviour
-            except Exception:
-                pass
-        await asyncio.sleep(0.3) #need to wait for the link load function to complete, otherwise we feed "Loading..." into soup
-        
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+        #PCPP does not load custom URLs until the button is clicked to view them - open them all and collect the urls in one round trip
+        try:
+            for index, url in await soul.runAsyncScript(driver, CUSTOM_PARTS_SCRIPT, 5, 5000):
+                self.customLinks[index] = url
+        except Exception as e:
+            print("Couldn't load PCPP custom part links: " + str(e))
+
+        self.soup = await soul.makeSoup(driver, self.regions)
 
         #legacy button functions
         #editClick = driver.find_element(By.CLASS_NAME, "actionBox__options--edit")
@@ -289,65 +244,64 @@ class List(soul.BuildList):
 
         #return soup #, (editClick, saveClick)
     
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from PCPP list link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message: calling discord message object
-        Returns: response message, type discord embed object
+        Reads the parts table, totals, wattage and compatibility notes out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
+        #set up country - useful for links and embed
+        #get country code from link
+        country = "us"
+        if len(self.link) > 36:
+            country = self.link[8:10]
+        #create link prefix
+        countryPrefix = ""
+        if country != "us":
+            countryPrefix = country + "."
+        #fix issues with discord emoji compat
+        if country == "uk":
+            country = "gb"
+        result = soul.ListResult(self.siteSource, self.link, country=country)
 
         #wrap this logic in try-catch to make sure list is real
         try:
             # define the information table to pull based on its class
             table = self.soup.find('table', class_='xs-col-12')
 
-            #set up country - useful for links and embed
-            #get country code from link
-            country = "us"
-            if len(self.link) > 36:
-                country = self.link[8:10]
-            #create link prefix
-            countryPrefix = ""
-            if country != "us":
-                countryPrefix = country + "."
-            #fix issues with discord emoji compat
-            if country == "uk":
-                country = "gb"
-            
             # scrape and format existing build wattage estimate
             buildWattage = (' '.join(self.soup.find('div', class_='partlist__keyMetric',).text.split()))
             wattageSplit = buildWattage.find(":") + 2 
-            buildWattage = buildWattage[wattageSplit:]
+            result.wattage = buildWattage[wattageSplit:]
             
             # scrape and format compatibility notes
-            compatHeader = self.soup.find('div', class_='subTitle__header').find('h2').text
-            compatNotes = ""
+            result.compatHeader = self.soup.find('div', class_='subTitle__header').find('h2').text
             compatTags = self.soup.find_all('p', {'class':['note__text note__text--info','note__text note__text--warning', 'note__text note__text--problem']})
             #Every list that has at least one non-custom internal part contains the same compatibility warning about some measurements not being checked, which we ignore because it's meaningless.
             try:
                 compatTags.pop()
             except Exception: #a list composed entirely of custom parts or peripherals won't have this warning
-                compatHeader = "No issues or incompatibilities detected."
-                compatNotes = ""
+                result.compatHeader = "No issues or incompatibilities detected."
             #now format each compatibility note into a list
             for note in compatTags:
                 note = str(note)
                 if ("currently not supported" in note):
                     continue
-                note = note[note.find("</span>") + 8:-4]
-                compatNotes += ("- " + note + "\n") 
+                result.compatNotes.append(note[note.find("</span>") + 8:-4])
             
-            # scrape and format part list table body
+            # scrape part list table body
             rows = [] #parts
             shortRows = [] #non-part rows - we're mainly interested in total price
             #each part is a tr tag, and each information piece in it is a td tag
-            for row in table.find_all('tr')[1:]:  
+            for rowIndex, row in enumerate(table.find_all('tr')):
+                #first row is the table header
+                if rowIndex == 0:
+                    continue
                 cells = []
+                partLink = None
                 for td in row.find_all('td'):
                     cells.append(td.text.strip())
-                    #grab link if row is of the appropriate type, and add to info for the part
+                    #grab link if row is of the appropriate type
                     tdClass = td.get("class")
                     if tdClass is not None and "td__name" in tdClass:
                         #this type will always contain at least one a tag
@@ -357,193 +311,106 @@ class List(soul.BuildList):
                             url = url[:url.find("\">")]
                             #first, get link the regular way for non-custom parts
                             #note that auto-added amazon parts also work this way
+                            #the first link we find is the part's
+                            if partLink is not None:
+                                break
                             if (url.find("view_custom_part") < 0):
-                                cells.append("https://" + countryPrefix + "pcpartpicker.com" + url)
-                                #we append True to the next field in any successful link so we can easily check if the field has a link when getting it later
-                                cells.append(True)
-                            #for custom parts, the url ends up on its own line at the end of the name field, and may or may not exist
-                            else:
-                                customPartLink = cells[3]
-                                #find the last newline in the name, then slice and use the remainder
-                                while "\n" in customPartLink:
-                                    customPartLink = customPartLink[customPartLink.find("\n") + 1:]
-                                if len(customPartLink) <= 0:
-                                    pass
-                                #make sure the link is valid, otherwise discord markdown will fail to recognize it
-                                if "https://" not in customPartLink: 
-                                    continue
-                                cells.append(customPartLink)
-                                cells.append(True)
+                                partLink = "https://" + countryPrefix + "pcpartpicker.com" + url
+                            #custom part urls were collected by generateSoup, and may or may not exist
+                            elif rowIndex in self.customLinks.keys():
+                                partLink = self.customLinks[rowIndex].strip()
                 #we want parts (long rows) and info (short rows) sorted into their respective arrays
                 if len(cells) > 3:    
-                    rows.append(cells)
+                    rows.append((cells, partLink))
                 else:
                     shortRows.append(cells)
         except Exception:
-            return (await self.badListEmbed(sender))
+            result.valid = False
+            return result
 
-        # structure part list output
-        #initialize giant string of output
-        componentList = ""
-        #initialize part dictionary - used for concatenating identical parts
-        #keys are formatted as (type, name, unit price), value is count (int)
-        partList = {}
-
-        #these variables are needed for handling lists over the ~3700 character limit
-        listLength = 0
-        tooLong = False
-        overCount = 0
-        paramGlobal = False
-
-        #add a new entry to componentList for each part in the long rows
-        for row in rows:
-            #part type e.g. CPU, Memory, Storage, etc is the first field, so we can simply tack it on and bold it
-            partType = "**" + row[0] + "**"
-
-            #next, find the name of the part, and include its hyperlink which we'll format into the name
+        #parts are keyed on everything we display, so identical parts merge into one with a quantity
+        parts = {}
+        for cells, partLink in rows:
             #excessive zero width spaces do nothing but inflate character count, remove them
-            partName = row[3].replace("\u200b", "").strip()
+            partName = cells[3].replace("\u200b", "").strip()
             #check for parametric BEFORE stripping it off of partName
-            parametric = False
-            if partName.find("parametric") >= 0:
-                parametric = True
-                paramGlobal = True #setting this value is quicker than checking it and then setting it
+            parametric = (partName.find("parametric") >= 0)
             #Some part names begin with a leading newline, remove it
             index = partName.find("\n")
             if index >= 0:
                 partName = partName[0:(index + 1)].strip()
-            #this is where we check if we found a link earlier and set up the hyperlink
-            if row[5] == True:
-                partName = ("[" + partName + "](" + row[4].strip() + ")")
-            #if we detected a parametric filter for this part, add an asterisk
-            if parametric:
-                partName = partName + "**\***"
 
             #part price will show up in different places depending on the presence of links, parametrics, etc, so we have to search for it
             partPrice = ""
-            for field in row:
-                try:
-                    if "Price" in field:
-                        partPrice = field[5:].strip() #if price in field, field strips... iykyk ( ͡° ͜ʖ ͡°)
-                    #if the part is purchased, this will always be indicated in the field directly after price
-                    if "Purchased" in field:
-                        partPrice = partPrice + " (Purchased)"
-                except Exception:
-                    pass
-            
-            #"No Price Available" is cumbersome and blank prices cause discord to make unexpected non-inline code blocks, get rid of both
+            purchased = False
+            for field in cells:
+                if "Price" in field:
+                    partPrice = field[5:].strip() #if price in field, field strips... iykyk ( ͡° ͜ʖ ͡°)
+                #if the part is purchased, this will always be indicated in the field directly after price
+                if "Purchased" in field:
+                    purchased = True
+            #"No Price Available" is cumbersome, treat it like a missing price
             if (partPrice == "No Prices Available") or (partPrice == ""):
-                partPrice = "``N/A``"
-            else:
-                partPrice = ("``" + partPrice + "``") 
-            
-            #partList is keyed based on type, name, and unit price, and the value is the count
-            partKey = (partType, partName, partPrice)
-            #if a part of these attributes exists, count one more
-            if partKey in partList.keys():
-                partList[partKey] += 1
-            #if it doesn't exist, add it
-            else:
-                partList[partKey] = 1
-            
-        #loop over rows to add to final string
-        for partKey in partList.keys():
-            #set up variables
-            partType = partKey[0]
-            partName = partKey[1]
-            partPrice = partKey[2]
-            count = partList[partKey]
-
-            #if we have multiple of a part, concatenate
-            if count > 1:
-                #attempt to multiply price by count. need to get number from it first
-                unitPrice = re.findall("\d+\.\d+", partPrice)
-                #this length will be zero if the price is n/a
-                if len(unitPrice) > 0:
-                    #multiply and replace if possible
-                    totalPrice = count * (float(unitPrice[0]))
-                    partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-                
-                #if count > 1, add count in brackets at start of part name
-                partName = ("**("+ str(count) + "x)** " + partName)
-            
-            #whack the whole thing into a great big string
-            partLine = partType + " - " + partPrice + " - " + partName
-
-            #do length check here
-            listLength += len(partLine)
-            #length 3700 leaves room for the footer sections in the 4096 character limit
-            if (not tooLong) and (listLength > 3700):
-                tooLong = True
-            #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-            if tooLong:
-                overCount += partList[partKey]
-                continue
-
-            #finally add the string to a line in the final string
-            componentList += partLine + "\n"
+                partPrice = None
 
-        #if we had at least one parametric part, indicate as such
-        if paramGlobal:
-            componentList += ("\n*\* Indicates a part selected by a parametric filter. Please open the full list for more information.*\n")
-
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
+            partKey = (cells[0], partName, partLink, partPrice, purchased, parametric)
+            if partKey in parts.keys():
+                parts[partKey].quantity += 1
+            else:
+                parts[partKey] = soul.Part(cells[0], partName, url=partLink, unitPrice=partPrice, purchased=purchased, parametric=parametric)
+        result.parts = list(parts.values())
+        money.normalizeParts(result.parts)
 
         #find the grand Total row in shortRows, ignoring all secondary totals as well as shipping/tax/promo under normal circumstances
-        priceTotal = ""
-        purchasedParts = False
+        purchasedTotals = []
         for short in shortRows:
             #this ugly if finds just Total, only Total, not any other kind of total
             if ("Total" in short[0]) and ("Base" not in short[0]) and ("Purchased" not in short[0]):
-                #we add the + in case we have to parse multiple currencies in the same list, then strip leading + for obvious reasons
-                priceTotal += (" + " +short[1]) 
+                #there can be several of these if the list mixes currencies
+                result.totals.append(money.normalize(short[1]))
             if ("Purchased" in short[0]):
-                purchasedParts = True
-
-        priceTotal = priceTotal.strip(" + ")
-
-        #if we have a mix of purchased and non-purchased parts
-        if purchasedParts and (len(priceTotal) > 1):
-            #put rest of totals in parentheses
-            priceTotal += (" (")
-            #find "purchased" and "not yet purchased" fields and add them as above
+                indicator = short[0].replace("Total (", "")
+                indicator = indicator.replace("):", "")
+                purchasedTotals.append(money.normalize(short[1]) + " " + indicator)
+
+        #if we have a mix of purchased and non-purchased parts, put the split in parentheses
+        if (len(purchasedTotals) > 0) and (len(result.totals) > 0):
+            result.totalsNote = "(" + ", ".join(purchasedTotals) + ")"
+        #this case only triggers if the entire list is purchased - find it, and assume purchased
+        elif len(purchasedTotals) > 0:
             for short in shortRows:
                 if ("Purchased" in short[0]):
-                    indicator = short[0].replace("Total (", "")
-                    indicator = indicator.replace("):", "")
-                    priceTotal += (short[1] + " " + indicator + ", ")
-            
-            priceTotal = priceTotal.strip(", ")
-            priceTotal += ")"
+                    result.totals.append(money.normalize(short[1]))
+            result.totalsNote = "(Purchased)"
 
-        #this case only triggers if the entire list is purchased
-        #find it, and assume purchased
-        elif purchasedParts:
-            for short in shortRows:
-                if ("Purchased" in short[0]):
-                    priceTotal += (short[1] + " (Purchased)")
-        
+        return result
+
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed PCPP list into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message: calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender))
+
+        #we join multiple currencies with + and add the purchased split after
+        priceTotal = " + ".join(result.totals)
+        if result.totalsNote is not None:
+            priceTotal = (priceTotal + " " + result.totalsNote).strip()
         #only give up if there is truly no total (avoids triggering discrete code block)
         if len(priceTotal) < 1:
             priceTotal = "N/A"
-        
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource+ " :flag_" + country + ":\n"+self.link), description=("Sent by " + sender + "\n\n" + componentList), color=0xFF55FF)
-        try:
-            embed.add_field(name="Total:", value=("``"+priceTotal+"``"), inline=False)
-            embed.add_field(name="Estimated Wattage", value=buildWattage, inline=False)
-            #only bother displaying compatibility notes if something is detected
-            if len(compatNotes) > 0:
-                embed.add_field(name=compatHeader, value=compatNotes, inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >396 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+
+        #notes that don't fit in the field are counted rather than dropped
+        compatNotes = await soul.renderNotes(result.compatNotes)
+
+        #only bother displaying compatibility notes if something is detected
+        fields = [("Total:", "``" + priceTotal + "``"), ("Estimated Wattage", result.wattage), (result.compatHeader, compatNotes)]
+        return await soul.renderEmbed(self.siteSource + " :flag_" + result.country + ":\n" + self.link, 0xFF55FF, sender, result.parts, fields)
     
     async def badListEmbed(self, sender):
         '''
@@ -558,12 +425,91 @@ class List(soul.BuildList):
         embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
         return embed
     
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code or None)
+    '''
+    if kind == "blank":
+        return ("https://pcpartpicker.com/list/", None)
+    country = groups["country"]
+    url = "https://" + ("" if country is None else country + ".") + "pcpartpicker.com/"
+    if kind == "list":
+        url += "list/" + groups["id"]
+    elif kind == "build":
+        url += "b/" + groups["id"]
+    else:
+        #saved list view links (#view=) are the same list
+        url += "user/" + groups["user"] + "/saved/" + groups["id"]
+    return (url, country)
+
+async def resolveBuild(driver, link, country):
+    '''
+    Loads a completed build page and finds the part list link on it
+    Inputs:
+        - driver: selenium webdriver object, or None to try plain HTTP
+        - link: completed build url
+        - country: regional url prefix including the trailing dot, or "" for the US site
+    Returns: part list link as string - raises soul.NotAList if the page has none
+    '''
+    #completed build pages are rendered server side, so we only need a browser if the site won't talk to plain HTTP
+    if driver is None:
+        bSoup = await soul.fetchSoup(link, ["a"])
+        if bSoup is None:
+            raise soul.NeedsBrowser()
+    else:
+        await soul.getPage(driver, link)
+        #we don't need to do anything special with driver, so just soup it
+        bSoup = await soul.makeSoup(driver, ["a"])
+    #grab all the a tags with destinations, and search for one of the format "/list/XXXXXX"
+    partsLink = None
+    aTags = bSoup.find_all('a', href=True)
+    for tag in aTags:
+        href = tag['href']
+        if (href.find("/list/") == 0) and (len(href) > 6): #specify length to avoid taking us to an empty /list/
+            partsLink = ("https://" + country + "pcpartpicker.com" + href)
+    if (partsLink is None) and (driver is None):
+        #could be a bot check page rather than a bad build, let the browser decide
+        raise soul.NeedsBrowser()
+    if partsLink is None:
+        raise soul.NotAList("No part list found on completed build " + link)
+    return partsLink
+
+async def resolveSaved(driver, link):
+    '''
+    Loads a saved part list and reads its shareable part list link from the edit view
+    Inputs:
+        - driver: selenium webdriver object
+        - link: saved list url
+    Returns: part list link as string - raises soul.NotAList if the list is private or malformed
+    '''
+    #the share link only appears after clicking edit, so this always needs a browser
+    if driver is None:
+        raise soul.NeedsBrowser()
+    #load the page into webdriver - we need to navigate to the edit part list button
+    await soul.getPage(driver, link)
+
+    #only the owner of a private list gets the edit button - and nobody does on a deleted one
+    editButtons = await soul.findElements(driver, By.XPATH, '//a[contains(@class,"actionBox__options--edit")]')
+    if len(editButtons) == 0:
+        raise soul.NotAList("No public part list behind saved list " + link)
+    await soul.click(editButtons[0])
+    #need this to check for page to fully load before we find the link - if it never does, the page was slow rather than the list bad
+    if not await soul.waitReady(driver, SAVED_READY):
+        raise TimeoutError("Saved list " + link + " didn't finish loading")
+    
+    #make it into a soup and find the link
+    sSoup = await soul.makeSoup(driver, ["input.text-input"])
+    #get all text input fields, and look for the one with the link in its value
+    return sSoup.find("input", class_="text-input", type="text")['value']
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -572,10 +518,32 @@ async def startWebDriver():
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     options.add_argument("--user-agent="+choice(useragents))
     #driver = uc.Chrome(options=options, version_main=134)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    await soul.runBlocking(stealth, driver,
+        languages=["en-US", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
 
-    stealth(driver,
+    return driver
+
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
         languages=["en-US", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -584,4 +552,11 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+#product images, fonts and trackers are never read - scripts stay, PCPP needs them to load custom part links
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "PCPartPicker", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("pcpp", Msg, LINK_PATTERNS, canonicalLink, ["pcpartpicker.com"], driverPool, concurrency=3, rate=20, flags=["http", "resolve"]))
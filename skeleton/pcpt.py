@@ -8,49 +8,34 @@ from selenium import webdriver
 from selenium_stealth import stealth
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import datetime
 
 #from seleniumwire import webdriver as wirewd - DEBUG ONLY - requires selenium-wire AND blinker==1.7.0 
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+
+#link formats - see sites.Site
+LINK_PATTERNS = [("list", r"pcpricetracker\.in/b/s/(?P<id>[A-Za-z0-9-]{36})")]
+
+#readiness conditions - see soul.Ready
+LIST_READY = [soul.SelectorPresent("#shared_build")]
 
 class Msg(soul.BuildListMsg):
 
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
     
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds all PCPT list links in the message and adds them to the list of links
+        Finds all PCPT list links in the message and adds them to the list of links
         Inputs: 
-            - text: the message or message segment to look for a link in - defaults to self.msgText
+            - scraper: scraper for this site - unused, as these links don't need a page load to resolve
         Returns: N/A
         '''
-        if text is None:
-            text = self.msgText
-
-        # find substring of list link if it exists
-        try:
-            start = text.index("pcpricetracker.in/b/s/")
-        except Exception:
-            return
-
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = "https://"
-        for i in range(start, start + 58):
-            try:
-                link += text[i] 
-            except Exception:
-                pass
-        
-        self.links.append(link)
-
-        text = text.replace(link[8:], "")
-        await self.findLinks(driver, text) #recurse on the remaining links in the message
-        return
+        for link in await self.scanLinks("pcpt"):
+            self.links.append(link.url)
 
     async def generateLists(self):
         '''
@@ -68,6 +53,7 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "PCPriceTracker"
+        self.regions = ["table#shared_build"]
 
     async def generateSoup(self, driver):
         '''
@@ -78,98 +64,63 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.get(self.link)
-        try:
-            element = WebDriverWait(driver, timeout=15, poll_frequency=7).until(
-                EC.presence_of_element_located((By.ID, "shared_build"))
-            )
-        except Exception as e:
-            print(e)
+        await soul.getPage(driver, self.link)
+        await soul.waitReady(driver, LIST_READY, timeout=15)
+        self.soup = await soul.makeSoup(driver, self.regions)
 
+    async def parse(self):
         '''
-        for request in driver.requests:
-            print(request.url) # <--------------- Request url
-            print(request.headers) # <----------- Request headers
-            print(request.response.headers) # <-- Response headers
-        '''
-
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
-
-    async def buildTable(self, sender, message):
-        '''
-        Parses data table from PCPP list link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the shared build table out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
+        result = soul.ListResult(self.siteSource, self.link, country="in")
         #wrap this logic in try-catch to make sure list is real
         try:
             #grab the parts list table
             table = self.soup.find('table', id="shared_build").find('tbody')
             parts = table.find_all('tr')
+            #last row will always be totals
             totals = parts.pop()
         except Exception:
-            return (await self.badListEmbed(sender))
+            result.valid = False
+            return result
 
-        #structure output
-        #initialize giant string of output
-        componentList = ""
         #don't concatenate identical parts - this site only has the potential for a couple of duplicates anyway, and they have separate IDs
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
-        #last row will always be totals
-
         for part in parts:
             #part type e.g. CPU, Memory, Storage, etc is the category lead
-            partType = "**" + part.find("td", class_="category lead").get_text().strip() + "**"
+            partType = part.find("td", class_="category lead").get_text().strip()
 
             #grab part name and link
             partNameField = part.find("td", class_="selection").find("a")
             partName = partNameField.get_text().strip()
             partLink = ("https://pcpricetracker.in" + partNameField["href"].strip())
 
-            #format it
-            partName = ("[" + partName + "](" + partLink + ")")
-
-            #grab part retailer
+            #grab part price and retailer
             partRetailer = part.find("td", class_="source").get_text().strip()
             partPrice = ("₹" + part.find("td", class_="price").find("a").get_text().strip())
-            #format it
-            partPrice = ("``" + partPrice + " @ " + partRetailer + "``")
-
-            #check to make sure we're not over the character limit
-            #do length check here
-            #length 4000 leaves room for the total in the 4096 character limit - PCPT has minimal footer
-            if (not tooLong) and (len(componentList) > 4000):
-                tooLong = True
-            #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-            if tooLong:
-                overCount += 1
-                continue
-
-            #add the part to the string
-            componentList = componentList + partType + " - " + partPrice + " - " + partName + "\n"
-        
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
+
+            result.parts.append(soul.Part(partType, partName, url=partLink, unitPrice=partPrice, currency="INR", retailer=partRetailer))
+
+        money.normalizeParts(result.parts)
 
         #grab total
-        total = ("₹" + totals.find("td", class_="price").get_text())
+        result.totals.append(money.normalize("₹" + totals.find("td", class_="price").get_text(), currency="INR"))
+        return result
 
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource + " :flag_in:\n" + self.link), description=("Sent by " + sender + "\n\n" + componentList), color=0x019119)
-        try:
-            embed.add_field(name="Total:", value=("``"+total+"``"), inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >396 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed PCPT list into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender))
+
+        return await soul.renderEmbed(self.siteSource + " :flag_in:\n" + self.link, 0x019119, sender, result.parts, [("Total:", "``" + result.totals[0] + "``")])
     
     async def badListEmbed(self, sender):
         '''
@@ -184,12 +135,20 @@ class List(soul.BuildList):
         embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
         return embed
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code)
+    '''
+    return ("https://pcpricetracker.in/b/s/" + groups["id"], "in")
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     options = webdriver.ChromeOptions()
@@ -204,13 +163,15 @@ async def startWebDriver():
     options.add_argument('--disable-gpu')
     options.add_argument('--disable-extensions')
     options.add_argument('--dns-prefetch-disable')
+    #return from page loads at DOMContentLoaded, we wait for the build table ourselves
+    options.page_load_strategy = "eager"
     #custom user agent prevents rate limiting by emulating a real desktop user
     options.add_argument("--user-agent=" + await soul.getStaticUserAgent())
-    driver = uc.Chrome(options=options, version_main=134)
+    driver = await soul.runBlocking(uc.Chrome, options=options, version_main=134)
     #driver = wirewd.Chrome(options=options)
     #driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    await soul.runBlocking(stealth, driver,
         languages=["en-IN", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -225,6 +186,16 @@ async def startWebDriver():
         "longitude": 77.2088,
         "accuracy": 100 
     }
-    driver.execute_cdp_cmd("Page.setGeolocationOverride", params)
+    await soul.runBlocking(driver.execute_cdp_cmd, "Page.setGeolocationOverride", params)
+
+    return driver
+
+#images, fonts and trackers are never read
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+#no setupContext - undetected_chromedriver can't attach to a shared browser without losing its patches, so PCPT always gets a browser per job
+driverPool = soul.SitePool(startWebDriver, "PCPriceTracker", blockProfile=blockProfile)
 
-    return driver
\ No newline at end of file
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("pcpt", Msg, LINK_PATTERNS, canonicalLink, ["pcpricetracker.in"], driverPool, cacheTtl=10 * 60, flags=["extended"]))
@@ -0,0 +1,327 @@
+'''
+Withers Bot Shards
+Lets the bot run its gateway connection as several shards, and those shards as groups in separate processes, so message intake and rendering aren't capped at one core
+A sharded bot can either run every shard in one process (AutoShardedClient), or split them into shard groups, one process each.
+With shard groups, the process that launches them keeps all the scraping - caches, scheduler, driver pools or scraper workers - and serves it to the groups
+over a local socket, so every group shares one cache and one set of browsers instead of each loading the same lists with its own.
+'''
+import os
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+import threading
+import discord
+
+import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.workers as workers
+import skeleton.store as store
+import skeleton.cache as cache
+
+#global defaults for sharding - can be overridden from .env, see loadShardSettings()
+SHARD_SETTINGS = {
+    "sharded": False, #run an AutoShardedClient instead of a single gateway connection
+    "shardCount": None, #total shards, or None to use discord's recommendation (or one per process with shard groups)
+    "processes": 0, #shard group processes - 0 runs every shard in this process
+    "hubJobs": 32, #jobs the scraper hub runs at once for each shard group - the rest wait in the group's pipe
+}
+
+#seconds between checks for shard group processes that have died
+MONITOR_INTERVAL = 5
+
+class Scrapers:
+    '''
+    Everything a process needs to turn links into parsed lists - the caches, single-flight, and either this process' driver pools or the scraper workers
+    Values:
+        - sites: enabled Site objects, whose pools get warmed
+        - results: cache.ResultCache of parsed lists
+        - resolutions: cache.ResolutionCache of resolved links
+        - flights: cache.SingleFlight shared by every site
+        - workerPool: workers.WorkerPool if scraping runs in worker processes, otherwise None
+        - started: whether start() has run
+    '''
+    def __init__(self, extended, workerCount):
+        '''
+        Inputs:
+            - extended: whether extended modules are enabled
+            - workerCount: number of scraper worker processes, 0 to scrape in this process
+        Settings are read from the environment before this is built - see withers.runBot()
+        '''
+        self.sites = sites.getSites(extended)
+        #keep recently parsed lists so reposts of the same list don't load it again - and on disk too if SNAPSHOT_DB is set, so they survive restarts
+        snapshots = store.openStore()
+        self.results = cache.ResultCache(snapshots=snapshots)
+        #and remember what completed builds, saved lists and price breakdowns resolve to, which hardly ever changes
+        self.resolutions = cache.ResolutionCache(snapshots=snapshots)
+        #when the same list is posted in several places at once, only load it once
+        self.flights = cache.SingleFlight()
+        self.workerPool = None
+        if workerCount > 0:
+            self.workerPool = workers.WorkerPool(workerCount, extended=extended)
+        self.started = False
+
+    async def start(self):
+        '''
+        Restores the caches and gets the scrapers ready - safe to call more than once, e.g. from on_ready, which runs again after every reconnect
+        '''
+        if self.started:
+            return
+        self.started = True
+        print("Restored", await self.results.restore(), "cached lists and", await self.resolutions.restore(), "resolved links")
+        #prelaunch drivers for each site so the first messages don't wait on a cold browser - workers warm their own
+        if self.workerPool is not None:
+            await self.workerPool.start()
+        else:
+            await asyncio.gather(*[site.driverPool.warm() for site in self.sites])
+
+    async def getScraper(self, site):
+        '''
+        Picks the scraper for a site - in-process drivers, or the worker processes if they're enabled - behind the caches
+        Inputs:
+            - site: sites.Site object
+        Returns: cache.CachedScraper object
+        '''
+        if self.workerPool is not None:
+            scraper = workers.RemoteScraper(self.workerPool, site.name)
+        else:
+            scraper = soul.LocalScraper(site.driverPool, site.name)
+        return cache.CachedScraper(scraper, site.name, self.results, self.resolutions, self.flights)
+
+class ScraperHub:
+    '''
+    Serves a Scrapers object to the shard group processes over a local socket
+    Values:
+        - scrapers: Scrapers object every job runs on
+        - authkey: random key shard groups need to connect - passed to them when they're launched
+        - listener: multiprocessing Listener on a free localhost port
+        - address: (host, port) the listener is on
+    Jobs use the same (job id, site, kind, args) format as workers.WorkerPool, so shard groups can send them through a workers.RemoteScraper.
+    '''
+    def __init__(self, scrapers):
+        self.scrapers = scrapers
+        self.authkey = os.urandom(32)
+        self.listener = Listener(("127.0.0.1", 0), authkey=self.authkey)
+        self.address = self.listener.address
+        self.loop = None
+
+    async def start(self):
+        '''
+        Starts accepting shard group connections
+        '''
+        self.loop = asyncio.get_running_loop()
+        threading.Thread(target=self.accept, name="withers-hub-accept", daemon=True).start()
+
+    def accept(self):
+        '''
+        Accepts shard group connections, each read on its own thread
+        Not async as this runs on its own thread, blocked on the listener
+        '''
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception as error: #a client that failed the handshake - keep listening
+                print("Scraper hub: " + str(error))
+                continue
+            threading.Thread(target=self.readJobs, args=(conn,), name="withers-hub-conn", daemon=True).start()
+
+    def readJobs(self, conn):
+        '''
+        Reads jobs from one shard group and runs them on the event loop, at most SHARD_SETTINGS["hubJobs"] at a time
+        Once that many are running we stop reading until one finishes, so a busy group waits on its own pipe instead of piling work onto the hub
+        Not async as this runs on its own thread, blocked on the connection
+        '''
+        sendLock = threading.Lock()
+        slots = threading.BoundedSemaphore(max(1, SHARD_SETTINGS["hubJobs"]))
+        while True:
+            slots.acquire()
+            try:
+                job = conn.recv()
+            except Exception: #shard group is gone - it'll reconnect when it's restarted
+                break
+            future = asyncio.run_coroutine_threadsafe(self.runJob(conn, sendLock, job), self.loop)
+            future.add_done_callback(lambda future: slots.release())
+        conn.close()
+
+    async def runJob(self, conn, sendLock, job):
+        '''
+        Runs a job from a shard group through the caches and scrapers, and sends the result back
+        Inputs:
+            - conn: connection to the shard group
+            - sendLock: lock shared by every job from that group, since a connection can only be written by one thread at a time
+            - job: tuple of (job id, site, kind, args) as sent by HubClient.submit
+        Returns: N/A
+        '''
+        jobId, site, kind, args = job
+        try:
+            module = importlib.import_module("skeleton." + site)
+            scraper = await self.scrapers.getScraper(sites.SITES[site])
+            if kind == "list":
+                buildList = module.List(args[0])
+                await scraper.loadList(buildList)
+                result = ("done", jobId, (await buildList.getResult()).toDict())
+            elif kind == "resolve":
+                result = ("done", jobId, await scraper.resolve(getattr(module, args[0]), *args[1:]))
+            else:
+                raise ValueError("Unknown job type " + str(kind))
+        except Exception as error:
+            result = ("error", jobId, await workers.describeError(error))
+        def send():
+            with sendLock:
+                conn.send(result)
+        try:
+            await soul.runBlocking(send)
+        except Exception as error: #shard group is gone
+            print(error)
+
+class HubClient:
+    '''
+    Stand-in for workers.WorkerPool in a shard group process - sends every job to the ScraperHub in the launching process
+    Values:
+        - conn: connection to the hub
+        - inflight: maps job id to the future waiting for its result
+    '''
+    def __init__(self, address, authkey):
+        '''
+        Connects to the hub
+        Inputs:
+            - address, authkey: ScraperHub.address and ScraperHub.authkey
+        '''
+        self.conn = Client(address, authkey=authkey)
+        self.sendLock = threading.Lock()
+        self.inflight = {}
+        self.jobIds = itertools.count()
+        self.loop = None
+
+    async def submit(self, site, kind, *args):
+        '''
+        Sends a job to the hub and waits for its result
+        Inputs: as for workers.WorkerPool.submit()
+        Returns: the job's result
+        Raises soul.NotAList if the hub found no list behind a link, or workers.WorkerError if the job fails otherwise or the hub can't be reached.
+        '''
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            threading.Thread(target=self.readResults, name="withers-hub-results", daemon=True).start()
+        jobId = next(self.jobIds)
+        future = self.loop.create_future()
+        self.inflight[jobId] = future
+        def send():
+            with self.sendLock:
+                self.conn.send((jobId, site, kind, args))
+        try:
+            await soul.runBlocking(send)
+        except Exception as error:
+            self.inflight.pop(jobId, None)
+            raise workers.WorkerError("Couldn't reach the scraper hub: " + str(error))
+        return await future
+
+    def readResults(self):
+        '''
+        Reads results from the hub and hands them to the event loop
+        Not async as this runs on its own thread, blocked on the connection
+        '''
+        while True:
+            try:
+                message = self.conn.recv()
+            except Exception: #the hub is gone, and so is everything we were waiting on
+                self.loop.call_soon_threadsafe(self.failAll, "Lost connection to the scraper hub")
+                return
+            self.loop.call_soon_threadsafe(self.dispatch, message)
+
+    def dispatch(self, message):
+        '''
+        Applies a result from the hub to the job it belongs to
+        Not async as it's scheduled straight onto the event loop by readResults
+        '''
+        kind, jobId, payload = message
+        future = self.inflight.pop(jobId, None)
+        if (future is None) or future.done():
+            return
+        if kind == "done":
+            future.set_result(payload)
+        else:
+            future.set_exception(workers.remoteError(payload))
+
+    def failAll(self, reason):
+        '''
+        Fails every job still waiting on the hub
+        Not async as it's scheduled straight onto the event loop by readResults
+        '''
+        for future in self.inflight.values():
+            if not future.done():
+                future.set_exception(workers.WorkerError(reason))
+        self.inflight = {}
+
+def getClientOptions(shardIds=None, shardCount=None):
+    '''
+    Picks the discord client class and its sharding arguments
+    Inputs:
+        - shardIds, shardCount: shards this process runs, if it's a shard group - None otherwise
+    Returns: (client class, dict of keyword arguments for it)
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    if shardIds is not None:
+        return (discord.AutoShardedClient, {"shard_ids": shardIds, "shard_count": shardCount})
+    if SHARD_SETTINGS["sharded"]:
+        return (discord.AutoShardedClient, {"shard_count": SHARD_SETTINGS["shardCount"]})
+    return (discord.Client, {})
+
+def runShardGroups(target, extended, workerCount):
+    '''
+    Runs the bot as shard groups in separate processes, with this process serving the scrapers they all share
+    Inputs:
+        - target: module-level function each group process runs, called as target(shardIds, shardCount, (hub address, hub authkey)) - usually withers.runBot
+        - extended: whether extended modules are enabled
+        - workerCount: number of scraper worker processes for the shared scrapers, 0 to scrape in this process
+    Returns: N/A - runs until the process is stopped
+    Not async as this function replaces the bot's own event loop in the launching process
+    '''
+    processes = SHARD_SETTINGS["processes"]
+    shardCount = SHARD_SETTINGS["shardCount"] if SHARD_SETTINGS["shardCount"] is not None else processes
+    #deal the shards out round-robin, so every group gets a similar share of guilds
+    groups = [list(range(index, shardCount, processes)) for index in range(min(processes, shardCount))]
+    asyncio.run(serveShardGroups(target, groups, shardCount, extended, workerCount))
+
+async def serveShardGroups(target, groups, shardCount, extended, workerCount):
+    '''
+    Starts the shared scrapers and the shard group processes, restarting any group that dies
+    Inputs: see runShardGroups()
+    Returns: N/A
+    '''
+    scrapers = Scrapers(extended, workerCount)
+    await scrapers.start()
+    hub = ScraperHub(scrapers)
+    await hub.start()
+    #the groups run their own discord clients and event loops, so they have to start from a clean interpreter
+    context = multiprocessing.get_context("spawn")
+    children = [None] * len(groups)
+    while True:
+        for index in range(len(groups)):
+            process = children[index]
+            if (process is not None) and process.is_alive():
+                continue
+            if process is not None:
+                print("Shard group " + str(index) + " exited with code " + str(process.exitcode) + ", restarting it")
+            process = context.Process(target=target, args=(groups[index], shardCount, (hub.address, hub.authkey)), name=("withers-shards-" + str(index)))
+            await soul.runBlocking(process.start)
+            children[index] = process
+        await asyncio.sleep(MONITOR_INTERVAL)
+
+def loadShardSettings():
+    '''
+    Reads sharding settings from the environment and updates the global defaults
+    Inputs: None
+    Returns: N/A
+    Recognized variables are SHARDED (1 to run an auto-sharded client), SHARD_COUNT (total shards), SHARD_PROCESSES (shard group processes, 0 for none)
+    and SHARD_HUB_JOBS (jobs the scraper hub runs at once for each shard group).
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    SHARD_SETTINGS["sharded"] = (os.getenv("SHARDED") in ["1", "true", "True"])
+    variables = {"SHARD_COUNT": "shardCount", "SHARD_PROCESSES": "processes", "SHARD_HUB_JOBS": "hubJobs"}
+    for variable in variables.keys():
+        try:
+            SHARD_SETTINGS[variables[variable]] = int(os.getenv(variable))
+        except Exception: #unset or malformed - keep the default
+            pass
@@ -0,0 +1,136 @@
+'''
+Withers Bot Sites
+Registry of the site modules and the router that hands each message to the ones it links to
+Every site module registers a Site at the bottom of the file declaring how to find its links and how to load them, so adding a site doesn't mean touching withers.py.
+'''
+import skeleton.links as links
+
+class Site:
+    '''
+    Everything the bot needs to know about a site module to route messages to it
+    Values:
+        - name: site module name, e.g. "pcpp" - also the name used by workers.RemoteScraper and links.Link.site
+        - msgClass: the site's Msg class, built for each message that links to it
+        - patterns: list of (kind, regex) pairs for the site's links - see links.Link for the kinds. Named groups are passed to canonical()
+        - canonical: function(kind, groups, text) returning (canonical url, country code or None) for a matched link - groups is a dict of the pattern's named groups, text the whole match
+        - prefilter: plain substrings, at least one of which is in every link to the site - messages without any are never scanned
+        - driverPool: the site's soul.SitePool - its driver profile (how browsers are launched, tabs set up and requests blocked) lives on the pool
+        - concurrency: most pages of this site to load at once, or None for the default - see soul.Scheduler
+        - rate: most pages of this site to load per minute, or None for the default
+        - cacheTtl: seconds a parsed list is reused for when it's posted again, or None for the default - see cache.ResultCache
+        - flags: set of feature flags -
+            "extended": only enabled with --use-extended-modules
+            "http": lists can often be read without a browser, see BuildList.fetchSoup()
+            "resolve": some links need a page load to turn into list links, see scraper.resolve()
+    '''
+    def __init__(self, name, msgClass, patterns, canonical, prefilter, driverPool, concurrency=None, rate=None, cacheTtl=None, flags=()):
+        self.name = name
+        self.msgClass = msgClass
+        self.patterns = patterns
+        self.canonical = canonical
+        self.prefilter = prefilter
+        self.driverPool = driverPool
+        self.concurrency = concurrency
+        self.rate = rate
+        self.cacheTtl = cacheTtl
+        self.flags = set(flags)
+
+    def enabled(self, extended):
+        '''
+        Checks whether the site should handle messages
+        Inputs:
+            - extended: whether extended modules are enabled
+        Returns: boolean
+        '''
+        return extended or ("extended" not in self.flags)
+
+#registered sites by name, in registration order - replies for a message go out in this order
+SITES = {}
+
+def register(site):
+    '''
+    Adds a site to the registry - called by each site module when it's imported
+    Inputs:
+        - site: Site object
+    Returns: the site, so modules can keep a reference to it
+    '''
+    SITES[site.name] = site
+    return site
+
+def getSites(extended=False):
+    '''
+    Returns the registered sites that are enabled, in registration order
+    Inputs:
+        - extended: whether extended modules are enabled
+    '''
+    return [site for site in SITES.values() if site.enabled(extended)]
+
+class Router:
+    '''
+    Finds which sites a message links to and which links belong to each, in one step
+    Values:
+        - sites: enabled Site objects, in registration order
+        - keywords: prefilter substrings of every enabled site
+        - scanner: links.Scanner over every enabled site's link patterns
+    Build it once at startup, after every site module has been imported - the enabled sites are fixed from then on.
+    '''
+    def __init__(self, extended=False):
+        '''
+        Inputs:
+            - extended: whether extended modules are enabled
+        '''
+        self.sites = getSites(extended)
+        self.keywords = [keyword for site in self.sites for keyword in site.prefilter]
+        self.scanner = links.Scanner(self.sites)
+
+    def mightLink(self, text):
+        '''
+        Cheap check for whether a message could contain a link to any enabled site - nearly all chat fails this, and never gets scanned
+        Inputs:
+            - text: message contents
+        Returns: boolean - False means there are definitely no links
+        '''
+        #every link has a slash in it, which rules out most messages before we look for any domains
+        if "/" not in text:
+            return False
+        for keyword in self.keywords:
+            if keyword in text:
+                return True
+        return False
+
+    def scan(self, text):
+        '''
+        Finds every enabled site's links in a message
+        Inputs:
+            - text: message contents
+        Returns: list of links.Link objects, in message order
+        '''
+        if not self.mightLink(text):
+            return []
+        return self.scanner.scan(text)
+
+    def route(self, text):
+        '''
+        Matches a message to the sites it links to
+        Inputs:
+            - text: message contents
+        Returns: list of (Site, [links.Link]) pairs, in registration order - empty for messages without links
+        '''
+        found = links.bySite(self.scan(text))
+        return [(site, found[site.name]) for site in self.sites if site.name in found.keys()]
+
+#router over every registered site, for code that needs to read links outside of a message, e.g. links returned by a resolver
+#built on first use so every site module has registered by then
+defaultRouter = None
+
+def scan(text):
+    '''
+    Finds every registered site's links in some text, extended or not
+    Inputs:
+        - text: text to search
+    Returns: list of links.Link objects, in order
+    '''
+    global defaultRouter
+    if (defaultRouter is None) or (len(defaultRouter.sites) != len(SITES)):
+        defaultRouter = Router(extended=True)
+    return defaultRouter.scan(text)
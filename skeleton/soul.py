@@ -4,12 +4,36 @@ This file contains templates for useful classes for the bot, such as buttons
 It also contains superclass definitions for site-specific classes, such as messages and lists.
 '''
 import discord
+import datetime
 from selenium import webdriver
 from selenium_stealth import stealth
+from selenium.webdriver.support.wait import WebDriverWait
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import asyncio
+import time
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from random import choice
+import aiohttp
+import skeleton.money as money
+import skeleton.sites as sites
 #import undetected_chromedriver as uc
 
+#parser backends - lxml is much faster than html.parser, and selectolax can cut the regions we need out of a page before we parse them
+#both are optional, we fall back to what beautifulsoup ships with - see PARSE_SETTINGS
+try:
+    import lxml
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
 #Global constants for user agents
 CHROME_WIN = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
 FIREFOX_WIN = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:136.0) Gecko/20100101 Firefox/136.0"
@@ -17,13 +41,70 @@ SAFARI_MAC = "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_7_4) AppleWebKit/605.1.1
 EDGE_WIN = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 Edg/134.0.3124.95"
 CHROME_WIN_DEBUG = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36" # constant version, not updated
 
+#Global defaults for webdriver pools - can be overridden from .env, see loadPoolSettings()
+POOL_SETTINGS = {
+    "minSize": 1, #drivers kept warm per site
+    "maxSize": 4, #hard cap on live drivers per site
+    "maxPages": 50, #pages a driver may load before it's recycled
+    "maxAge": 30 * 60, #seconds a driver may live before it's recycled
+    "backend": "pool", #"pool" for one browser per job, "shared" for one browser per site with a tab per job
+    "measurePages": False, #record requests and bytes transferred for every list load, see getPageStats()
+}
+
+#Global defaults for the per-site scheduler - can be overridden from .env, see loadPoolSettings()
+#every page load or resolution against a site waits for one of the site's slots and one of its rate tokens, see Scheduler
+SCHEDULE_SETTINGS = {
+    "concurrency": 4, #page loads per site at once, for sites that don't set their own (see sites.Site)
+    "rate": 30, #page loads per site per minute, for sites that don't set their own
+    "burst": 4, #loads a site may take back to back after being idle, before the rate kicks in
+}
+
+#how list pages are parsed - see parseRegions()
+PARSE_SETTINGS = {
+    "parser": HTML_PARSER, #beautifulsoup backend
+    "selectolax": False, #cut regions out with selectolax before parsing - faster on big pages, but it builds trees the html5 way (e.g. adding tbody), so check benchmarks.py before relying on it for a site
+}
+
+#URL patterns for each resource type we can block - CDP can only block by URL, so types are matched by file extension
+RESOURCE_PATTERNS = {
+    "image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"],
+    "font": ["*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"],
+    "media": ["*.mp4*", "*.webm*", "*.mp3*", "*.m3u8*"],
+    "stylesheet": ["*.css*"],
+}
+#ads, analytics and trackers seen on the supported sites - none of these ever affect the parts table
+TRACKER_PATTERNS = [
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*", "*googlesyndication.com*", "*googleadservices.com*",
+    "*adservice.google.*", "*amazon-adsystem.com*", "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*clarity.ms*",
+    "*scorecardresearch.com*", "*quantserve.com*", "*criteo.*", "*taboola.com*", "*outbrain.com*", "*adnxs.com*",
+    "*pubmatic.com*", "*rubiconproject.com*", "*casalemedia.com*", "*openx.net*", "*moatads.com*", "*cookielaw.org/consent*",
+]
+
+#per-site request and byte counts for list loads, filled in when POOL_SETTINGS["measurePages"] is set
+PAGE_STATS = {}
+
+#plain HTTP fetch tier - one pooled session per process, created on first use
+HTTP_CONNECTIONS = 20
+HTTP_TIMEOUT = 10
+httpSession = None
+#per-site counts of how each page load was served - "http" succeeded without a browser, "browser" needed one
+TIER_STATS = {}
+
 '''
 NOTE:
 All functions apart from RunBot() and constructors, INCLUDING ALL OTHER CLASS METHODS AND THEIR DESCENDANTS, MUST be async.
 This is because discord's gateway depends on receiving heartbeat packets at regular intervals, which blocking functions prevent while they are running.
 Having all functions async prevents gateway warnings and makes the bot more resilient to rate limiting/disconnection under heavy load.
+
+Being async is not enough on its own - selenium and beautifulsoup calls are synchronous and will still block the event loop for as long as they run.
+Every webdriver operation (get, find_element(s), click, execute_script, page_source...) and every soup build MUST go through the executor helpers below
+(runBlocking, getPage, findElement, click, runScript, makeSoup etc.), which run them on a dedicated worker thread pool instead.
 '''
 
+#Dedicated thread pool for blocking selenium/soup work - kept separate from asyncio's default executor so DNS lookups etc. never queue behind page loads
+DRIVER_THREADS = 32
+driverExecutor = ThreadPoolExecutor(max_workers=DRIVER_THREADS, thread_name_prefix="withers-driver")
+
 class Buttons(discord.ui.View):
     def __init__(self, soup, link, buttons):
         '''
@@ -60,20 +141,23 @@ class BuildListMsg:
         - msgText: the contents of the message as a string
         - sender: the sender of the message
         - links: string array containing each helpful link found
+        - scanned: links.Link objects for this site, as found by sites.Router - None until scanLinks() runs, unless the caller already scanned the message
     '''
 
-    def __init__(self, msg, msgText, sender):
+    def __init__(self, msg, msgText, sender, scanned=None):
         '''
         Simple constructor for message parent class
         Inputs:
             - msg: discord message object
             - msgText: the contents of the message as a string
             - sender: the sender of the message as a string
+            - scanned: this site's links from sites.Router, if the message has already been scanned - saves scanning it again
         '''
         self.msg = msg
         self.msgText = msgText
         self.sender = sender
         self.soup = None #implemented at call time
+        self.scanned = scanned
 
         self.links = [] #call findLinks later
 
@@ -91,13 +175,25 @@ class BuildListMsg:
     
     async def getLinks(self):
         return self.links
+
+    async def scanLinks(self, site):
+        '''
+        Gets the message's links for a site, scanning the message if the caller didn't already
+        Inputs:
+            - site: site module name, e.g. "pcpp"
+        Returns: list of links.Link objects, in message order
+        '''
+        if self.scanned is None:
+            self.scanned = [link for link in sites.scan(self.msgText) if link.site == site]
+        return self.scanned
     
-    async def findLinks(self, driver, text=None):
+    async def findLinks(self, scraper):
         '''
         Finds links for the specific list type within the message
         Inputs: 
-            - driver: selenium webdriver object
+            - scraper: LocalScraper (or workers.RemoteScraper) for the site - any page loads needed to resolve links MUST go through scraper.resolve()
         Returns: N/A, but sets self.links[] to contain the links
+        Links should come from scanLinks() rather than searching msgText directly.
 
         This function MUST follow the following implementation format:
         lists = []
@@ -124,6 +220,9 @@ class BuildList:
         - soup: beautifulsoup object generated during parsing
         - buttons: info required to generate secondary buttons below the message - not implemented yet
         - siteSource: Source of the build site, type string
+        - regions: css-style selectors (tag, #id, .class or a combination) for the parts of the page parse() reads - None parses the whole page
+        - language: language the site's categories are in, for translations.translate() - None if they're already english
+        - locale: number format the site's prices are written in, a key into money.LOCALES
     '''
     def __init__(self, link):
         '''
@@ -135,6 +234,10 @@ class BuildList:
         self.soup = None #call generateSoup later
         self.buttons = None #not implemented yet
         self.siteSource = "" #to be implemented by child class
+        self.regions = None #set by child class, see parseRegions()
+        self.result = None #ListResult, filled in by the scraper once the list has loaded
+        self.language = None #set by child class for non-english sites
+        self.locale = "en" #set by child class for sites with comma decimals
 
     '''
     Simple getters
@@ -147,22 +250,258 @@ class BuildList:
     
     async def getButtons(self):
         return self.buttons
+
+    async def getResult(self):
+        return self.result
     
     async def generateSoup(self, driver):
         '''
         Parses the part list and generates a BeautifulSoup object from it
         Returns: BeautifulSoup object with the relevant table
+        Anything else generateSoup finds (e.g. custom part links) can be stored on the list for parse() to use - both always run in the same process.
+        '''
+        raise NotImplementedError("This method should be implemented by the site-specific subclass, but we couldn't find it.")
+
+    async def fetchSoup(self):
+        '''
+        Optional fast path - tries to generate the soup from a plain HTTP fetch, without a browser
+        Returns: True if self.soup now holds everything parse needs, False to fall back to generateSoup
+        Sites whose pages can be read from raw html override this, fetching with soul.fetchSoup() and validating the result before accepting it.
+        '''
+        return False
+
+    async def parse(self):
+        '''
+        Reads everything we display out of the soup, without any formatting
+        Inputs: N/A
+        Returns: ListResult object - with valid set to False if the page didn't contain a usable list
         '''
         raise NotImplementedError("This method should be implemented by the site-specific subclass, but we couldn't find it.")
     
-    async def buildTable(self, sender):
+    async def buildTable(self, sender, message):
         '''
-        Generates and prepares the discord embed table for the part list
+        Generates and prepares the discord embed table for the part list from self.result
         Inputs:
             - sender: sender of the original message, type string
+            - message: calling discord message object
         Returns: Discord embed object
         '''
         raise NotImplementedError("This method should be implemented by the site-specific subclass, but we couldn't find it.")
+
+class Part:
+    '''
+    A single line of a part list, as read from the site
+    Values:
+        - category: part type, in english, e.g. "CPU"
+        - name: part name as listed
+        - url: product page link, or None
+        - unitPrice: price for one of the part, in money.DISPLAY format once parse() is done - None if the site has no price for it
+        - currency: currency code, or None if we don't know it
+        - quantity: number of this part in the list - sites that list each unit separately are merged into one Part
+        - purchased: whether the list owner has marked the part as purchased
+        - parametric: whether the part was picked by a parametric filter rather than by hand
+        - retailer: shop the price is from, or None
+    '''
+    __slots__ = ("category", "name", "url", "unitPrice", "currency", "quantity", "purchased", "parametric", "retailer")
+
+    def __init__(self, category, name, url=None, unitPrice=None, currency=None, quantity=1, purchased=False, parametric=False, retailer=None):
+        self.category = category
+        self.name = name
+        self.url = url
+        self.unitPrice = unitPrice
+        self.currency = currency
+        self.quantity = quantity
+        self.purchased = purchased
+        self.parametric = parametric
+        self.retailer = retailer
+
+    def toDict(self):
+        '''
+        Returns the part as a plain dict, for sending between processes and storing
+        '''
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def fromDict(cls, data):
+        '''
+        Rebuilds a part from toDict() output
+        '''
+        return cls(**data)
+
+class ListResult:
+    '''
+    Everything we display about a part list, independent of the site it came from and of how it's rendered
+    Values:
+        - site: siteSource of the list, e.g. "PCPartPicker"
+        - link: list url
+        - valid: False if the page didn't contain a usable list - everything below is empty in that case
+        - title: list title, or None if the site doesn't have one
+        - country: two letter country code for the flag emoji, or None
+        - parts: list of Part objects in list order
+        - totals: list of total price strings - more than one if the list mixes currencies
+        - totalsNote: extra detail shown after the totals, e.g. the purchased/not yet purchased split, or None
+        - wattage: estimated wattage string, or None
+        - compatHeader: heading for the compatibility notes, or None
+        - compatNotes: list of compatibility note strings
+    '''
+    __slots__ = ("site", "link", "valid", "title", "country", "parts", "totals", "totalsNote", "wattage", "compatHeader", "compatNotes")
+
+    def __init__(self, site, link, valid=True, title=None, country=None, parts=None, totals=None, totalsNote=None, wattage=None, compatHeader=None, compatNotes=None):
+        self.site = site
+        self.link = link
+        self.valid = valid
+        self.title = title
+        self.country = country
+        self.parts = parts if parts is not None else []
+        self.totals = totals if totals is not None else []
+        self.totalsNote = totalsNote
+        self.wattage = wattage
+        self.compatHeader = compatHeader
+        self.compatNotes = compatNotes if compatNotes is not None else []
+
+    def toDict(self):
+        '''
+        Returns the result as plain dicts and lists, for sending between processes and storing
+        '''
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data["parts"] = [part.toDict() for part in self.parts]
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        '''
+        Rebuilds a result from toDict() output
+        '''
+        data = dict(data)
+        data["parts"] = [Part.fromDict(part) for part in data["parts"]]
+        return cls(**data)
+
+#discord's embed limits - see https://discord.com/developers/docs/resources/message#embed-object-embed-limits
+TITLE_LIMIT = 256
+DESCRIPTION_LIMIT = 4096
+FIELD_NAME_LIMIT = 256
+FIELD_LIMIT = 1024
+EMBED_LIMIT = 6000 #title, description and every field name and value combined
+
+PARAMETRIC_NOTE = "\n*\\* Indicates a part selected by a parametric filter. Please open the full list for more information.*\n"
+TOO_LONG_NOTE = "\n*Sorry, this part list is too long. %d part(s) were not shown. Please click the button below to see the full list.*"
+MORE_NOTES = "*...and %d more - please open the full list to see them all.*"
+
+async def formatPart(part, alwaysCount=False):
+    '''
+    Formats one part as a line of the embed description
+    Inputs:
+        - part: Part object
+        - alwaysCount: show the quantity even when it's 1
+    Returns: string, without a trailing newline
+    '''
+    partName = part.name
+    if part.url is not None:
+        partName = "[" + partName + "](" + part.url + ")"
+    #parametric parts get an asterisk, explained by PARAMETRIC_NOTE
+    if part.parametric:
+        partName = partName + "**\\***"
+    if alwaysCount or (part.quantity != 1):
+        partName = "**(" + str(part.quantity) + "x)** " + partName
+
+    #blank prices cause discord to make unexpected non-inline code blocks, so missing prices are N/A
+    if part.unitPrice is None:
+        partPrice = "N/A"
+    else:
+        partPrice = part.unitPrice
+        #show the price for all of them
+        if part.quantity != 1:
+            partPrice = money.multiply(partPrice, part.quantity)
+        if part.retailer is not None:
+            partPrice = partPrice + " @ " + part.retailer
+        if part.purchased:
+            partPrice = partPrice + " (Purchased)"
+
+    return "**" + part.category + "** - ``" + partPrice + "`` - " + partName
+
+async def renderParts(parts, budget, alwaysCount=False):
+    '''
+    Packs as many part lines as fit into budget characters, in list order, followed by any notes
+    Lines are formatted once and formatting stops as soon as the budget runs out, so long lists cost no more than short ones.
+    If anything is cut, the "part(s) not shown" note is added - room for it is kept free as we go, so the output never exceeds the budget.
+    Inputs:
+        - parts: list of Part objects
+        - budget: maximum length of the returned string
+        - alwaysCount: passed on to formatPart()
+    Returns: string
+    '''
+    notes = ""
+    if any(part.parametric for part in parts):
+        notes = PARAMETRIC_NOTE
+    budget -= len(notes)
+    #the count in the tail can't have more digits than the whole list's part count
+    tailLength = len(TOO_LONG_NOTE % sum(part.quantity for part in parts))
+
+    lines = []
+    length = 0
+    fitsWithTail = 0 #number of lines that still leave room for the tail
+    for part in parts:
+        line = (await formatPart(part, alwaysCount)) + "\n"
+        if length + len(line) > budget:
+            break
+        lines.append(line)
+        length += len(line)
+        if length + tailLength <= budget:
+            fitsWithTail = len(lines)
+    else:
+        return "".join(lines) + notes
+
+    #we went over, so drop back to the last line that leaves room for the tail and count everything after it
+    hidden = sum(part.quantity for part in parts[fitsWithTail:])
+    return "".join(lines[:fitsWithTail]) + notes + (TOO_LONG_NOTE % hidden)
+
+async def renderNotes(notes, budget=FIELD_LIMIT):
+    '''
+    Lists notes (e.g. compatibility warnings) as "- note" lines for an embed field, keeping as many as fit
+    If they don't all fit, the rest are counted in a MORE_NOTES line instead - room for it is kept free as we go, like in renderParts()
+    Inputs:
+        - notes: list of strings
+        - budget: maximum length of the returned string
+    Returns: string, empty if there are no notes
+    '''
+    lines = ["- " + note + "\n" for note in notes]
+    if sum(len(line) for line in lines) <= budget:
+        return "".join(lines)
+    #the count can't have more digits than the number of notes
+    tailLength = len(MORE_NOTES % len(notes))
+    kept = 0
+    length = 0
+    for line in lines:
+        if length + len(line) + tailLength > budget:
+            break
+        kept += 1
+        length += len(line)
+    return "".join(lines[:kept]) + (MORE_NOTES % (len(notes) - kept))
+
+async def renderEmbed(title, color, sender, parts, fields=(), alwaysCount=False):
+    '''
+    Builds the embed every site sends for a list - a title, the part list in the description, and footer fields
+    The description gets whatever the title and fields leave of discord's limits, so the embed is never rejected for being too long.
+    Inputs:
+        - title: embed title, cut to TITLE_LIMIT
+        - color: embed color, type int
+        - sender: author of calling message, type string
+        - parts: list of Part objects
+        - fields: (name, value) pairs shown below the list - pairs with an empty value are left out, as are any over discord's limits
+        - alwaysCount: passed on to formatPart()
+    Returns: discord embed object
+    '''
+    title = title[:TITLE_LIMIT]
+    fields = [(name, value) for name, value in fields if name and value and (len(name) <= FIELD_NAME_LIMIT) and (len(value) <= FIELD_LIMIT)]
+    header = "Sent by " + sender + "\n\n"
+    #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
+    budget = min(DESCRIPTION_LIMIT, EMBED_LIMIT - len(title) - sum(len(name) + len(value) for name, value in fields)) - len(header)
+
+    embed = discord.Embed(title=title, description=(header + (await renderParts(parts, budget, alwaysCount))), color=color)
+    for name, value in fields:
+        embed.add_field(name=name, value=value, inline=False)
+    embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
+    return embed
         
 
 async def startWebDriver():
@@ -188,10 +527,10 @@ async def startWebDriver():
     #set user agent to mimic real chrome
     options.add_argument("--user-agent=" + CHROME_WIN)
     #driver = uc.Chrome(options=options, version_main=134)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver = await runBlocking(webdriver.Chrome, options=options)
+    await runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
-    stealth(driver,
+    await runBlocking(stealth, driver,
         languages=["en-US", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -222,9 +561,1049 @@ async def setDefaultDriverOptions(options, headful=False):
     options.add_argument('--disable-gpu')
     options.add_argument('--disable-extensions')
     options.add_argument('--dns-prefetch-disable')
+    #return from page loads at DOMContentLoaded - every module declares readiness conditions for the content it actually needs
+    options.page_load_strategy = "eager"
     
     return options
 
+class DriverPool:
+    '''
+    Keeps a set of warm webdriver instances for a single site so we don't pay for a cold browser start on every message
+    Values:
+        - factory: async function that launches a new configured webdriver, usually the site module's startWebDriver
+        - name: name of the site, used for logging
+        - minSize: number of drivers to keep launched and waiting
+        - maxSize: maximum number of drivers alive at once - checkouts past this wait for a checkin
+        - maxPages: number of pages a driver may load before it's recycled
+        - maxAge: number of seconds a driver may live before it's recycled
+        - idle: drivers ready to be checked out
+        - info: maps id(driver) to [launch time, pages loaded]
+        - alive: number of drivers currently launched, idle or checked out
+    Unset sizes fall back to POOL_SETTINGS at the time they're used, so .env overrides apply to pools created at import time.
+    '''
+    def __init__(self, factory, name, minSize=None, maxSize=None, maxPages=None, maxAge=None):
+        self.factory = factory
+        self.name = name
+        self.overrides = {"minSize": minSize, "maxSize": maxSize, "maxPages": maxPages, "maxAge": maxAge}
+        self.idle = []
+        self.info = {}
+        self.alive = 0
+        self.condition = None #created on first use so it binds to the running event loop
+
+    async def getSetting(self, key):
+        '''
+        Returns a pool setting, preferring the value passed to the constructor over the global default
+        '''
+        if self.overrides[key] is not None:
+            return self.overrides[key]
+        return POOL_SETTINGS[key]
+
+    async def getCondition(self):
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def checkout(self):
+        '''
+        Hands out a healthy driver, reusing an idle one if possible and launching a new one otherwise
+        Inputs: N/A
+        Returns: Selenium Webdriver object - must be given back with checkin() when done
+        Waits for a checkin if maxSize drivers are already in use.
+        '''
+        condition = await self.getCondition()
+        while True:
+            driver = None
+            async with condition:
+                while (len(self.idle) == 0) and (self.alive >= await self.getSetting("maxSize")):
+                    await condition.wait()
+                if len(self.idle) > 0:
+                    driver = self.idle.pop()
+                else:
+                    #reserve a slot before launching so concurrent checkouts can't overshoot maxSize
+                    self.alive += 1
+            #probe reused drivers outside the lock - a dead browser gets replaced on the next pass
+            if driver is not None:
+                if await self.isHealthy(driver):
+                    return driver
+                await self.retire(driver)
+                continue
+            try:
+                return await self.spawn()
+            except Exception:
+                async with condition:
+                    self.alive -= 1
+                    condition.notify()
+                raise
+
+    async def checkin(self, driver, pages=1, healthy=True):
+        '''
+        Returns a driver to the pool once a message is done with it
+        Inputs:
+            - driver: driver previously obtained from checkout()
+            - pages: number of pages loaded while it was checked out
+            - healthy: False if the job failed - the driver is quit instead of being reused
+        Returns: N/A
+        '''
+        info = self.info.get(id(driver))
+        if info is None: #not ours, don't leak it anyway
+            await quitDriver(driver)
+            return
+        info[1] += pages
+        expired = (info[1] >= await self.getSetting("maxPages")) or ((time.monotonic() - info[0]) >= await self.getSetting("maxAge"))
+        if (not healthy) or expired:
+            await self.retire(driver)
+            #keep the pool topped up so the next message still gets a warm driver
+            await self.warm()
+            return
+        #drop the previous page so idle drivers don't sit on its memory
+        try:
+            await getPage(driver, "about:blank")
+        except Exception:
+            await self.retire(driver)
+            await self.warm()
+            return
+        condition = await self.getCondition()
+        async with condition:
+            self.idle.append(driver)
+            condition.notify()
+
+    async def isHealthy(self, driver):
+        '''
+        Cheap probe run before reusing a driver - makes sure the browser and its session are still responding
+        Inputs:
+            - driver: selenium webdriver object
+        Returns: True if the driver can be reused, False otherwise
+        '''
+        info = self.info.get(id(driver))
+        if (info is None) or ((time.monotonic() - info[0]) >= await self.getSetting("maxAge")):
+            return False
+        try:
+            return (await runScript(driver, "return 1")) == 1
+        except Exception:
+            return False
+
+    async def spawn(self):
+        '''
+        Launches a new driver from the factory and starts tracking it. The caller must already have counted it in self.alive.
+        Returns: Selenium Webdriver object
+        '''
+        driver = await self.factory()
+        self.info[id(driver)] = [time.monotonic(), 0]
+        return driver
+
+    async def retire(self, driver):
+        '''
+        Quits a driver and frees up its slot in the pool
+        Inputs:
+            - driver: selenium webdriver object
+        Returns: N/A
+        '''
+        self.info.pop(id(driver), None)
+        await quitDriver(driver)
+        condition = await self.getCondition()
+        async with condition:
+            self.alive -= 1
+            condition.notify()
+
+    async def warm(self):
+        '''
+        Launches drivers until at least minSize are alive, so the first messages don't pay for a cold start
+        Inputs: N/A
+        Returns: N/A
+        '''
+        condition = await self.getCondition()
+        while True:
+            async with condition:
+                if self.alive >= min(await self.getSetting("minSize"), await self.getSetting("maxSize")):
+                    return
+                self.alive += 1
+            try:
+                driver = await self.spawn()
+            except Exception as e:
+                print("Couldn't prelaunch " + self.name + " webdriver: " + str(e))
+                async with condition:
+                    self.alive -= 1
+                return
+            async with condition:
+                self.idle.append(driver)
+                condition.notify()
+
+    async def close(self):
+        '''
+        Quits every idle driver in the pool - checked out drivers are quit when they're checked back in
+        '''
+        condition = await self.getCondition()
+        async with condition:
+            drivers = self.idle
+            self.idle = []
+            self.overrides["minSize"] = 0
+        for driver in drivers:
+            await self.retire(driver)
+
+class SharedBrowser:
+    '''
+    Runs every job for one site in its own tab of a single long-lived browser, instead of a browser per job
+    Values:
+        - factory: async function that launches the host browser, usually the site module's startWebDriver
+        - setupContext: async function(driver) that applies per-job tweaks (user agent, stealth, geolocation...) to a fresh tab
+        - name: name of the site, used for logging
+        - host: webdriver that owns the browser, or None until the first checkout
+        - hostInfo: [launch time, pages loaded] for the host browser
+        - generation: bumped whenever the host is relaunched, so sessions attached to an old browser are thrown away
+        - idle: [generation, session] pairs of attached sessions waiting for a job
+        - sessions: number of attached sessions alive, idle or checked out
+        - active: maps id(session) to [generation, tab handle] for checked out sessions
+        - opening: checkouts still opening their tab, which aren't in active yet
+    WebDriver only drives one tab per session at a time, so each concurrent job gets its own lightweight chromedriver session attached to the host
+    through its DevTools address - a chromedriver process costs a few MB, where a browser costs hundreds.
+    Browser-wide options come from the host's options, everything per-job is applied by setupContext.
+    Sizes and limits come from POOL_SETTINGS - maxSize caps concurrent tabs, maxPages/maxAge recycle the host browser.
+    '''
+    def __init__(self, factory, setupContext, name):
+        self.factory = factory
+        self.setupContext = setupContext
+        self.name = name
+        self.host = None
+        self.homeHandle = None
+        self.hostInfo = [0, 0]
+        self.generation = 0
+        self.idle = []
+        self.sessions = 0
+        self.active = {}
+        self.opening = 0
+        self.condition = None
+
+    async def getCondition(self):
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def checkout(self):
+        '''
+        Opens a new tab for a job and hands out a session driving it
+        Inputs: N/A
+        Returns: Selenium Webdriver object switched to the new tab - must be given back with checkin() when done
+        '''
+        condition = await self.getCondition()
+        async with condition:
+            while (len(self.idle) == 0) and (self.sessions >= POOL_SETTINGS["maxSize"]):
+                await condition.wait()
+            #make sure the browser is up (and recycled if due) before we attach anything to it
+            await self.ensureHost()
+            session = None
+            while len(self.idle) > 0:
+                generation, candidate = self.idle.pop()
+                if generation == self.generation:
+                    session = candidate
+                    break
+                self.sessions -= 1
+                await quitDriver(candidate)
+            if session is None:
+                self.sessions += 1
+            generation = self.generation
+            address = self.host.capabilities["goog:chromeOptions"]["debuggerAddress"]
+            #counted as in use from here, so another checkout can't recycle the host while our tab is still opening
+            self.opening += 1
+
+        try:
+            if session is None:
+                session = await self.attach(address)
+            await runBlocking(session.switch_to.new_window, "tab")
+            tab = await runBlocking(lambda: session.current_window_handle)
+            if self.setupContext is not None:
+                await self.setupContext(session)
+        except BaseException:
+            if session is not None:
+                await quitDriver(session)
+            async with condition:
+                self.opening -= 1
+                self.sessions -= 1
+                condition.notify()
+            raise
+        self.active[id(session)] = [generation, tab]
+        self.opening -= 1
+        return session
+
+    async def checkin(self, session, pages=1, healthy=True):
+        '''
+        Closes a job's tab and keeps its session for the next job
+        Inputs:
+            - session: driver previously obtained from checkout()
+            - pages: number of pages loaded in the tab
+            - healthy: False if the job failed - the session is dropped instead of being reused
+        Returns: N/A
+        '''
+        generation, tab = self.active.pop(id(session), [None, None])
+        self.hostInfo[1] += pages
+        if healthy and (generation == self.generation):
+            try:
+                await runBlocking(session.close)
+                #park the session on the host's own tab, which is never closed
+                await runBlocking(session.switch_to.window, self.homeHandle)
+            except Exception:
+                healthy = False
+        condition = await self.getCondition()
+        if (not healthy) or (generation != self.generation):
+            #sessions attached to a browser don't own it, so quitting one never takes the browser down
+            await quitDriver(session)
+            async with condition:
+                self.sessions -= 1
+                condition.notify()
+            return
+        async with condition:
+            self.idle.append([generation, session])
+            condition.notify()
+
+    async def ensureHost(self):
+        '''
+        Launches the host browser if it isn't running, and relaunches it if it's unhealthy or due for recycling while no jobs are using it
+        Must be called with the condition held.
+        '''
+        if self.host is not None:
+            expired = (self.hostInfo[1] >= POOL_SETTINGS["maxPages"]) or ((time.monotonic() - self.hostInfo[0]) >= POOL_SETTINGS["maxAge"])
+            healthy = False
+            try:
+                healthy = (await runScript(self.host, "return 1")) == 1
+            except Exception:
+                pass
+            if healthy and ((not expired) or (len(self.active) > 0) or (self.opening > 0)):
+                return
+            await quitDriver(self.host)
+            self.host = None
+        self.host = await self.factory()
+        self.homeHandle = await runBlocking(lambda: self.host.current_window_handle)
+        self.hostInfo = [time.monotonic(), 0]
+        self.generation += 1
+
+    async def attach(self, address):
+        '''
+        Starts a chromedriver session attached to the running host browser
+        Inputs:
+            - address: host:port of the browser's DevTools endpoint
+        Returns: Selenium Webdriver object
+        '''
+        options = webdriver.ChromeOptions()
+        options.debugger_address = address
+        return await runBlocking(webdriver.Chrome, options=options)
+
+    async def warm(self):
+        '''
+        Launches the host browser ahead of the first job
+        '''
+        condition = await self.getCondition()
+        async with condition:
+            try:
+                await self.ensureHost()
+            except Exception as e:
+                print("Couldn't prelaunch " + self.name + " browser: " + str(e))
+
+    async def close(self):
+        '''
+        Quits idle sessions and the host browser
+        '''
+        condition = await self.getCondition()
+        async with condition:
+            for generation, session in self.idle:
+                await quitDriver(session)
+                self.sessions -= 1
+            self.idle = []
+            if self.host is not None:
+                await quitDriver(self.host)
+                self.host = None
+                self.generation += 1
+
+class BlockProfile:
+    '''
+    Set of requests a site's pages never need, blocked through CDP on every driver handed out for the site
+    Values:
+        - urlPatterns: CDP wildcard patterns to block, e.g. "*.example.com/ads/*"
+        - resourceTypes: resource types to block by extension - keys of RESOURCE_PATTERNS
+        - blockTrackers: whether to block TRACKER_PATTERNS as well
+    Anything a module's generateSoup relies on (scripts that load custom part links, pictures we click...) must not be matched.
+    '''
+    def __init__(self, urlPatterns=(), resourceTypes=(), blockTrackers=True):
+        self.urlPatterns = list(urlPatterns)
+        self.resourceTypes = list(resourceTypes)
+        self.blockTrackers = blockTrackers
+
+    async def getPatterns(self):
+        patterns = list(self.urlPatterns)
+        for resourceType in self.resourceTypes:
+            patterns += RESOURCE_PATTERNS[resourceType]
+        if self.blockTrackers:
+            patterns += TRACKER_PATTERNS
+        return patterns
+
+async def applyBlockProfile(driver, profile):
+    '''
+    Blocks a profile's requests in the driver's current tab - the setting sticks across navigations in that tab
+    Inputs:
+        - driver: selenium webdriver object
+        - profile: BlockProfile, or None to unblock everything
+    Returns: N/A
+    '''
+    patterns = []
+    if profile is not None:
+        patterns = await profile.getPatterns()
+    await runBlocking(driver.execute_cdp_cmd, "Network.enable", {})
+    await runBlocking(driver.execute_cdp_cmd, "Network.setBlockedURLs", {"urls": patterns})
+
+async def measurePage(driver):
+    '''
+    Counts the requests and bytes the current page transferred, using the browser's Performance API
+    Inputs:
+        - driver: selenium webdriver object
+    Returns: (requests, bytes) - cross-origin responses without Timing-Allow-Origin report 0 bytes, so bytes are a lower bound
+    '''
+    return tuple(await runScript(driver, '''
+        var entries = performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"));
+        var bytes = 0;
+        for (var i = 0; i < entries.length; i++) { bytes += entries[i].transferSize || 0; }
+        return [entries.length, bytes];
+    '''))
+
+async def recordPage(site, driver):
+    '''
+    Adds the current page's requests and bytes to PAGE_STATS for the site
+    '''
+    requests, bytes = await measurePage(driver)
+    stats = PAGE_STATS.setdefault(site, {"loads": 0, "requests": 0, "bytes": 0})
+    stats["loads"] += 1
+    stats["requests"] += requests
+    stats["bytes"] += bytes
+
+async def getPageStats():
+    '''
+    Returns per-site averages of requests and bytes per list load, as {site: {"loads", "requests", "bytes"}}
+    '''
+    averages = {}
+    for site in PAGE_STATS.keys():
+        stats = PAGE_STATS[site]
+        averages[site] = {"loads": stats["loads"], "requests": stats["requests"] / stats["loads"], "bytes": stats["bytes"] / stats["loads"]}
+    return averages
+
+class SitePool:
+    '''
+    Driver source for one site - hands out drivers from a DriverPool or tabs from a SharedBrowser depending on POOL_SETTINGS["backend"]
+    Values:
+        - factory: async function that launches a configured webdriver for the site
+        - name: name of the site, used for logging
+        - setupContext: async function(driver) that prepares a shared-browser tab for a job, or None if the site can't share a browser
+        - blockProfile: BlockProfile applied to every driver handed out, or None to load everything
+        - backend: DriverPool or SharedBrowser, picked on first use so .env settings loaded at startup still apply
+    '''
+    def __init__(self, factory, name, setupContext=None, blockProfile=None):
+        self.factory = factory
+        self.name = name
+        self.setupContext = setupContext
+        self.blockProfile = blockProfile
+        self.backend = None
+
+    async def getBackend(self):
+        if self.backend is None:
+            if (POOL_SETTINGS["backend"] == "shared") and (self.setupContext is not None):
+                self.backend = SharedBrowser(self.factory, self.setupContext, self.name)
+            else:
+                self.backend = DriverPool(self.factory, self.name)
+        return self.backend
+
+    async def checkout(self):
+        backend = await self.getBackend()
+        driver = await backend.checkout()
+        if self.blockProfile is not None:
+            #blocking is per tab, so shared-browser tabs need it every time - it's one cheap CDP call either way
+            try:
+                await applyBlockProfile(driver, self.blockProfile)
+            except Exception:
+                await backend.checkin(driver, 0, False)
+                raise
+        return driver
+
+    async def checkin(self, driver, pages=1, healthy=True):
+        return await (await self.getBackend()).checkin(driver, pages, healthy)
+
+    async def warm(self):
+        return await (await self.getBackend()).warm()
+
+    async def close(self):
+        return await (await self.getBackend()).close()
+
+class NeedsBrowser(Exception):
+    '''
+    Raised by a link resolver called without a driver when it can't get its answer from plain HTTP
+    '''
+    pass
+
+class NotAList(Exception):
+    '''
+    Raised by a link resolver when the page loaded fine but doesn't lead to a list - private, deleted or malformed
+    Only this is remembered as a dead link by the caches - any other error could be a flaky load, so the link is tried again next time.
+    '''
+    pass
+
+async def fetchHtml(url):
+    '''
+    Fetches a page over plain HTTP with a rotated user agent, on the shared connection pool
+    Inputs:
+        - url: page url
+    Returns: (html, final url after redirects), or (None, None) if the request failed or returned an error status
+    '''
+    global httpSession
+    if (httpSession is None) or httpSession.closed:
+        httpSession = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS, ttl_dns_cache=300), timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+    #look like the browsers we'd otherwise send
+    headers = {
+        "User-Agent": choice(await getUserAgents()),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    }
+    try:
+        async with httpSession.get(url, headers=headers, allow_redirects=True) as response:
+            if response.status != 200:
+                return (None, None)
+            return (await response.text(), str(response.url))
+    except Exception:
+        return (None, None)
+
+async def fetchSoup(url, regions=None):
+    '''
+    Fetches a page over plain HTTP and parses it on the driver thread pool
+    Inputs:
+        - url: page url
+        - regions: selectors for the parts of the page to keep, see parseRegions() - None keeps the whole page
+    Returns: BeautifulSoup object, or None if the request failed
+    '''
+    html, finalUrl = await fetchHtml(url)
+    if html is None:
+        return None
+    return await parseHtml(html, regions)
+
+async def countTier(site, tier):
+    '''
+    Records which tier served a page load for the site
+    Inputs:
+        - site: site name
+        - tier: "http" or "browser"
+    '''
+    stats = TIER_STATS.setdefault(site, {"http": 0, "browser": 0})
+    stats[tier] += 1
+
+async def getTierStats():
+    '''
+    Returns per-site tier counts plus the share of loads served over plain HTTP, as {site: {"http", "browser", "httpRate"}}
+    '''
+    summary = {}
+    for site in TIER_STATS.keys():
+        stats = TIER_STATS[site]
+        summary[site] = {"http": stats["http"], "browser": stats["browser"], "httpRate": stats["http"] / (stats["http"] + stats["browser"])}
+    return summary
+
+class SiteLimiter:
+    '''
+    Concurrency limit and token bucket for one site
+    Values:
+        - site: site module name
+        - limit: most loads at once
+        - rate: loads per second the bucket refills at
+        - burst: most tokens the bucket holds
+        - slots: asyncio.Semaphore with limit slots
+        - tokens: tokens in the bucket as of updated
+        - updated: time.monotonic() the bucket was last refilled
+        - waiting: loads queued for a slot or a token
+        - active: loads running
+    '''
+    def __init__(self, site, limit, rate, burst):
+        self.site = site
+        self.limit = limit
+        self.rate = rate
+        self.burst = burst
+        self.slots = asyncio.Semaphore(limit)
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.active = 0
+
+    async def takeToken(self):
+        '''
+        Waits until the bucket has a token and takes it
+        '''
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + ((now - self.updated) * self.rate))
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        '''
+        Waits for a slot, then for a token - release() must be called once the load is done
+        '''
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+            try:
+                await self.takeToken()
+            except BaseException:
+                self.slots.release()
+                raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    async def release(self):
+        '''
+        Gives back the slot taken by acquire()
+        '''
+        self.active -= 1
+        self.slots.release()
+
+class Scheduler:
+    '''
+    Limits how hard the bot hits each site - every list load and link resolution waits for a slot (at most limit at once)
+    and a token (refilled at rate, so bursts of messages are spread out instead of tripping the site's rate limiting)
+    Values:
+        - limiters: dict of site module name to SiteLimiter, created on first use
+    Limits come from sites.Site.concurrency and sites.Site.rate, then SCHEDULE_SETTINGS.
+    '''
+    def __init__(self):
+        self.limiters = {}
+
+    async def getLimiter(self, site):
+        '''
+        Returns the SiteLimiter for a site, creating it with the configured limits on first use
+        Inputs:
+            - site: site module name
+        '''
+        if site not in self.limiters.keys():
+            limit = SCHEDULE_SETTINGS.get("concurrency." + site)
+            rate = SCHEDULE_SETTINGS.get("rate." + site)
+            if site in sites.SITES.keys():
+                if limit is None:
+                    limit = sites.SITES[site].concurrency
+                if rate is None:
+                    rate = sites.SITES[site].rate
+            limit = SCHEDULE_SETTINGS["concurrency"] if limit is None else limit
+            rate = SCHEDULE_SETTINGS["rate"] if rate is None else rate
+            self.limiters[site] = SiteLimiter(site, max(1, limit), max(1, rate) / 60, max(1, SCHEDULE_SETTINGS["burst"]))
+        return self.limiters[site]
+
+    async def run(self, site, job, *args):
+        '''
+        Runs a page load once the site has a free slot and a token
+        Inputs:
+            - site: site module name
+            - job: async function doing the load
+            - args: passed through to job
+        Returns: whatever job returns - exceptions are re-raised in the caller
+        '''
+        limiter = await self.getLimiter(site)
+        await limiter.acquire()
+        try:
+            return await job(*args)
+        finally:
+            await limiter.release()
+
+    async def getStats(self):
+        '''
+        Returns each site's queue depth and limits, as {site: {"waiting", "active", "limit", "rate" (per minute), "tokens"}}
+        '''
+        summary = {}
+        for site in self.limiters.keys():
+            limiter = self.limiters[site]
+            summary[site] = {"waiting": limiter.waiting, "active": limiter.active, "limit": limiter.limit, "rate": limiter.rate * 60, "tokens": limiter.tokens}
+        return summary
+
+#scheduler for every page load made by this process
+scheduler = Scheduler()
+
+class LocalScraper:
+    '''
+    Runs the page loads for one site in this process, on drivers checked out from the site's pool
+    Values:
+        - pool: DriverPool of the site
+        - site: name of the site module, e.g. "pcpp" - the scheduler and stats are keyed by it
+        - scheduled: whether loads wait for the site's slot and rate token in the scheduler
+    Messages and lists only ever talk to a scraper through loadList() and resolve(), so workers.RemoteScraper can stand in for this class.
+    '''
+    def __init__(self, pool, site, scheduled=True):
+        '''
+        Inputs:
+            - pool, site: as in Values
+            - scheduled: False if the caller has already scheduled the load, e.g. in a worker process running a job for the bot process
+        '''
+        self.pool = pool
+        self.site = site
+        self.scheduled = scheduled
+
+    async def loadList(self, buildList):
+        '''
+        Loads a list over plain HTTP if the site supports it and the page has everything we need,
+        otherwise checks out a driver and runs the list's generateSoup on it
+        Inputs:
+            - buildList: BuildList child object
+        Returns: N/A, but the list's soup and result are filled in
+        '''
+        if self.scheduled:
+            return await scheduler.run(self.site, self.loadUnscheduled, buildList)
+        return await self.loadUnscheduled(buildList)
+
+    async def loadUnscheduled(self, buildList):
+        '''
+        loadList() without waiting for the scheduler
+        '''
+        if await buildList.fetchSoup():
+            await countTier(self.site, "http")
+        else:
+            buildList.soup = None
+            driver = await self.pool.checkout()
+            healthy = False
+            try:
+                await buildList.generateSoup(driver)
+                healthy = True
+                await countTier(self.site, "browser")
+                if POOL_SETTINGS["measurePages"]:
+                    await recordPage(self.site, driver)
+            finally:
+                #a driver that failed mid-page could be hung or stuck on a half loaded page, so it's retired rather than reused
+                await self.pool.checkin(driver, healthy=healthy)
+        buildList.result = await buildList.parse()
+
+    async def resolve(self, resolver, *args):
+        '''
+        Runs a link resolver, e.g. to turn a completed build link into its part list link
+        Inputs:
+            - resolver: module-level async function of the form resolver(driver, *args) - must be module-level so worker processes can look it up by name
+            - args: passed through to the resolver
+        Returns: whatever the resolver returns - exceptions are re-raised in the caller
+        Resolvers are first called with driver=None to try plain HTTP - they raise NeedsBrowser if they can't, and get a real driver next.
+        '''
+        if self.scheduled:
+            return await scheduler.run(self.site, self.resolveUnscheduled, resolver, *args)
+        return await self.resolveUnscheduled(resolver, *args)
+
+    async def resolveUnscheduled(self, resolver, *args):
+        '''
+        resolve() without waiting for the scheduler
+        '''
+        try:
+            result = await resolver(None, *args)
+            await countTier(self.site, "http")
+            return result
+        except NeedsBrowser:
+            pass
+        driver = await self.pool.checkout()
+        healthy = False
+        try:
+            result = await resolver(driver, *args)
+            healthy = True
+            await countTier(self.site, "browser")
+            return result
+        finally:
+            await self.pool.checkin(driver, healthy=healthy)
+
+def loadPoolSettings():
+    '''
+    Reads webdriver pool settings from the environment and updates the global defaults
+    Inputs: None
+    Returns: N/A
+    Recognized variables are POOL_MIN, POOL_MAX, POOL_MAX_PAGES, POOL_MAX_AGE (in minutes), DRIVER_BACKEND (pool or shared) and MEASURE_PAGES (1 to enable),
+    plus HTML_PARSER (lxml or html.parser) and SELECTOLAX (1 to enable) for PARSE_SETTINGS,
+    and SITE_CONCURRENCY, SITE_RATE (loads per minute) and SITE_BURST for SCHEDULE_SETTINGS - SITE_CONCURRENCY_<SITE> and SITE_RATE_<SITE> (e.g. SITE_RATE_PCPP) set a single site's limits.
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    variables = {"POOL_MIN": ("minSize", 1), "POOL_MAX": ("maxSize", 1), "POOL_MAX_PAGES": ("maxPages", 1), "POOL_MAX_AGE": ("maxAge", 60)}
+    for variable in variables.keys():
+        key, scale = variables[variable]
+        try:
+            POOL_SETTINGS[key] = int(os.getenv(variable)) * scale
+        except Exception: #unset or malformed - keep the default
+            pass
+    backend = str(os.getenv("DRIVER_BACKEND")).strip().lower()
+    if backend in ["pool", "shared"]:
+        POOL_SETTINGS["backend"] = backend
+    POOL_SETTINGS["measurePages"] = (os.getenv("MEASURE_PAGES") in ["1", "true", "True"])
+    parser = str(os.getenv("HTML_PARSER")).strip().lower()
+    if (parser == "html.parser") or ((parser == "lxml") and (HTML_PARSER == "lxml")):
+        PARSE_SETTINGS["parser"] = parser
+    PARSE_SETTINGS["selectolax"] = (os.getenv("SELECTOLAX") in ["1", "true", "True"]) and (LexborHTMLParser is not None)
+    variables = {"SITE_CONCURRENCY": "concurrency", "SITE_RATE": "rate", "SITE_BURST": "burst"}
+    for site in sites.SITES.keys():
+        variables["SITE_CONCURRENCY_" + site.upper()] = "concurrency." + site
+        variables["SITE_RATE_" + site.upper()] = "rate." + site
+    for variable in variables.keys():
+        try:
+            SCHEDULE_SETTINGS[variables[variable]] = float(os.getenv(variable)) if variable.startswith("SITE_RATE") else int(os.getenv(variable))
+        except Exception:
+            pass
+
+async def runBlocking(func, *args, **kwargs):
+    '''
+    Runs a blocking function on the driver thread pool and waits for it without blocking the event loop
+    Inputs:
+        - func: any synchronous callable
+        - args, kwargs: passed through to func
+    Returns: whatever func returns - exceptions are re-raised in the caller
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(driverExecutor, lambda: func(*args, **kwargs))
+
+async def getPage(driver, url):
+    '''
+    Loads a url in the given driver
+    '''
+    return await runBlocking(driver.get, url)
+
+async def getCurrentUrl(driver):
+    return await runBlocking(lambda: driver.current_url)
+
+async def findElement(parent, by, value):
+    '''
+    Finds a single element - parent can be a driver, an element or a shadow root
+    Raises the usual selenium exception if nothing is found
+    '''
+    return await runBlocking(parent.find_element, by, value)
+
+async def findElements(parent, by, value):
+    '''
+    Finds all matching elements - parent can be a driver, an element or a shadow root
+    '''
+    return await runBlocking(parent.find_elements, by, value)
+
+async def click(element):
+    return await runBlocking(element.click)
+
+async def getAttribute(element, name):
+    return await runBlocking(element.get_attribute, name)
+
+async def getShadowRoot(element):
+    return await runBlocking(lambda: element.shadow_root)
+
+async def runScript(driver, script, *args):
+    '''
+    Runs javascript in the current page and returns its result
+    '''
+    return await runBlocking(driver.execute_script, script, *args)
+
+async def runAsyncScript(driver, script, timeout, *args):
+    '''
+    Runs asynchronous javascript in the current page - the script gets a callback as its last argument and returns by calling it
+    Inputs:
+        - driver: selenium webdriver object
+        - script: javascript function body
+        - timeout: seconds the script may take, including any waiting it does in the page
+        - args: passed to the script as arguments[0...]
+    Returns: the value passed to the callback
+    '''
+    def run():
+        #the script timeout has to outlast the script's own deadline
+        driver.set_script_timeout(timeout + 5)
+        return driver.execute_async_script(script, *args)
+    return await runBlocking(run)
+
+async def implicitlyWait(driver, seconds):
+    return await runBlocking(driver.implicitly_wait, seconds)
+
+async def waitUntil(driver, condition, timeout, pollFrequency=0.5):
+    '''
+    Runs a selenium WebDriverWait on the driver thread pool
+    Inputs:
+        - driver: selenium webdriver object
+        - condition: expected condition, e.g. EC.presence_of_element_located(...)
+        - timeout: seconds to wait before raising TimeoutException
+        - pollFrequency: seconds between checks
+    Returns: the result of the condition
+    '''
+    return await runBlocking(lambda: WebDriverWait(driver, timeout=timeout, poll_frequency=pollFrequency).until(condition))
+
+class Ready:
+    '''
+    Base class for readiness conditions - a condition is a javascript expression that evaluates to true once the page is ready
+    Values:
+        - script: javascript expression
+        - description: human readable description for logs
+    Site modules declare lists of these and pass them to waitReady() instead of sleeping.
+    '''
+    def __init__(self, script, description):
+        self.script = script
+        self.description = description
+
+class SelectorPresent(Ready):
+    '''
+    Ready once at least one element matches the css selector
+    '''
+    def __init__(self, selector):
+        super().__init__("(document.querySelector(" + json.dumps(selector) + ") !== null)", "element " + selector + " present")
+
+class TextNot(Ready):
+    '''
+    Ready once no element matching the css selector contains the given text, e.g. a "Loading..." placeholder
+    '''
+    def __init__(self, selector, text):
+        super().__init__("Array.prototype.every.call(document.querySelectorAll(" + json.dumps(selector) + "), function(e) { return e.textContent.indexOf(" + json.dumps(text) + ") < 0; })",
+            "no " + selector + " containing " + text)
+
+class DomStable(Ready):
+    '''
+    Ready once the DOM hasn't changed for the given number of milliseconds
+    '''
+    def __init__(self, ms):
+        #the first check installs a mutation observer, later checks compare against the last mutation it saw
+        super().__init__("""(function() {
+            if (window.__withersLastMutation === undefined) {
+                window.__withersLastMutation = performance.now();
+                new MutationObserver(function() { window.__withersLastMutation = performance.now(); })
+                    .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+                return false;
+            }
+            return (performance.now() - window.__withersLastMutation) >= """ + str(int(ms)) + """;
+        })()""", "DOM stable for " + str(ms) + "ms")
+
+class ScriptTrue(Ready):
+    '''
+    Ready once an arbitrary javascript expression is true - for one-off conditions that don't fit the classes above
+    '''
+    def __init__(self, script, description="custom condition"):
+        super().__init__(script, description)
+
+async def waitReady(driver, conditions, timeout=10, pollMs=50):
+    '''
+    Waits until every condition is met in the current page, polling inside the page so the whole wait is a single webdriver round trip
+    Inputs:
+        - driver: selenium webdriver object
+        - conditions: list of Ready objects - all of them must be met
+        - timeout: seconds to wait before giving up
+        - pollMs: milliseconds between checks
+    Returns: True if the page became ready, False if we timed out - callers carry on either way, the parser decides if the list is usable
+    '''
+    if len(conditions) == 0:
+        return True
+    check = " && ".join(["(" + condition.script + ")" for condition in conditions])
+    script = """
+        var done = arguments[arguments.length - 1];
+        var deadline = performance.now() + """ + str(int(timeout * 1000)) + """;
+        function poll() {
+            var ready = false;
+            try { ready = !!(""" + check + """); } catch (e) {}
+            if (ready || (performance.now() >= deadline)) { done(ready); } else { setTimeout(poll, """ + str(int(pollMs)) + """); }
+        }
+        poll();
+    """
+    try:
+        ready = await runAsyncScript(driver, script, timeout)
+    except Exception as e:
+        print("Readiness check failed: " + str(e))
+        return False
+    if not ready:
+        print("Page not ready after " + str(timeout) + "s waiting for: " + ", ".join([condition.description for condition in conditions]))
+    return ready
+
+async def makeSoup(driver, regions=None):
+    '''
+    Reads the current page source and parses it with beautifulsoup, all on the driver thread pool
+    Inputs:
+        - driver: selenium webdriver object
+        - regions: selectors for the parts of the page to keep, see parseRegions() - None keeps the whole page
+    Returns: BeautifulSoup object
+    '''
+    return await runBlocking(lambda: parseRegions(driver.page_source, regions))
+
+async def parseHtml(html, regions=None):
+    '''
+    Parses html with beautifulsoup on the driver thread pool
+    Inputs:
+        - html: page source as string
+        - regions: selectors for the parts of the page to keep, see parseRegions() - None keeps the whole page
+    Returns: BeautifulSoup object
+    '''
+    return await runBlocking(parseRegions, html, regions)
+
+#region selectors - a tag name, an #id, a .class, or a tag with one of the other two
+REGION_PATTERN = re.compile(r"^([a-zA-Z][\w-]*)?(?:#([\w-]+))?(?:\.([\w-]+))?$")
+
+def regionStrainer(regions):
+    '''
+    Builds a SoupStrainer that keeps every element matching one of the region selectors, along with everything inside it
+    Inputs:
+        - regions: list of selector strings
+    Returns: SoupStrainer object
+    '''
+    specs = []
+    for region in regions:
+        match = REGION_PATTERN.match(region)
+        if (match is None) or (match.group(0) == ""):
+            raise ValueError("Unsupported region selector " + region)
+        specs.append(match.groups())
+
+    def matches(name, attrs):
+        attrs = attrs or {}
+        for tag, id, cls in specs:
+            if (tag is not None) and (name != tag):
+                continue
+            if (id is not None) and (attrs.get("id") != id):
+                continue
+            if cls is not None:
+                #class is still the raw attribute string while parsing
+                classes = attrs.get("class", "")
+                if isinstance(classes, str):
+                    classes = classes.split()
+                if cls not in classes:
+                    continue
+            return True
+        return False
+
+    return SoupStrainer(matches)
+
+def sliceRegions(html, regions):
+    '''
+    Cuts the matching regions out of a page with selectolax, so beautifulsoup only has to parse those
+    Inputs:
+        - html: page source as string
+        - regions: list of selector strings
+    Returns: html of each outermost matching element, concatenated in page order
+    '''
+    kept = set()
+    fragments = []
+    for node in LexborHTMLParser(html).css(", ".join(regions)):
+        #elements inside a region we already have would otherwise show up twice
+        parent = node.parent
+        while (parent is not None) and (parent.mem_id not in kept):
+            parent = parent.parent
+        if parent is None:
+            kept.add(node.mem_id)
+            fragments.append(node.html)
+    return "".join(fragments)
+
+def parseRegions(html, regions=None, parser=None, selectolax=None):
+    '''
+    Parses only the given regions of a page, with the backend from PARSE_SETTINGS
+    Inputs:
+        - html: page source as string
+        - regions: list of selector strings, or None for the whole page
+        - parser, selectolax: override PARSE_SETTINGS, for benchmarks
+    Returns: BeautifulSoup object containing the outermost matching elements in page order
+    Not async as this runs on the driver thread pool - use makeSoup(), parseHtml() or fetchSoup() instead of calling this directly
+    '''
+    if parser is None:
+        parser = PARSE_SETTINGS["parser"]
+    if selectolax is None:
+        selectolax = PARSE_SETTINGS["selectolax"]
+    if not regions:
+        return BeautifulSoup(html, parser)
+    if selectolax:
+        html = sliceRegions(html, regions)
+    return BeautifulSoup(html, parser, parse_only=regionStrainer(regions))
+
+async def quitDriver(driver):
+    '''
+    Quits a driver, ignoring errors from browsers that are already gone
+    '''
+    try:
+        await runBlocking(driver.quit)
+    except Exception:
+        pass
+
 def updateUserAgents():
     '''
     Pulls the latest user agents from Useragents.me and updates the global definitions
@@ -0,0 +1,151 @@
+'''
+Withers Bot Store
+Optional on-disk copy of the caches, so a restart or deploy doesn't start with nothing cached
+Snapshots are kept in a local SQLite database - each row is compressed JSON with the time it was saved and when it expires, so every site keeps its own ttl across restarts.
+All database work runs on a dedicated thread, and saves are never waited on, so disk I/O can't hold up a message.
+'''
+import os
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+#global defaults for the snapshot store - can be overridden from .env, see loadStoreSettings()
+STORE_SETTINGS = {
+    "path": None, #database file, or None to keep everything in memory only
+    "level": 6, #zlib compression level
+}
+
+#seconds a connection waits for another process' write to finish before giving up
+BUSY_TIMEOUT = 5
+
+#one thread owns the connection, so saves are written in the order they were made and never run alongside a load
+storeExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="withers-store")
+
+class SnapshotStore:
+    '''
+    SQLite table of cached values that survives restarts
+    Values:
+        - path: database file
+        - connection: sqlite3 connection, only ever used on storeExecutor
+        - pending: saves that haven't been written yet
+    Rows are keyed by kind and key - kind is what the value is ("list" for parsed lists, "resolve" for resolved links) and key its canonical url.
+    The database is opened in WAL mode so any number of bot processes on the same host can read it while one of them writes.
+    '''
+    def __init__(self, path):
+        '''
+        Opens the database, creating it if needed, and drops anything that's already expired
+        Inputs:
+            - path: database file
+        '''
+        self.path = path
+        self.pending = set()
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS snapshots (kind TEXT NOT NULL, key TEXT NOT NULL, site TEXT NOT NULL, saved REAL NOT NULL, expires REAL NOT NULL, data BLOB NOT NULL, PRIMARY KEY (kind, key))")
+        self.connection.execute("DELETE FROM snapshots WHERE expires <= ?", (time.time(),))
+
+    async def run(self, func, *args):
+        '''
+        Runs a blocking database function on the store thread
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(storeExecutor, lambda: func(*args))
+
+    def write(self, kind, key, site, saved, expires, data):
+        '''
+        Compresses and writes one row - runs on the store thread, so compressing doesn't hold up the event loop either
+        '''
+        blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode(), STORE_SETTINGS["level"])
+        self.connection.execute("INSERT OR REPLACE INTO snapshots (kind, key, site, saved, expires, data) VALUES (?, ?, ?, ?, ?, ?)", (kind, key, site, saved, expires, blob))
+
+    def read(self, kind, limit, now):
+        '''
+        Reads and decompresses every live row of a kind, newest first so a limit keeps the ones most likely to be posted again - runs on the store thread
+        '''
+        rows = self.connection.execute("SELECT key, site, saved, expires, data FROM snapshots WHERE kind = ? AND expires > ? ORDER BY saved DESC LIMIT ?", (kind, now, -1 if limit is None else limit)).fetchall()
+        return [(key, site, saved, expires, json.loads(zlib.decompress(data))) for key, site, saved, expires, data in rows]
+
+    async def save(self, kind, site, key, data, ttl):
+        '''
+        Saves a value in the background - returns straight away, the write happens on the store thread
+        Inputs:
+            - kind: "list" or "resolve"
+            - site: site module name
+            - key: canonical url
+            - data: JSON-serializable value, e.g. ListResult.toDict() output
+            - ttl: seconds until the value expires
+        Returns: N/A - a failed write is printed and otherwise ignored, the value is still cached in memory
+        '''
+        now = time.time()
+        future = asyncio.get_running_loop().run_in_executor(storeExecutor, self.write, kind, key, site, now, now + ttl, data)
+        self.pending.add(future)
+        future.add_done_callback(self.saved)
+
+    def saved(self, future):
+        '''
+        Done callback for save() - runs on the event loop
+        '''
+        self.pending.discard(future)
+        if (not future.cancelled()) and (future.exception() is not None):
+            print("Snapshot store: " + str(future.exception()))
+
+    async def load(self, kind, limit=None):
+        '''
+        Reads every live value of a kind
+        Inputs:
+            - kind: "list" or "resolve"
+            - limit: most values to read, newest first - None reads them all
+        Returns: list of (key, site, seconds left before it expires, data), oldest first
+        '''
+        now = time.time()
+        rows = await self.run(self.read, kind, limit, now)
+        return [(key, site, expires - now, data) for key, site, saved, expires, data in reversed(rows)]
+
+    async def flush(self):
+        '''
+        Waits for every save made so far to be written
+        '''
+        if len(self.pending) > 0:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    async def close(self):
+        '''
+        Writes any pending saves and closes the database
+        '''
+        await self.flush()
+        await self.run(self.connection.close)
+
+def loadStoreSettings():
+    '''
+    Reads snapshot store settings from the environment and updates the global defaults
+    Inputs: None
+    Returns: N/A
+    Recognized variables are SNAPSHOT_DB (database file - unset keeps the caches in memory only) and SNAPSHOT_LEVEL (zlib compression level, 1-9).
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    path = os.getenv("SNAPSHOT_DB")
+    if (path is not None) and (len(path.strip()) > 0):
+        STORE_SETTINGS["path"] = path.strip()
+    try:
+        STORE_SETTINGS["level"] = min(9, max(1, int(os.getenv("SNAPSHOT_LEVEL"))))
+    except Exception: #unset or malformed - keep the default
+        pass
+
+def openStore():
+    '''
+    Opens the snapshot store if one is configured
+    Inputs: None
+    Returns: SnapshotStore object, or None if SNAPSHOT_DB isn't set or the database can't be opened
+    Not async as this function is meant to be called while initializing the bot
+    '''
+    if STORE_SETTINGS["path"] is None:
+        return None
+    try:
+        return SnapshotStore(STORE_SETTINGS["path"])
+    except Exception as error:
+        print("Snapshot store: couldn't open " + STORE_SETTINGS["path"] + " - " + str(error))
+        return None
@@ -0,0 +1,278 @@
+'''
+Withers Bot Translations
+Offline english names for the categories and labels we read from non-english sites
+Only the handful of strings we actually display need translating, so this replaces running chrome's translator on every page.
+'''
+
+#category and label names by source language, keyed in lowercase with single spaces - see normalize()
+#anything missing falls back to the original text and gets logged once, so check the bot's output when a site adds a category
+TABLES = {
+    #geizhals.de/.at and buildapc.gg/de
+    "de": {
+        "prozessoren (cpus)": "Processors (CPUs)",
+        "prozessoren": "Processors",
+        "prozessor": "Processor",
+        "mainboards": "Motherboards",
+        "mainboard": "Motherboard",
+        "arbeitsspeicher (ram)": "Memory (RAM)",
+        "arbeitsspeicher": "Memory",
+        "speicher": "Memory",
+        "grafikkarten": "Graphics Cards",
+        "grafikkarte": "Graphics Card",
+        "solid state drives (ssd)": "Solid State Drives (SSD)",
+        "festplatten (hdd)": "Hard Drives (HDD)",
+        "festplatten": "Hard Drives",
+        "festplatte": "Hard Drive",
+        "netzteile": "Power Supplies",
+        "netzteil": "Power Supply",
+        "pc-gehäuse": "Cases",
+        "gehäuse": "Case",
+        "cpu-kühler": "CPU Coolers",
+        "wasserkühlungen": "Water Cooling",
+        "wasserkühlung": "Water Cooling",
+        "lüfter": "Fans",
+        "wärmeleitpaste": "Thermal Paste",
+        "wärmeleitpasten": "Thermal Paste",
+        "monitore": "Monitors",
+        "monitor": "Monitor",
+        "betriebssysteme": "Operating Systems",
+        "betriebssystem": "Operating System",
+        "tastaturen": "Keyboards",
+        "tastatur": "Keyboard",
+        "mäuse": "Mice",
+        "maus": "Mouse",
+        "soundkarten": "Sound Cards",
+        "netzwerkkarten": "Network Cards",
+        "wlan-adapter": "WiFi Adapters",
+        "optische laufwerke": "Optical Drives",
+        "kabel": "Cables",
+        "headsets": "Headsets",
+        "lautsprecher": "Speakers",
+        "lagerung": "Storage",
+    },
+    #cenowarka.pl
+    "pl": {
+        "procesory (cpu)": "Processors (CPUs)",
+        "procesory": "Processors",
+        "płyty główne": "Motherboards",
+        "pamięć ram": "Memory (RAM)",
+        "pamięci ram": "Memory (RAM)",
+        "karty graficzne": "Graphics Cards",
+        "dyski ssd": "Solid State Drives (SSD)",
+        "dyski twarde (hdd)": "Hard Drives (HDD)",
+        "dyski twarde": "Hard Drives",
+        "zasilacze": "Power Supplies",
+        "obudowy": "Cases",
+        "chłodzenie procesora": "CPU Coolers",
+        "chłodzenia procesora": "CPU Coolers",
+        "chłodzenie wodne": "Water Cooling",
+        "wentylatory": "Fans",
+        "pasty termoprzewodzące": "Thermal Paste",
+        "monitory": "Monitors",
+        "systemy operacyjne": "Operating Systems",
+        "klawiatury": "Keyboards",
+        "myszy": "Mice",
+        "karty dźwiękowe": "Sound Cards",
+        "karty sieciowe": "Network Cards",
+        "napędy optyczne": "Optical Drives",
+        "kable": "Cables",
+        "słuchawki": "Headsets",
+        "głośniki": "Speakers",
+    },
+    #tweakers.net
+    "nl": {
+        "processors": "Processors",
+        "moederborden": "Motherboards",
+        "geheugen intern": "Memory",
+        "videokaarten": "Graphics Cards",
+        "solid state drives": "Solid State Drives",
+        "interne harde schijven": "Hard Drives",
+        "voedingen": "Power Supplies",
+        "behuizingen": "Cases",
+        "processorkoeling": "CPU Coolers",
+        "waterkoeling": "Water Cooling",
+        "ventilatoren": "Fans",
+        "koelpasta": "Thermal Paste",
+        "monitoren": "Monitors",
+        "besturingssystemen": "Operating Systems",
+        "toetsenborden": "Keyboards",
+        "muizen": "Mice",
+        "geluidskaarten": "Sound Cards",
+        "netwerkadapters": "Network Adapters",
+        "bluray- en dvd-drives": "Optical Drives",
+        "kabels en adapters": "Cables and Adapters",
+        "headsets": "Headsets",
+        "speakers": "Speakers",
+        "case fans": "Case Fans",
+    },
+    #komponentkoll.se
+    "sv": {
+        "processor": "CPU",
+        "moderkort": "Motherboard",
+        "grafikkort": "Graphics Card",
+        "minne": "Memory",
+        "ram-minne": "Memory",
+        "lagring": "Storage",
+        "hårddisk": "Hard Drive",
+        "nätaggregat": "Power Supply",
+        "chassi": "Case",
+        "processorkylare": "CPU Cooler",
+        "cpu-kylare": "CPU Cooler",
+        "vattenkylning": "Water Cooling",
+        "fläktar": "Fans",
+        "fläkt": "Fan",
+        "kylpasta": "Thermal Paste",
+        "skärm": "Monitor",
+        "operativsystem": "Operating System",
+        "tangentbord": "Keyboard",
+        "mus": "Mouse",
+        "hörlurar": "Headphones",
+        "högtalare": "Speakers",
+        "nätverkskort": "Network Card",
+        "ljudkort": "Sound Card",
+        "tillbehör": "Accessories",
+    },
+    #buildapc.gg/dk
+    "da": {
+        "processor": "CPU",
+        "bundkort": "Motherboard",
+        "grafikkort": "Graphics Card",
+        "hukommelse": "Memory",
+        "ram": "Memory",
+        "lager": "Storage",
+        "lagring": "Storage",
+        "harddisk": "Hard Drive",
+        "strømforsyning": "Power Supply",
+        "kabinet": "Case",
+        "cpu-køler": "CPU Cooler",
+        "processorkøler": "CPU Cooler",
+        "vandkøling": "Water Cooling",
+        "blæsere": "Fans",
+        "blæser": "Fan",
+        "kølepasta": "Thermal Paste",
+        "skærm": "Monitor",
+        "styresystem": "Operating System",
+        "tastatur": "Keyboard",
+        "mus": "Mouse",
+        "høretelefoner": "Headphones",
+        "højttalere": "Speakers",
+        "netværkskort": "Network Card",
+        "lydkort": "Sound Card",
+        "tilbehør": "Accessories",
+    },
+    #buildapc.gg/no
+    "no": {
+        "prosessor": "CPU",
+        "hovedkort": "Motherboard",
+        "skjermkort": "Graphics Card",
+        "minne": "Memory",
+        "lagring": "Storage",
+        "harddisk": "Hard Drive",
+        "strømforsyning": "Power Supply",
+        "kabinett": "Case",
+        "cpu-kjøler": "CPU Cooler",
+        "prosessorkjøler": "CPU Cooler",
+        "vannkjøling": "Water Cooling",
+        "vifter": "Fans",
+        "vifte": "Fan",
+        "kjølepasta": "Thermal Paste",
+        "skjerm": "Monitor",
+        "operativsystem": "Operating System",
+        "tastatur": "Keyboard",
+        "mus": "Mouse",
+        "hodetelefoner": "Headphones",
+        "høyttalere": "Speakers",
+        "nettverkskort": "Network Card",
+        "lydkort": "Sound Card",
+        "tilbehør": "Accessories",
+    },
+    #meupc.net
+    "pt": {
+        "processador": "CPU",
+        "placa-mãe": "Motherboard",
+        "placa mãe": "Motherboard",
+        "memória": "Memory",
+        "memória ram": "Memory",
+        "placa de vídeo": "Graphics Card",
+        "armazenamento": "Storage",
+        "ssd": "SSD",
+        "hd": "Hard Drive",
+        "fonte": "Power Supply",
+        "fonte de alimentação": "Power Supply",
+        "gabinete": "Case",
+        "cooler": "CPU Cooler",
+        "cooler para processador": "CPU Cooler",
+        "water cooler": "Water Cooler",
+        "ventoinha": "Fans",
+        "ventoinhas": "Fans",
+        "fan": "Fans",
+        "pasta térmica": "Thermal Paste",
+        "monitor": "Monitor",
+        "sistema operacional": "Operating System",
+        "teclado": "Keyboard",
+        "mouse": "Mouse",
+        "headset": "Headset",
+        "fone de ouvido": "Headphones",
+        "caixa de som": "Speakers",
+        "placa de rede": "Network Card",
+        "placa de som": "Sound Card",
+        "acessórios": "Accessories",
+    },
+    #hinta.fi
+    "fi": {
+        "prosessorit": "Processors",
+        "emolevyt": "Motherboards",
+        "muistit": "Memory",
+        "keskusmuistit": "Memory",
+        "näytönohjaimet": "Graphics Cards",
+        "ssd-levyt": "SSDs",
+        "kiintolevyt": "Hard Drives",
+        "virtalähteet": "Power Supplies",
+        "kotelot": "Cases",
+        "prosessorijäähdyttimet": "CPU Coolers",
+        "vesijäähdytys": "Water Cooling",
+        "tuulettimet": "Fans",
+        "kotelotuulettimet": "Case Fans",
+        "lämpötahnat": "Thermal Paste",
+        "näytöt": "Monitors",
+        "käyttöjärjestelmät": "Operating Systems",
+        "näppäimistöt": "Keyboards",
+        "hiiret": "Mice",
+        "kuulokkeet": "Headphones",
+        "kaiuttimet": "Speakers",
+        "verkkokortit": "Network Cards",
+        "äänikortit": "Sound Cards",
+        "kaapelit": "Cables",
+    },
+}
+
+#strings we've already complained about, so a popular untranslated category doesn't spam the log
+missing = set()
+
+def normalize(text):
+    '''
+    Reduces a string to the form used as a table key - lowercase, with runs of whitespace collapsed to single spaces
+    Inputs:
+        - text: string as read from the page
+    Returns: normalized string
+    '''
+    return " ".join(text.split()).lower()
+
+async def translate(text, language):
+    '''
+    Translates a category or label into english using the offline tables
+    Inputs:
+        - text: string as read from the page
+        - language: two letter source language code, or None if the page is already in english
+    Returns: english string, or the original text stripped of surrounding whitespace if we don't know it
+    '''
+    text = text.strip()
+    if (language is None) or (language not in TABLES.keys()):
+        return text
+    key = normalize(text)
+    if key in TABLES[language].keys():
+        return TABLES[language][key]
+    if (language, key) not in missing:
+        missing.add((language, key))
+        print("No " + language + " translation for \"" + text + "\" - add it to skeleton/translations.py")
+    return text
@@ -11,100 +11,47 @@ from selenium.webdriver.common.by import By
 import datetime
 import re
 import asyncio
+from urllib.parse import urlsplit, parse_qs
 
 import skeleton.soul as soul
+import skeleton.sites as sites
+import skeleton.money as money
+import skeleton.translations as translations
 
-class Msg(soul.BuildListMsg):
-
-    def __init__(self, msg, msgText, sender):
-        super().__init__(msg, msgText, sender)
+#link formats - see sites.Site
+#tweakers.nl and tweakers.net are the same site - we always use .net
+LINK_PATTERNS = [
+    ("list", r"tweakers\.(?:net|nl)/gallery/(?P<gallery>[^/\s]+)/wenslijst/\?wish_id=(?P<id>\d{7})"),
+    ("breakdown", r"tweakers\.(?:net|nl)/pricewatch/bestelkosten/(?P<id>\d{7})"),
+]
 
-    async def findLinks(self, driver):
-        '''
-        Recursively finds all Tweakers network list links in the message and adds them to the list of links
-        Inputs: 
-            - driver: Selenium webdriver object
-        Returns: N/A
-        '''
+#readiness conditions - see soul.Ready
+LIST_READY = [soul.SelectorPresent(".galleryInnerTable")]
 
-        #convert all tweakers.nl links to tweakers.net
-        self.msgText = self.msgText.replace(".nl", ".net")
-
-        #grab all price breakdown links and convert them to regular lists
-        await self.breakdownToLinks(driver)
-
-        #then, grab all the regular links and save them
-        await self.linksToLists(self.msgText)
-        
-        return
-
-    async def breakdownToLinks(self, driver):
-        '''
-        Recursively converts tweakers.nl parts breakdown links in msgText into their regular list links
-        Inputs:
-            - driver: selenium webdriver object
-        Returns: N/A
-        '''
-        # find substring of list link if it exists
-        try:
-            start = self.msgText.index("tweakers.net/pricewatch/bestelkosten/")
-        except Exception:
-            return
-
-        # figure out the actual url by looping over characters until we hit the right length
-        # we do this instead of slicing so we can more easily detect invalid/cut off links
-        link = ""
-        for i in range(start, start + 44):
-            try:
-                link += self.msgText[i] 
-            except Exception:
-                pass
-
-        #load the page into webdriver - we need to navigate to the edit part list button
-        driver.implicitly_wait(5)
-        driver.get("https://" + link)
-        #skip cookie check
-        try:
-            shadowHost = driver.find_element(By.ID, "pg-host-shadow-root")
-            shadowRoot = shadowHost.shadow_root
-            cookieButton = shadowRoot.find_element(By.ID, "pg-accept-btn")
-            cookieButton.click()
-        except Exception:
-            pass
+class Msg(soul.BuildListMsg):
 
-        #wait for page to load, then find the button to view the list and get its href
-        editButton = driver.find_element(By.CLASS_NAME, "ctaButton")
-        listLink = editButton.get_attribute("href")
-            
-        #replace the link in MsgText
-        self.msgText = self.msgText.replace(link, listLink)
-        #recurse
-        await self.breakdownToLinks(driver)
-        return
+    def __init__(self, msg, msgText, sender, scanned=None):
+        super().__init__(msg, msgText, sender, scanned)
 
-    async def linksToLists(self, text):
+    async def findLinks(self, scraper):
         '''
-        Recursively finds tweakers.nl wish list links in message text and adds them to the list of links
-        Inputs:
-            - text: String of text to search through
+        Finds all Tweakers network list links in the message and adds them to the list of links
+        Inputs: 
+            - scraper: scraper for Tweakers, used to resolve price breakdown links
         Returns: N/A
         '''
-        # find substring of list link if it exists
-        try:
-            start = text.index("tweakers.net/gallery")
-            #make sure we go to a saved link and NOT a blank gallery page - assigning this will throw an exception if it fails
-            finish = (text.index("/wenslijst/?wish_id=") + 27)
-        except Exception:
-            return
-
-        #add it to the list
-        link = ("https://" + text[start:finish])
-        self.links.append(link)
-
-        text = text.replace(link[8:], "")
-        await self.linksToLists(text) #recurse on the remaining links in the message
-        return
-
+        for link in await self.scanLinks("tweakers"):
+            listLink = link.url
+            #price breakdown links have to be converted to regular lists
+            #the resolver already hands back the canonical wish list link
+            if link.kind == "breakdown":
+                try:
+                    listLink = await scraper.resolve(resolveBreakdown, link.url)
+                #a breakdown we can't open shouldn't stop us handling the rest of the message
+                except Exception:
+                    continue
+            if listLink not in self.links:
+                self.links.append(listLink)
 
     async def generateLists(self):
         '''
@@ -122,6 +69,10 @@ class List(soul.BuildList):
     def __init__(self, link):
         super().__init__(link)
         self.siteSource = "Tweakers"
+        self.language = "nl"
+        self.locale = "nl"
+        #the page can show several wish lists - we only want the one we were linked to
+        self.regions = ["div#inventory_" + link[-7:]]
 
     async def generateSoup(self, driver):
         '''
@@ -132,121 +83,87 @@ class List(soul.BuildList):
         Returns: N/A
         '''
         # scrape url with selenium and feed to soup for html parsing
-        driver.implicitly_wait(5)
-        driver.get(self.link)
+        await soul.implicitlyWait(driver, 5)
+        await soul.getPage(driver, self.link)
 
         #skip cookie check
         try:
-            shadowHost = driver.find_element(By.ID, "pg-host-shadow-root")
-            shadowRoot = shadowHost.shadow_root
-            cookieButton = shadowRoot.find_element(By.ID, "pg-accept-btn")
-            cookieButton.click()
+            shadowHost = await soul.findElement(driver, By.ID, "pg-host-shadow-root")
+            shadowRoot = await soul.getShadowRoot(shadowHost)
+            cookieButton = await soul.findElement(shadowRoot, By.ID, "pg-accept-btn")
+            await soul.click(cookieButton)
         except Exception:
             pass
         
         #wait for parts to populate
-        try:
-            driver.find_element(By.CLASS_NAME, "galleryInnerTable")
-        except Exception as e:
+        if not await soul.waitReady(driver, LIST_READY, timeout=5):
             print("Couldn't load Tweakers wishlist link in time - no data after 5 seconds")
-        #need to wait to translate list for categories
-        await asyncio.sleep(1)
 
         #finally, feed the whole page into beautifulsoup
-        self.soup = BeautifulSoup(driver.page_source,"html.parser")
+        self.soup = await soul.makeSoup(driver, self.regions)
     
-    async def buildTable(self, sender, message):
+    async def parse(self):
         '''
-        Parses data table from Geizhals network wishlist link into a discord embed
-        Inputs: 
-            sender - author of calling message, type string
-            message - calling discord message object
-        Returns: response message, type discord embed object
+        Reads the wish list table and total out of the soup
+        Inputs: N/A
+        Returns: ListResult object
         '''
+        result = soul.ListResult(self.siteSource, self.link, country="nl")
         #title and parts are onvly visible if list is valid and public
         try:
             #get list title
-            title = self.soup.find("div", id=("inventory_" + self.link[-7:])).find("span", class_="linkHover").get_text()
+            result.title = self.soup.find("div", id=("inventory_" + self.link[-7:])).find("span", class_="linkHover").get_text()
 
             #get matching table, ignoring category headers
             table = self.soup.find("div", id=("inventory_" + self.link[-7:])).find("table", class_="galleryInnerTable").find("tbody")
         except Exception:
-            return (await self.badListEmbed(sender, message))
+            result.valid = False
+            return result
 
         #break table down into rows
         rows = table.find_all("tr")
         #the last row always just contains the total price
         totalRow = rows.pop()
-        #get total cost early, and format accordingly
-        total = totalRow.find("td", class_="price").get_text().strip().replace(",", ".")
-
-        #structure output
-        #initialize giant string of output
-        componentList = ""
-        #these variables are needed for handling lists over the ~3700 character limit
-        tooLong = False
-        overCount = 0
+        #get total cost, and format accordingly
+        result.totals.append(money.normalize(totalRow.find("td", class_="price").get_text(), self.locale))
 
         for row in rows:
             #get part name first
             #this gives us a list of two links - the first one has the name of the part as its text, and the second has the category
             partHeaders = row.find("td", class_="title").find_all("a")
-            partName = partHeaders[0].get_text().strip()
-            partLink = partHeaders[0]["href"].strip()
-            partType = partHeaders[1].get_text().strip()
-            #format this info into hyperlink
-            partName = ("[" + partName + "](" + partLink + ")")
-            partType = "**" + partType + "**"
+            partType = await translations.translate(partHeaders[1].get_text(), self.language)
+            part = soul.Part(partType, partHeaders[0].get_text().strip(), url=partHeaders[0]["href"].strip())
         
             #part quantity is blank if we have one, and filled if we have multiple
             try:
-                quantity = int(row.find("td", class_="amount").find("p").get_text().strip().replace("x", ""))
+                part.quantity = int(row.find("td", class_="amount").find("p").get_text().strip().replace("x", ""))
             except Exception:
-                quantity = 1
+                pass
             try: #get part unit price - this will "no such element" if OOS
                 #there are two of these TDs, both containing the value - to save a list index, we just go with the first
-                partPrice = row.find("td", class_="price").find("a").get_text().strip().replace(",", ".")
-                #if we have multiple of the part, adjust part price in the same way as we did for pcpp
-                if quantity > 1:
-                    unitPrice = re.findall("\d+\.\d+", partPrice)
-                    totalPrice = quantity * (float(unitPrice[0]))
-                    partPrice = partPrice.replace(unitPrice[0], ("%.2f" % totalPrice))
-                    partName = ("**("+ str(quantity) + "x)** " + partName)
-
-                partPrice =  ("``" + partPrice + "``")
-
+                part.unitPrice = row.find("td", class_="price").find("a").get_text().strip()
             except Exception:
-                partPrice = "``N/A``"
-            
+                pass
 
-            #check to make sure we're not over the character limit
-            #do length check here
-            #length 4000 leaves room for the total in the 4096 character limit - Tweakers has minimal footer
-            if (not tooLong) and (len(componentList) > 4000):
-                tooLong = True
-            #we continue to parse the list as normal regardless of its length so we can count the number of remaining parts
-            if tooLong:
-                overCount += 1
-                continue
+            result.parts.append(part)
 
-            #add the part to the string
-            componentList = componentList + partType + " - " + partPrice + " - " + partName + "\n"
+        money.normalizeParts(result.parts, self.locale)
+        return result
     
-        #if we went over the character limit, explain ourselves
-        if tooLong:
-            componentList += ("\n*Sorry, this part list is too long. " + str(overCount) + " part(s) were not shown. Please click the button below to see the full list.*")
-        
-        # structure embed output
-        #abusing header + giant string here because header has a longer character limit than field - this increases the length of the list we can display from 1024 to 4096 characters
-        embed = discord.Embed(title=(self.siteSource + " :flag_nl:\n" + self.link + "\n" + title + "\n"), description=("Sent by " + sender + "\n\n" + componentList), color=0xe836eb)
-        try:
-            embed.add_field(name="Total:", value=("``"+total+"``"), inline=False)
-            embed.timestamp = datetime.datetime.now(datetime.timezone.utc)
-        #failover in the event of a footer of length >96 should be to skip rendering the footer and send the embed anyway
-        except Exception:
-            pass
-        
-        return(embed)
+    async def buildTable(self, sender, message):
+        '''
+        Renders the parsed Tweakers wishlist into a discord embed
+        Inputs: 
+            sender - author of calling message, type string
+            message - calling discord message object
+        Returns: response message, type discord embed object
+        '''
+        result = self.result
+        if not result.valid:
+            return (await self.badListEmbed(sender, message))
+
+        title = self.siteSource + " :flag_nl:\n" + self.link + "\n" + result.title + "\n"
+        return await soul.renderEmbed(title, 0xe836eb, sender, result.parts, [("Total:", "``" + result.totals[0] + "``")])
         
     async def badListEmbed(self, sender, message):
         '''
@@ -265,12 +182,58 @@ class List(soul.BuildList):
         await message.channel.send(file=file, embed=embed)
         raise ValueError("Bad or private Tweakers list detected")
 
+def canonicalLink(kind, groups, text):
+    '''
+    Builds the canonical form of a link matched by LINK_PATTERNS
+    Inputs: see sites.Site
+    Returns: (url, country code)
+    '''
+    if kind == "list":
+        return ("https://tweakers.net/gallery/" + groups["gallery"] + "/wenslijst/?wish_id=" + groups["id"], "nl")
+    return ("https://tweakers.net/pricewatch/bestelkosten/" + groups["id"], "nl")
+
+async def resolveBreakdown(driver, link):
+    '''
+    Loads a price breakdown (bestelkosten) page and reads the link to its wish list
+    Inputs:
+        - driver: selenium webdriver object
+        - link: breakdown link
+    Returns: canonical wish list link as string - raises soul.NotAList if the breakdown doesn't link to one
+    '''
+    #the page sits behind a cookie wall we have to click through
+    if driver is None:
+        raise soul.NeedsBrowser()
+    #load the page into webdriver - we need to navigate to the edit part list button
+    await soul.implicitlyWait(driver, 5)
+    await soul.getPage(driver, link)
+    #skip cookie check
+    try:
+        shadowHost = await soul.findElement(driver, By.ID, "pg-host-shadow-root")
+        shadowRoot = await soul.getShadowRoot(shadowHost)
+        cookieButton = await soul.findElement(shadowRoot, By.ID, "pg-accept-btn")
+        await soul.click(cookieButton)
+    except Exception:
+        pass
+
+    #wait for page to load, then find the button to view the list and get its href
+    editButtons = await soul.findElements(driver, By.CLASS_NAME, "ctaButton")
+    if len(editButtons) == 0:
+        raise soul.NotAList("No wish list found on price breakdown " + link)
+    href = await soul.getAttribute(editButtons[0], "href")
+    #read the gallery and wish list id out of the href ourselves, so extra or reordered query parameters can't hide the list
+    url = urlsplit(href or "")
+    path = [part for part in url.path.split("/") if len(part) > 0]
+    wishIds = parse_qs(url.query).get("wish_id", [])
+    if (len(path) < 3) or (path[0] != "gallery") or (path[2] != "wenslijst") or (len(wishIds) == 0):
+        raise soul.NotAList("No wish list found on price breakdown " + link)
+    return canonicalLink("list", {"gallery": path[1], "id": wishIds[0]}, href)[0]
+
 async def startWebDriver():
     '''
     Initializes a Chrome Webdriver instance and returns it
     Inputs: N/A
     Returns: Selenium Webdriver object
-    This function should be called once for every message we handle
+    Called by driverPool whenever it needs a new instance - use driverPool.checkout() instead of calling this directly
     '''
     # initialize selenium chrome webdriver with necessary settings
     #custom user agent prevents rate limiting by emulating a real desktop user
@@ -278,18 +241,33 @@ async def startWebDriver():
     #pick a random user agent for each driver instance, helps to avoid rate limiting
     useragents = await soul.getUserAgents()
     options.add_argument("--user-agent="+choice(useragents))
-    #for tweakers, we need to enable automatic translation from dutch
-    prefs = {
-        "translate_whitelists": {"nl":"en"},
-        "translate":{"enabled":"true"}
-    }
-    options.add_experimental_option("prefs", prefs)
-
     #driver = uc.Chrome(options=options, version_main=134)
-    driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver = await soul.runBlocking(webdriver.Chrome, options=options)
+    await soul.runScript(driver, "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+    await soul.runBlocking(stealth, driver,
+        languages=["en-UK", "en"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+        )
+
+    return driver
 
-    stealth(driver,
+async def setupContext(driver):
+    '''
+    Prepares a fresh tab for a job when this site shares one browser between jobs
+    Inputs:
+        - driver: selenium webdriver object, switched to the new tab
+    Returns: N/A
+    Browser-wide prefs come from startWebDriver - this only applies what can be set per tab
+    '''
+    #rotate the user agent per job, as we would per driver
+    useragents = await soul.getUserAgents()
+    await soul.runBlocking(stealth, driver,
+        user_agent=choice(useragents),
         languages=["en-UK", "en"],
         vendor="Google Inc.",
         platform="Win32",
@@ -298,4 +276,11 @@ async def startWebDriver():
         fix_hairline=True,
         )
 
-    return driver
\ No newline at end of file
+#images, fonts and trackers are never read - the cookie wall is served by tweakers itself, so it's unaffected
+blockProfile = soul.BlockProfile(resourceTypes=["image", "font", "media"])
+
+#warm drivers for this site, shared by every message we handle
+driverPool = soul.SitePool(startWebDriver, "Tweakers", setupContext, blockProfile=blockProfile)
+
+#how messages find their way to this site - see sites.Site
+site = sites.register(sites.Site("tweakers", Msg, LINK_PATTERNS, canonicalLink, ["tweakers.n"], driverPool, concurrency=2, rate=12, cacheTtl=10 * 60, flags=["resolve"]))
@@ -0,0 +1,422 @@
+'''
+Withers Skeleton Workers
+Runs scraping in separate worker processes, so a hung page or a leaked browser can't take the gateway connection down with it.
+Each worker owns its own driver pools and browsers. The bot process only routes jobs to the workers and renders what comes back.
+'''
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import signal
+import threading
+import time
+
+import skeleton.soul as soul
+import skeleton.sites as sites
+
+class WorkerError(Exception):
+    '''
+    Raised in the bot process when a job fails inside a worker, or the worker running it dies
+    '''
+    pass
+
+#errors that keep their type when a job sends them back - the caches treat soul.NotAList differently from a failed load, see cache.ResolutionCache
+#anything else comes back as a WorkerError
+REMOTE_ERRORS = {"NotAList": soul.NotAList}
+
+async def describeError(error):
+    '''
+    Turns an exception raised by a job into something that can be sent back over a pipe
+    Inputs:
+        - error: the exception
+    Returns: (type name, message) - subclasses of the REMOTE_ERRORS types are sent as the type itself
+    '''
+    for name in REMOTE_ERRORS.keys():
+        if isinstance(error, REMOTE_ERRORS[name]):
+            return (name, str(error))
+    return (type(error).__name__, str(error))
+
+def remoteError(payload):
+    '''
+    Rebuilds the exception for an error sent back by describeError()
+    Inputs:
+        - payload: (type name, message)
+    Returns: exception object to raise in the caller
+    Not async as it's used by the dispatch callbacks, which run straight on the event loop
+    '''
+    name, message = payload
+    if name in REMOTE_ERRORS.keys():
+        return REMOTE_ERRORS[name](message)
+    return WorkerError(name + ": " + message)
+
+class WorkerPool:
+    '''
+    Starts and supervises the scraper worker processes, and hands jobs out to them
+    Values:
+        - size: number of worker processes
+        - extended: whether extended modules (e.g. PCPT) are enabled, so workers can prelaunch their drivers
+        - jobTimeout: seconds a job may run inside a worker before that worker is considered hung and restarted
+        - workers: [process, connection] for each worker slot, indexed by worker number
+        - sendLocks: lock for each worker slot, since jobs are written to its pipe from the thread pool and a pipe can only be written by one thread at a time
+        - inflight: maps job id to [future, worker number, start time or None if not started yet]
+        - restarts: number of times a dead or hung worker has been replaced
+    Each worker gets its own pipe rather than sharing one queue, so killing a stuck worker can never corrupt the queue the others read from.
+    '''
+    def __init__(self, size, extended=False, jobTimeout=120):
+        self.size = size
+        self.extended = extended
+        self.jobTimeout = jobTimeout
+        #chrome and a forked event loop don't mix, so always start workers from a clean interpreter
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [None] * size
+        self.sendLocks = [threading.Lock() for index in range(size)]
+        self.inflight = {}
+        self.jobIds = itertools.count()
+        self.restarts = 0
+        self.loop = None
+        self.running = False
+        self.monitorTask = None
+
+    async def start(self):
+        '''
+        Launches every worker and starts watching them - safe to call more than once
+        Inputs: N/A
+        Returns: N/A
+        '''
+        if self.running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.running = True
+        for index in range(self.size):
+            await self.spawn(index)
+        threading.Thread(target=self.readResults, name="withers-worker-results", daemon=True).start()
+        self.monitorTask = asyncio.create_task(self.monitor())
+
+    async def submit(self, site, kind, *args):
+        '''
+        Sends a job to the least busy worker and waits for its result
+        Inputs:
+            - site: name of the site module, e.g. "pcpp"
+            - kind: "list" to load a list, or "resolve" to run a link resolver
+            - args: job arguments - the link for "list", the resolver name followed by its arguments for "resolve"
+        Returns: the job's result
+        Raises soul.NotAList if a resolver found no list behind the link, or WorkerError if the job fails otherwise, or its worker dies or hangs before finishing.
+        '''
+        if not self.running:
+            raise WorkerError("Scraper workers are not running")
+        busy = [0] * self.size
+        for job in self.inflight.values():
+            busy[job[1]] += 1
+        index = busy.index(min(busy))
+
+        jobId = next(self.jobIds)
+        future = self.loop.create_future()
+        self.inflight[jobId] = [future, index, None]
+        conn = self.workers[index][1]
+        def send():
+            with self.sendLocks[index]:
+                conn.send((jobId, site, kind, args))
+        try:
+            #a full pipe (a big job, or a worker that stopped reading) blocks the write, so keep it off the event loop
+            await soul.runBlocking(send)
+        except Exception as error:
+            self.inflight.pop(jobId, None)
+            raise WorkerError("Couldn't reach scraper worker " + str(index) + ": " + str(error))
+        return await future
+
+    async def spawn(self, index):
+        '''
+        Starts a new worker process in the given slot
+        Inputs:
+            - index: worker number
+        Returns: N/A
+        '''
+        parentConn, childConn = self.context.Pipe()
+        process = self.context.Process(target=workerMain, args=(index, childConn, self.extended), name=("withers-worker-" + str(index)), daemon=True)
+        await soul.runBlocking(process.start)
+        #the child has its own copy of this end now
+        childConn.close()
+        self.workers[index] = [process, parentConn]
+
+    async def kill(self, index):
+        '''
+        Kills a worker along with every browser and chromedriver it started
+        Inputs:
+            - index: worker number
+        Returns: N/A
+        '''
+        process, conn = self.workers[index]
+        try:
+            #workers lead their own process group, so this takes chrome down with them
+            os.killpg(process.pid, signal.SIGKILL)
+        except Exception:
+            process.kill()
+        await soul.runBlocking(process.join, 5)
+        conn.close()
+
+    async def failJobs(self, index, reason):
+        '''
+        Fails every job that was sent to a worker which is being replaced
+        Inputs:
+            - index: worker number
+            - reason: error message for the waiting callers
+        Returns: N/A
+        '''
+        for jobId in list(self.inflight.keys()):
+            future, worker, started = self.inflight[jobId]
+            if worker != index:
+                continue
+            self.inflight.pop(jobId)
+            if not future.done():
+                future.set_exception(WorkerError(reason))
+
+    async def monitor(self):
+        '''
+        Checks on the workers every second, replacing any that have died or hung on a job
+        Inputs: N/A
+        Returns: N/A
+        '''
+        while self.running:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for index in range(self.size):
+                process = self.workers[index][0]
+                hung = False
+                for future, worker, started in self.inflight.values():
+                    if (worker == index) and (started is not None) and ((now - started) > self.jobTimeout):
+                        hung = True
+                if process.is_alive() and not hung:
+                    continue
+                if hung:
+                    reason = "Scraper worker " + str(index) + " took longer than " + str(self.jobTimeout) + " seconds on a job"
+                else:
+                    reason = "Scraper worker " + str(index) + " exited with code " + str(process.exitcode)
+                print(reason + ", restarting it")
+                await self.kill(index)
+                await self.failJobs(index, reason)
+                self.restarts += 1
+                try:
+                    await self.spawn(index)
+                except Exception as error:
+                    print("Couldn't restart scraper worker " + str(index) + ": " + str(error))
+
+    def readResults(self):
+        '''
+        Reads results from every worker pipe and hands them to the event loop
+        Inputs: N/A
+        Returns: N/A
+        Not async as this runs on its own thread, blocked on the worker pipes
+        '''
+        dead = set()
+        while self.running:
+            conns = {}
+            for index in range(self.size):
+                slot = self.workers[index]
+                if (slot is not None) and (slot[1] not in dead):
+                    conns[slot[1]] = index
+            try:
+                ready = wait(list(conns.keys()), timeout=0.5)
+            except Exception: #a pipe was closed under us by a restart - just rebuild the list
+                continue
+            for conn in ready:
+                try:
+                    message = conn.recv()
+                except Exception: #worker is gone, the monitor will replace it
+                    dead.add(conn)
+                    continue
+                self.loop.call_soon_threadsafe(self.dispatch, message)
+
+    def dispatch(self, message):
+        '''
+        Applies a message from a worker to the job it belongs to
+        Inputs:
+            - message: tuple of (type, job id, payload) where type is "start", "done" or "error" - an error's payload is describeError() output
+        Returns: N/A
+        Not async as it's scheduled straight onto the event loop by readResults
+        '''
+        kind, jobId, payload = message
+        job = self.inflight.get(jobId)
+        #jobs from a worker we already gave up on
+        if job is None:
+            return
+        if kind == "start":
+            job[2] = time.monotonic()
+            return
+        self.inflight.pop(jobId)
+        if job[0].done():
+            return
+        if kind == "done":
+            job[0].set_result(payload)
+        else:
+            job[0].set_exception(remoteError(payload))
+
+    async def close(self):
+        '''
+        Asks every worker to shut down cleanly, killing any that don't
+        Inputs: N/A
+        Returns: N/A
+        '''
+        if not self.running:
+            return
+        self.running = False
+        if self.monitorTask is not None:
+            self.monitorTask.cancel()
+        for index in range(self.size):
+            process, conn = self.workers[index]
+            try:
+                conn.send(None)
+            except Exception:
+                pass
+            await soul.runBlocking(process.join, 10)
+            if process.is_alive():
+                await self.kill(index)
+            await self.failJobs(index, "Scraper workers are shutting down")
+
+class RemoteScraper:
+    '''
+    Stand-in for soul.LocalScraper that runs a site's page loads on the worker processes
+    Values:
+        - workerPool: running WorkerPool - or a shards.HubClient, which takes the same jobs
+        - site: name of the site module, e.g. "pcpp"
+        - scheduled: whether jobs wait for the site's slot and rate token in soul.scheduler first
+    '''
+    def __init__(self, workerPool, site, scheduled=True):
+        '''
+        Inputs:
+            - workerPool, site: as in Values
+            - scheduled: False if whatever runs the jobs schedules them itself, e.g. the scraper hub serving shard groups
+        '''
+        self.workerPool = workerPool
+        self.site = site
+        self.scheduled = scheduled
+
+    async def submit(self, kind, *args):
+        '''
+        Sends a job to the workers, waiting for the site's scheduler first if this scraper is scheduled
+        '''
+        if self.scheduled:
+            return await soul.scheduler.run(self.site, self.workerPool.submit, self.site, kind, *args)
+        return await self.workerPool.submit(self.site, kind, *args)
+
+    async def loadList(self, buildList):
+        '''
+        Loads and parses the list in a worker, and copies the result back onto it
+        Inputs:
+            - buildList: BuildList child object
+        Returns: N/A, but the list's result is filled in - its soup stays in the worker
+        '''
+        #jobs are scheduled here rather than in the workers, so the site's limits hold across all of them
+        result = await self.submit("list", buildList.link)
+        buildList.result = soul.ListResult.fromDict(result)
+
+    async def resolve(self, resolver, *args):
+        '''
+        Runs a module-level link resolver in a worker
+        Inputs:
+            - resolver: resolver function - only its name is sent, the worker looks it up in its own copy of the site module
+            - args: passed through to the resolver
+        Returns: whatever the resolver returns
+        '''
+        return await self.submit("resolve", resolver.__name__, *args)
+
+def workerMain(index, conn, extended):
+    '''
+    Entry point of a scraper worker process
+    Inputs:
+        - index: worker number, for logging
+        - conn: pipe to the bot process
+        - extended: whether extended modules are enabled
+    Returns: N/A
+    Not async as this is the process entry point - it starts the worker's own event loop
+    '''
+    #lead a new process group so the bot can kill us together with our browsers
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    soul.loadPoolSettings()
+    try:
+        soul.updateUserAgents()
+    except Exception as error: #fall back to the built-in agents rather than dying
+        print(error)
+    asyncio.run(serveJobs(index, conn, extended))
+
+async def serveJobs(index, conn, extended):
+    '''
+    Main loop of a worker - runs each job it's sent as its own task until told to stop
+    Inputs:
+        - index: worker number
+        - conn: pipe to the bot process
+        - extended: whether extended modules are enabled
+    Returns: N/A
+    '''
+    loop = asyncio.get_running_loop()
+    jobs = asyncio.Queue()
+    sendLock = threading.Lock()
+
+    #pipe reads block, so they get their own thread feeding the job queue
+    def readJobs():
+        while True:
+            try:
+                job = conn.recv()
+            except Exception: #the bot process is gone, stop
+                job = None
+            loop.call_soon_threadsafe(jobs.put_nowait, job)
+            if job is None:
+                return
+    threading.Thread(target=readJobs, name="withers-worker-jobs", daemon=True).start()
+
+    pools = [site.driverPool for site in sites.getSites(extended)]
+    await asyncio.gather(*[pool.warm() for pool in pools])
+    print("Scraper worker " + str(index) + " is ready")
+
+    tasks = set()
+    while True:
+        job = await jobs.get()
+        if job is None:
+            break
+        task = asyncio.create_task(runJob(conn, sendLock, job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for pool in pools:
+        await pool.close()
+
+async def runJob(conn, sendLock, job):
+    '''
+    Runs a single job on this worker's driver pools and sends the result back
+    Inputs:
+        - conn: pipe to the bot process
+        - sendLock: lock shared by every job, since a pipe can only be written by one thread at a time
+        - job: tuple of (job id, site, kind, args) as sent by WorkerPool.submit
+    Returns: N/A
+    '''
+    jobId, site, kind, args = job
+    await sendMessage(conn, sendLock, ("start", jobId, None))
+    try:
+        module = importlib.import_module("skeleton." + site)
+        #the bot process already waited for the site's scheduler before sending us the job
+        scraper = soul.LocalScraper(module.driverPool, site, scheduled=False)
+        if kind == "list":
+            buildList = module.List(args[0])
+            await scraper.loadList(buildList)
+            result = ("done", jobId, (await buildList.getResult()).toDict())
+        elif kind == "resolve":
+            result = ("done", jobId, await scraper.resolve(getattr(module, args[0]), *args[1:]))
+        else:
+            raise ValueError("Unknown job type " + str(kind))
+    except Exception as error:
+        result = ("error", jobId, await describeError(error))
+    await sendMessage(conn, sendLock, result)
+
+async def sendMessage(conn, sendLock, message):
+    '''
+    Writes a message to the bot process without blocking this worker's event loop
+    '''
+    def send():
+        with sendLock:
+            conn.send(message)
+    try:
+        await soul.runBlocking(send)
+    except Exception as error: #bot process is gone - the job reader will shut us down
+        print(error)
@@ -0,0 +1,72 @@
+'''
+Tests for skeleton.money - prices read the way each site writes them, and written back the way the bot shows them
+'''
+from decimal import Decimal
+import pytest
+
+from skeleton import money
+
+AMOUNTS = [Decimal("0.99"), Decimal("5.00"), Decimal("12.50"), Decimal("999.99"), Decimal("1000.00"), Decimal("1234.56"), Decimal("56789.10"), Decimal("1234567.89")]
+
+@pytest.mark.parametrize("locale", sorted(money.LOCALES.keys()))
+@pytest.mark.parametrize("amount", AMOUNTS)
+def testRoundTrip(locale, amount):
+    #anything written in a locale's own format reads back as the same amount, with or without a symbol around it
+    number = money.Money(amount).format(money.LOCALES[locale])
+    for text in [number, "€ " + number, number + " kr"]:
+        price = money.parse(text, locale)
+        assert price.amount == amount
+        assert price.places == 2
+
+@pytest.mark.parametrize("text, locale, amount", [
+    #a lone separator with 3 digits after it goes by the locale
+    ("$1,234", "en", Decimal("1234")),
+    ("1.234 €", "de", Decimal("1234")),
+    ("1.299 kr", "da", Decimal("1299")),
+    ("1.234", "en", Decimal("1.234")),
+    #one that isn't followed by 3 digits can only be a decimal separator
+    ("234,56 €", "de", Decimal("234.56")),
+    ("234,56 €", "en", Decimal("234.56")),
+    ("12.5", "de", Decimal("12.5")),
+    #one after spaces or apostrophes grouping thousands is the decimal separator too
+    ("CHF 1'234.50", "de", Decimal("1234.50")),
+    ("CHF 1'234.50", "en", Decimal("1234.50")),
+    ("CHF 1’234.50", "de", Decimal("1234.50")),
+    ("1 234,560 kr", "en", Decimal("1234.560")),
+    ("1 234 kr", "sv", Decimal("1234")),
+    #both kinds - whichever comes last is the decimal separator
+    ("1.234,56 €", "en", Decimal("1234.56")),
+    ("$1,234.56", "de", Decimal("1234.56")),
+    #the same separator more than once only groups thousands
+    ("1.234.567 kr", "en", Decimal("1234567")),
+    ("1,234,567", "de", Decimal("1234567")),
+])
+def testSeparators(text, locale, amount):
+    assert money.parse(text, locale).amount == amount
+
+@pytest.mark.parametrize("text, locale, currency", [
+    ("€ 1.234,56", "nl", "EUR"),
+    ("R$ 1.234,56", "pt", "BRL"),
+    ("1 234,56 zł", "pl", "PLN"),
+    ("CHF 1'234.50", "de", "CHF"),
+    ("Rs. 45,999", "en", "INR"),
+])
+def testCurrency(text, locale, currency):
+    assert money.parse(text, locale).currency == currency
+
+def testNormalize():
+    assert money.normalize("€ 1.234,56", "nl") == "€ 1234.56"
+    assert money.normalize("1 299,00 kr", "sv") == "1299.00 kr"
+    assert money.normalize("No prices available") == "No prices available"
+    assert money.normalize(None) is None
+
+def testParseAll():
+    #parseAll matches a whole list in one go, so it has to agree with parse() line by line
+    texts = ["1.299 kr", None, "234,56 €", "", "CHF 1'234.50"]
+    prices = money.parseAll(texts, "de")
+    assert [None if price is None else price.amount for price in prices] == [Decimal("1299"), None, Decimal("234.56"), None, Decimal("1234.50")]
+
+def testTotal():
+    prices = [money.parse("€ 10.50"), money.parse("$5"), money.parse("€ 2.25")]
+    totals = money.total(prices, [2, 3, 1])
+    assert [(price.currency, price.amount) for price in totals] == [("EUR", Decimal("23.25")), ("USD", Decimal("15"))]
@@ -22,15 +22,18 @@ import discord
 INTENTS = discord.Intents.default()
 INTENTS.message_content = True
 import os
+import asyncio
 from dotenv import load_dotenv
 import sys
 
 from skeleton import *
 
-def runBot():
+def runBot(shardIds=None, shardCount=None, hub=None):
     '''
     Initializes the bot and checks for new messages in all connected channels.
-    Inputs: N/A
+    Inputs:
+        - shardIds, shardCount: gateway shards to run, when this process is a shard group started by shards.runShardGroups() - None otherwise
+        - hub: (address, authkey) of the scraper hub serving the shard groups, likewise - None to scrape in this process
     Returns: N/A
     '''
     # get discord token from .env file for security purposes
@@ -44,13 +47,52 @@ def runBot():
 
     #update user agents
     soul.updateUserAgents()
+    #load webdriver pool sizes from .env if set
+    soul.loadPoolSettings()
+    cache.loadCacheSettings()
+    store.loadStoreSettings()
+    shards.loadShardSettings()
+    #messages with links are queued and handled by a fixed number of runners, so a flood of links can't start unbounded work
+    jobs.loadJobSettings()
+    jobQueue = jobs.JobQueue()
+    #the enabled sites are fixed at startup, so the router only has to be built once
+    extended = ("--use-extended-modules" in sys.argv)
+    router = sites.Router(extended)
+    #optionally move all scraping into separate worker processes
+    try:
+        workerCount = int(os.getenv("SCRAPER_WORKERS"))
+    except Exception:
+        workerCount = 0
+
+    #with shard groups, this process only hosts the scrapers and caches every group shares - the groups run this function again in their own processes
+    if (hub is None) and (shardIds is None) and (shards.SHARD_SETTINGS["processes"] > 0):
+        shards.runShardGroups(runBot, extended, workerCount)
+        return
+
+    if hub is None:
+        scrapers = shards.Scrapers(extended, workerCount)
+        getScraper = scrapers.getScraper
+    else:
+        #a shard group sends every page load to the hub, which caches and schedules them for all groups at once
+        hubClient = shards.HubClient(*hub)
+        async def getScraper(site):
+            '''
+            Picks the scraper for a site - the hub in the launching process, which has the caches and browsers
+            '''
+            return workers.RemoteScraper(hubClient, site.name, scheduled=False)
 
     #initialize a new client instance with the necessary intents - we need the import message content intent for parsing
-    client = discord.Client(intents=INTENTS)
+    #sharded bots get an AutoShardedClient, running every shard or just this group's
+    clientClass, clientOptions = shards.getClientOptions(shardIds, shardCount)
+    client = clientClass(intents=INTENTS, **clientOptions)
     
     # print to console when we are live, then begin processing messages
     @client.event
     async def on_ready():
+        #restore the caches and prelaunch drivers, the first time we're ready - shard groups leave this to the hub
+        if hub is None:
+            await scrapers.start()
+        await jobQueue.start()
         print({client.user}, 'is live')
  
     @client.event
@@ -59,43 +101,23 @@ def runBot():
         if message.author == client.user:
             return
         
-        # look for relevant part list link in message contents, then process it
-        #PCPP
-        if ("pcpartpicker.com/list" in message.content) or ("pcpartpicker.com/b/" in message.content) or ("pcpartpicker.com/user/" in message.content):
-            rqMsg = pcpp.Msg(message, message.content, str(message.author.mention))
-            #start webdriver instance for this message
-            driver = await pcpp.startWebDriver()
-            await processMessage(message, rqMsg, driver)
-        #PCPT
-        if ("pcpricetracker.in/b/s/" in message.content) and ("--use-extended-modules" in sys.argv):
-            driver = await pcpt.startWebDriver()
-            rqMsg = pcpt.Msg(message, message.content, str(message.author.mention))
-            await processMessage(message, rqMsg, driver)
-        #Geizhals Network
-        if ("geizhals.de/wishlists/" in message.content) or ("geizhals.at/wishlists/" in message.content) or ("geizhals.eu/wishlists/" in message.content) or ("skinflint.co.uk/wishlists/" in message.content) or ("cenowarka.pl/wishlists/" in message.content):
-            driver = await geizhals.startWebDriver()
-            rqMsg = geizhals.Msg(message, message.content, str(message.author.mention))
-            await processMessage(message, rqMsg, driver)
-        #Tweakers
-        if ("tweakers.nl/gallery" in message.content) or ("tweakers.net/gallery" in message.content) or ("tweakers.net/pricewatch/bestelkosten" in message.content) or ("tweakers.nl/pricewatch/bestelkosten" in message.content):
-            driver = await tweakers.startWebDriver()
-            rqMsg = tweakers.Msg(message, message.content, str(message.author.mention))
-            await processMessage(message, rqMsg, driver)
-        #BAPCGG
-        if (("buildapc.gg" in message.content) or ("komponentkoll.se" in message.content)) and (("/build/" in message.content) or ("/bygg/" in message.content)):
-            driver = await bapcgg.startWebDriver()
-            rqMsg = bapcgg.Msg(message, message.content, str(message.author.mention))
-            await processMessage(message, rqMsg, driver)
-        #meupc
-        if ("meupc.net/build/" in message.content):
-            rqMsg = meupc.Msg(message, message.content, str(message.author.mention))
-            driver = await meupc.startWebDriver()
-            await processMessage(message, rqMsg, driver)
-        #hinta
-        if ("hinta.fi/ostoskori" in message.content):
-            rqMsg = hinta.Msg(message, message.content, str(message.author.mention))
-            driver = await hinta.startWebDriver()
-            await processMessage(message, rqMsg, driver)
+        # look for relevant part list links in message contents - one pass over the message finds every site's links, then each site handles its own
+        routed = router.route(message.content)
+        if len(routed) > 0:
+            async def handleSite(siteLinks):
+                site, found = siteLinks
+                rqMsg = site.msgClass(message, message.content, str(message.author.mention), found)
+                await processMessage(message, rqMsg, await getScraper(site))
+            async def work():
+                #every site's lists are handled at once - their page loads still wait on each site's own limits in soul.scheduler
+                async for (site, found), handled, error in jobs.fanOut(routed, handleSite, len(routed)):
+                    #one site failing shouldn't take the other sites' replies with it
+                    if error is not None:
+                        print(site.name + ": " + str(error))
+            async def shed():
+                await jobs.reactBusy(message)
+            #the scraping happens on the job queue's runners, which caps how much we take on at once - if it's full, the message is shed
+            await jobQueue.submit(jobs.Job(await jobs.getPriority(message), work, shed))
 
         # if this is a DM, forward it to the support channel
         if ((isinstance(message.channel, discord.DMChannel)) and (DM_CHANNEL is not None)):
@@ -106,34 +128,35 @@ def runBot():
             return
     client.run(TOKEN)
 
-async def processMessage(message, rqMsg, driver):
+async def processMessage(message, rqMsg, scraper):
     '''
     Takes user message and handles it, outputting a response message from the bot
     Inputs: 
         - message: discord message object we're using
         - rqMsg: BuildListMessage child object containing the necessary lists
-        - driver: customized selenium webdriver object to match the site we need
+        - scraper: cache.CachedScraper for the site we need - all page loads go through it, unless the caches already have the answer
     Returns: N/A
     '''
     try:
         #first, find all the links
-        await rqMsg.findLinks(driver)
+        await rqMsg.findLinks(scraper)
         #handle a message for each link in the list
         lists = await rqMsg.generateLists()
         if len(lists) == 0:
             pass
         else:
-            for buildList in lists:
-                #scrape this link
-                await buildList.generateSoup(driver)
+            #scrape every link at once (or reuse the parsed list if it was posted recently), replying in the order they were posted as each is ready
+            async for buildList, loaded, error in jobs.fanOut(lists, scraper.loadList, jobs.JOB_SETTINGS["listsPerMessage"]):
+                #a list that failed to load shouldn't cost the others their replies
+                if error is not None:
+                    print(error)
+                    continue
                 #embed the results and add a View to store the button(s).
                 #in the event of a bad list, we need to send the embed immediately - easiest solution is to give buildtable the message and then raise an exception
                 try:
                     await message.channel.send(embed=(await buildList.buildTable(await rqMsg.getSender(), message)), view=soul.Buttons(await buildList.getSoup(), await buildList.getLink(), await buildList.getButtons()))
                 except ValueError:
                     pass
-        
-        driver.quit()
     #any exception encountered while parsing the list should result in the bot refusing to reply and continuing to look for new messages
     except Exception as error:
         print(error)